@@ -0,0 +1,80 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+
+Measures the commit rate of token updates in a GM database using different
+SQLite profiles. Run from the repository's root:
+
+    python -m scripts.sqlite_benchmark [NUM_COMMITS]
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+import pathlib
+import random
+import sys
+import tempfile
+import time
+import types
+
+from vtt import orm
+
+
+PROFILES = {
+    'sqlite defaults': dict(),
+    # same as the engine's defaults (see VTT_SQLITE_* environment variables)
+    'vtt defaults': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -8 * 1024,
+        'busy_timeout': 5000
+    },
+    'wal, no sync': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF'
+    }
+}
+
+NUM_TOKENS = 200
+
+
+def run(profile: dict, root: pathlib.Path, num_commits: int) -> float:
+    """ Return the number of commits per second, each moving a single token
+    like a player dragging it.
+    """
+    # @NOTE: the database only needs the engine's SQLite profile
+    db = orm.create_gm_database(types.SimpleNamespace(sqlite=profile), str(root / 'gm.db'))
+    with orm.db_session:
+        game = db.Game(url='bench', gm_url='bench')
+        scene = db.Scene(game=game)
+        tokens = [db.Token(scene=scene, url='/static/token.png', posx=0, posy=0, size=64)
+                  for _ in range(NUM_TOKENS)]
+        db.flush()
+        token_ids = [token.id for token in tokens]
+
+    start = time.perf_counter()
+    for i in range(num_commits):
+        with orm.db_session:
+            token = db.Token[random.choice(token_ids)]
+            token.update(timeid=float(i), pos=(random.randrange(orm.MAX_SCENE_WIDTH),
+                                               random.randrange(orm.MAX_SCENE_HEIGHT)))
+    elapsed = time.perf_counter() - start
+
+    db.disconnect()
+    return num_commits / elapsed
+
+
+def main(num_commits: int) -> None:
+    print(f'{num_commits} commits of token updates')
+    for name, profile in PROFILES.items():
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rate = run(profile, pathlib.Path(tmpdir), num_commits)
+        print(f'{name:>16}: {rate:10.1f} commits/s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
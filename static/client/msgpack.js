@@ -0,0 +1,161 @@
+/**
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+*/
+
+var msgpack_text_decoder = new TextDecoder('utf-8');
+
+/// Decode a MessagePack encoded ArrayBuffer (ext types are not supported)
+function decodeMessagePack(buffer) {
+    var view = new DataView(buffer);
+    var bytes = new Uint8Array(buffer);
+    var offset = 0;
+
+    function readString(length) {
+        var s = msgpack_text_decoder.decode(bytes.subarray(offset, offset + length));
+        offset += length;
+        return s;
+    }
+
+    function readBinary(length) {
+        var b = bytes.slice(offset, offset + length);
+        offset += length;
+        return b;
+    }
+
+    function readArray(length) {
+        var array = new Array(length);
+        for (var i = 0; i < length; ++i) {
+            array[i] = readValue();
+        }
+        return array;
+    }
+
+    function readMap(length) {
+        var map = {};
+        for (var i = 0; i < length; ++i) {
+            var key = readValue();
+            map[key] = readValue();
+        }
+        return map;
+    }
+
+    function readValue() {
+        var type = view.getUint8(offset);
+        offset += 1;
+        var value;
+
+        if (type <= 0x7f) {
+            // positive fixint
+            return type;
+        }
+        if (type >= 0xe0) {
+            // negative fixint
+            return type - 0x100;
+        }
+        if ((type & 0xf0) == 0x80) {
+            return readMap(type & 0x0f);
+        }
+        if ((type & 0xf0) == 0x90) {
+            return readArray(type & 0x0f);
+        }
+        if ((type & 0xe0) == 0xa0) {
+            return readString(type & 0x1f);
+        }
+
+        switch (type) {
+            case 0xc0:
+                return null;
+            case 0xc2:
+                return false;
+            case 0xc3:
+                return true;
+            case 0xc4:
+                value = view.getUint8(offset);
+                offset += 1;
+                return readBinary(value);
+            case 0xc5:
+                value = view.getUint16(offset);
+                offset += 2;
+                return readBinary(value);
+            case 0xc6:
+                value = view.getUint32(offset);
+                offset += 4;
+                return readBinary(value);
+            case 0xca:
+                value = view.getFloat32(offset);
+                offset += 4;
+                return value;
+            case 0xcb:
+                value = view.getFloat64(offset);
+                offset += 8;
+                return value;
+            case 0xcc:
+                value = view.getUint8(offset);
+                offset += 1;
+                return value;
+            case 0xcd:
+                value = view.getUint16(offset);
+                offset += 2;
+                return value;
+            case 0xce:
+                value = view.getUint32(offset);
+                offset += 4;
+                return value;
+            case 0xcf:
+                value = Number(view.getBigUint64(offset));
+                offset += 8;
+                return value;
+            case 0xd0:
+                value = view.getInt8(offset);
+                offset += 1;
+                return value;
+            case 0xd1:
+                value = view.getInt16(offset);
+                offset += 2;
+                return value;
+            case 0xd2:
+                value = view.getInt32(offset);
+                offset += 4;
+                return value;
+            case 0xd3:
+                value = Number(view.getBigInt64(offset));
+                offset += 8;
+                return value;
+            case 0xd9:
+                value = view.getUint8(offset);
+                offset += 1;
+                return readString(value);
+            case 0xda:
+                value = view.getUint16(offset);
+                offset += 2;
+                return readString(value);
+            case 0xdb:
+                value = view.getUint32(offset);
+                offset += 4;
+                return readString(value);
+            case 0xdc:
+                value = view.getUint16(offset);
+                offset += 2;
+                return readArray(value);
+            case 0xdd:
+                value = view.getUint32(offset);
+                offset += 4;
+                return readArray(value);
+            case 0xde:
+                value = view.getUint16(offset);
+                offset += 2;
+                return readMap(value);
+            case 0xdf:
+                value = view.getUint32(offset);
+                offset += 4;
+                return readMap(value);
+        }
+
+        throw new Error('Unsupported MessagePack type 0x' + type.toString(16));
+    }
+
+    return readValue();
+}
@@ -85,6 +85,7 @@ var canvas_ratio = null;  // aspect ratio
 // --- image handling implementation ----------------------------------
 
 var images = [];
+var image_variants = {}; // url => size of loaded variant (0 for original image)
 var canvas_scale = 1.0; // saved scaling
 
 function resizeCanvas() {
@@ -310,6 +311,7 @@ function Token(id, url) {
     this.color = null;
     this.label_canvas = null;
     this.hue_canvas = null;
+    this.version = null;
 }
 
 /// Add token with id and url to the scene
@@ -403,6 +405,9 @@ function updateToken(data, force=false) {
     }
     tokens[data.id].text     = data.text;
     tokens[data.id].color    = data.color;
+    if (data.version != null) {
+        tokens[data.id].version = data.version;
+    }
     
     if (data.zorder < min_z) {
         min_z = data.zorder;
@@ -466,15 +471,46 @@ function notifyDownload(url) {
     }
 }
 
-/// Start loading image into cache
-function loadImage(url) {
+/// Return the smallest image variant covering the size on screen (0 for the original image)
+function getVariantSize(url, size) {
+    if (size < 0 || !url.startsWith('/asset/') || !url.endsWith('.png')) {
+        return 0;
+    }
+    for (var i = 0; i < IMAGE_VARIANTS.length; ++i) {
+        if (size <= IMAGE_VARIANTS[i]) {
+            return IMAGE_VARIANTS[i];
+        }
+    }
+    return 0;
+}
+
+function getVariantUrl(url, variant) {
+    if (variant == 0) {
+        return url;
+    }
+    return url + '?size=' + variant;
+}
+
+/// Start loading image into cache, using the variant matching the size on screen (-1 for the original image).
+/// A larger variant replaces the cached image once it was loaded.
+function loadImage(url, size=1) {
+    var variant = getVariantSize(url, size);
     if (images[url] == null) {
         if (!quiet) {
             console.info('Loading image ' + url);
         }
         images[url] = new Image();
+        image_variants[url] = variant;
         notifyDownload(url);
-        images[url].src = url;
+        images[url].src = getVariantUrl(url, variant);
+
+    } else if (image_variants[url] != 0 && (variant == 0 || variant > image_variants[url])) {
+        var img = new Image();
+        image_variants[url] = variant;
+        img.onload = function() {
+            images[url] = img;
+        };
+        img.src = getVariantUrl(url, variant);
     }
 }
 
@@ -595,8 +631,12 @@ function drawToken(token, color, is_background) {
         token.posy = parseInt(token.newy);
     }
     
-    // cache image if necessary
-    loadImage(token.url);
+    // cache image if necessary (matching the size on screen)
+    var screen_size = -1;
+    if (!is_background && token.size > -1) {
+        screen_size = token.size * canvas_scale * viewport.zoom * (window.devicePixelRatio || 1);
+    }
+    loadImage(token.url, screen_size);
     if (!images[token.url].complete) {
         // skip if not loaded yet
         return;
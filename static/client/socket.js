@@ -32,14 +32,30 @@ var my_color = '';
 
 /// Handle function for interaction via socket
 function onSocketMessage(event) {
-    var data = JSON.parse(event.data);
+    var data = null;
+    if (event.data instanceof ArrayBuffer) {
+        // negotiated binary encoding
+        data = decodeMessagePack(event.data);
+    } else {
+        data = JSON.parse(event.data);
+    }
     var opid = data.OPID;
     
     if (!quiet && opid != 'PING') {
         console.info('READ', data);
     }
     
+    dispatchMessage(data);
+}
+
+/// Dispatch a single message by its OpID
+function dispatchMessage(data) {
+    var opid = data.OPID;
+    
     switch (opid) { 
+        case 'BATCH':
+            onBatch(data);
+            break;
         case 'PING':
             onPing(data);
             break;
@@ -64,6 +80,9 @@ function onSocketMessage(event) {
         case 'QUIT':
             onQuit(data);
             break;
+        case 'LOCATE':
+            onLocate(data);
+            break;
         case 'ROLL':
             onRoll(data);
             break;
@@ -84,6 +103,13 @@ function onSocketMessage(event) {
     };
 }
 
+/// Handle multiple messages that were collected during a server tick
+function onBatch(data) {
+    $.each(data.messages, function(i, message) {
+        dispatchMessage(message);
+    });
+}
+
 function onAccept(data) {
     // show all players
     $.each(data.players, function(i, details) {
@@ -117,10 +143,47 @@ function onAccept(data) {
     onRefresh(data);
 }
 
+/// Merge a token delta (holding only changed fields) into the known token data
+function applyTokenPatch(patch) {
+    var token = tokens[patch.id];
+    if (token == null) {
+        // unknown token cannot be patched
+        return null;
+    }
+    if (patch.version != null && token.version != null && patch.version <= token.version) {
+        // ignore outdated delta
+        return null;
+    }
+    
+    var data = {
+        'id': token.id,
+        'url': token.url,
+        'posx': token.newx,
+        'posy': token.newy,
+        'zorder': token.zorder,
+        'size': token.size,
+        'rotate': token.rotate,
+        'flipx': token.flipx,
+        'locked': token.locked,
+        'text': token.text,
+        'color': token.color
+    };
+    $.each(patch, function(key, value) {
+        data[key] = value;
+    });
+    return data;
+}
+
 function onUpdate(data) {
     var is_primary = false;
     
     $.each(data.tokens, function(index, token) {
+        if (data.delta) {
+            token = applyTokenPatch(token);
+            if (token == null) {
+                return;
+            }
+        }
         updateToken(token);
         
         if (token.id == primary_id) {
@@ -156,6 +219,14 @@ function onJoin(data) {
     showPlayer(p);
 }
 
+function onLocate(data) {
+    if (data.uuid in players) {
+        players[data.uuid].country = data.country;
+        players[data.uuid].flag = data.flag;
+        rebuildPlayers();
+    }
+}
+
 function onQuit(data) {
     hidePlayer(data.uuid); 
 }
@@ -395,6 +466,7 @@ function login(event, gmname, url, websocket_url) {
                 
                 // start socket communication
                 socket = new WebSocket(websocket_url)
+                socket.binaryType = 'arraybuffer';
                 
                 socket.onmessage = onSocketMessage;
                 
@@ -461,7 +533,8 @@ function start(gmname, url, playername, color) {
     writeSocket({
         'name'     : playername,
         'gm_url'   : gmname,
-        'game_url' : url
+        'game_url' : url,
+        'encoding' : 'msgpack'
     });
 
     my_name = playername;
@@ -5,6 +5,8 @@ Copyright (c) 2020-2022 Christian Glöckner
 License: MIT (see LICENSE for details)
 """
 
+import time
+
 from pony.orm import db_session
 
 from test.common import EngineBaseTest, SocketDummy
@@ -89,6 +91,26 @@ class EngineCacheTest(EngineBaseTest):
         gm_cache = cache.insert(gm1)
         self.assertIsNotNone(gm_cache)
         
+    def test_evictIdle(self):
+        cache = self.engine.cache
+
+        with db_session:
+            gm1 = self.engine.main_db.GM(name='foo', url='foo', identity='foo', sid='123')
+            gm2 = self.engine.main_db.GM(name='bar', url='bar', identity='bar', sid='456')
+            gm1.post_setup()
+            gm2.post_setup()
+
+        # databases are not connected yet
+        self.assertEqual(cache.evict_idle(time.time()), (0, 0))
+
+        # only idle databases are unloaded
+        cache.get(gm1).connect_db()
+        cache.get(gm2).connect_db()
+        cache.get(gm2).last_access += self.engine.eviction['timeout']
+        self.assertEqual(cache.evict_idle(time.time() + self.engine.eviction['timeout']), (0, 1))
+        self.assertFalse(cache.get(gm1).is_loaded())
+        self.assertTrue(cache.get(gm2).is_loaded())
+
     def test_listen(self):
         cache = self.engine.cache
 
@@ -148,6 +170,7 @@ class EngineCacheTest(EngineBaseTest):
         cache.listen(socket)
         self.assertEqual(player_cache.socket, socket)
         self.assertIsNotNone(player_cache.greenlet)
+        self.assertFalse(player_cache.binary)
         
         # @NOTE: The async handle() will terminate, because the dummy
         # socket yields None and hence mimics socket to be closed by
@@ -157,3 +180,12 @@ class EngineCacheTest(EngineBaseTest):
         # expect player to be disconnected
         player_cache = game_cache.get('arthur')
         self.assertIsNone(player_cache)
+
+        # listening with MessagePack negotiates binary messages
+        player_cache = game_cache.insert('arthur', 'red', is_gm=False)
+        socket = SocketDummy()
+        socket.block = False
+        socket.push_receive({'name': 'arthur', 'gm_url': 'foo', 'game_url': 'bar', 'encoding': 'msgpack'})
+        cache.listen(socket)
+        self.assertTrue(player_cache.binary)
+        player_cache.greenlet.join()
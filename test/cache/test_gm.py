@@ -5,6 +5,8 @@ Copyright (c) 2020-2022 Christian Glöckner
 License: MIT (see LICENSE for details)
 """
 
+import time
+
 from pony.orm import db_session
 
 from vtt import orm
@@ -93,3 +95,48 @@ class GmCacheTest(EngineBaseTest):
         # can re-insert game
         game_cache = self.cache.insert(game1)
         self.assertIsNotNone(game_cache)
+
+    def test_loadOnDemand(self):
+        # database is connected on first access
+        self.assertFalse(self.cache.is_loaded())
+        with db_session:
+            self.cache.db.Game(url='bar', gm_url='foo')
+        self.assertTrue(self.cache.is_loaded())
+        self.engine.paths.get_game_path('foo', 'bar').mkdir()
+
+        # game is loaded on first access
+        self.assertIsNone(self.cache.get_loaded('bar'))
+        game_cache = self.cache.get_from_url('bar')
+        self.assertIsNotNone(game_cache)
+        self.assertEqual(self.cache.get_loaded('bar'), game_cache)
+        self.assertEqual(self.cache.get_from_url('bar'), game_cache)
+
+        # unknown game is not loaded
+        self.assertIsNone(self.cache.get_from_url('some-random-bullshit'))
+
+    def test_evictIdle(self):
+        with db_session:
+            game = self.cache.db.Game(url='bar', gm_url='foo')
+            game.post_setup()
+        game_cache = self.cache.get_loaded('bar')
+        now = time.time()
+
+        # recently used game is kept
+        self.assertEqual(self.cache.evict_idle(now, 60), 0)
+        self.assertTrue(self.cache.is_loaded())
+
+        # game with players is kept
+        game_cache.insert('arthur', 'red', False)
+        self.assertEqual(self.cache.evict_idle(now + 60, 60), 0)
+        self.assertTrue(self.cache.is_loaded())
+
+        # idle game and database are unloaded
+        game_cache.remove('arthur')
+        self.assertEqual(self.cache.evict_idle(now + 60, 60), 1)
+        self.assertIsNone(self.cache.get_loaded('bar'))
+        self.assertFalse(self.cache.is_loaded())
+        self.assertNotIn('foo/bar', self.engine.checksums)
+
+        # both are loaded again on next access
+        self.assertIsNotNone(self.cache.get_from_url('bar'))
+        self.assertTrue(self.cache.is_loaded())
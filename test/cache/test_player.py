@@ -8,6 +8,9 @@ License: MIT (see LICENSE for details)
 import copy
 import time
 
+import gevent
+import msgpack
+
 from pony.orm import db_session
 
 from test.common import EngineBaseTest, SocketDummy
@@ -240,6 +243,32 @@ class PlayerCacheTest(EngineBaseTest):
         # ... and can re-login
         game_cache.insert('gabriel', 'red', False)
         
+    def test_locate(self):
+        socket1 = SocketDummy()
+        socket2 = SocketDummy()
+
+        # insert players
+        game_cache = self.engine.cache.get_from_url('foo').get_from_url('bar')
+        player_cache1 = game_cache.insert('arthur', 'red', False)
+        player_cache1.socket = socket1
+        player_cache2 = game_cache.insert('bob', 'yellow', False)
+        player_cache2.socket = socket2
+
+        # country is not resolved during login
+        self.assertEqual(player_cache2.country, '?')
+        self.assertEqual(player_cache2.flag, '')
+
+        self.engine.get_country_from_ip = lambda ip: 'de'
+        player_cache2.locate()
+        self.assertEqual(player_cache2.country, 'de')
+        self.assertNotEqual(player_cache2.flag, '')
+
+        # expect LOCATE broadcast
+        answer = socket1.pop_send()
+        self.assertEqual(answer, {'OPID': 'LOCATE', 'uuid': player_cache2.uuid, 'country': 'de',
+                                  'flag': player_cache2.flag})
+        self.assertEqual(socket2.pop_send(), answer)
+
     def test_broadcast(self):
         socket1 = SocketDummy()
         socket2 = SocketDummy()
@@ -259,7 +288,76 @@ class PlayerCacheTest(EngineBaseTest):
         self.assertEqual(foobar['foo'], 'bar')
         foobar = socket2.pop_send()
         self.assertEqual(foobar['foo'], 'bar')
-        
+
+    def test_broadcastBinary(self):
+        socket1 = SocketDummy()
+        socket2 = SocketDummy()
+
+        # insert players
+        game_cache = self.engine.cache.get_from_url('foo').get_from_url('bar')
+        player_cache1 = game_cache.insert('arthur', 'red', False)
+        player_cache1.socket = socket1
+        player_cache2 = game_cache.insert('bob', 'yellow', False)
+        player_cache2.socket = socket2
+        player_cache2.binary = True
+
+        # broadcast
+        game_cache.broadcast({'foo': 'bar', 'pos': [1, 2.5]})
+
+        # expect JSON and MessagePack
+        foobar = socket1.pop_send()
+        self.assertEqual(foobar, {'foo': 'bar', 'pos': [1, 2.5]})
+        gevent.sleep(0)
+        raw = socket2.write_buffer.pop(0)
+        self.assertIsInstance(raw, bytes)
+        self.assertEqual(msgpack.unpackb(raw), {'foo': 'bar', 'pos': [1, 2.5]})
+
+    def test_broadcastSlowPlayer(self):
+        socket1 = SocketDummy()
+        socket2 = SocketDummy()
+
+        # insert players
+        game_cache = self.engine.cache.get_from_url('foo').get_from_url('bar')
+        player_cache1 = game_cache.insert('arthur', 'red', False)
+        player_cache1.socket = socket1
+        player_cache2 = game_cache.insert('bob', 'yellow', False)
+        player_cache2.socket = socket2
+
+        # block sending to the first player
+        player_cache1.sender = type('Blocked', (), {'dead': False})()
+
+        # broadcast does not block but closes the slow player's socket
+        self.engine.send_queue['overflow'] = 'close'
+        for i in range(player_cache1.outbox.maxsize + 1):
+            game_cache.broadcast({'foo': i})
+            gevent.sleep(0)
+        self.assertTrue(socket1.closed)
+        self.assertTrue(player_cache1.outbox.empty())
+        self.assertEqual(len(socket1.write_buffer), 0)
+
+        # other players received everything
+        for i in range(player_cache2.outbox.maxsize + 1):
+            self.assertEqual(socket2.pop_send()['foo'], i)
+
+    def test_broadcastDropOldest(self):
+        socket1 = SocketDummy()
+        game_cache = self.engine.cache.get_from_url('foo').get_from_url('bar')
+        player_cache1 = game_cache.insert('arthur', 'red', False)
+        player_cache1.socket = socket1
+        player_cache1.sender = type('Blocked', (), {'dead': False})()
+
+        # oldest frame is dropped
+        self.engine.send_queue['overflow'] = 'drop'
+        size = player_cache1.outbox.maxsize
+        for i in range(size + 1):
+            game_cache.broadcast({'foo': i})
+        self.assertFalse(socket1.closed)
+        self.assertEqual(player_cache1.outbox.qsize(), size)
+
+        # remaining frames are sent in order
+        player_cache1.drain()
+        self.assertEqual(socket1.pop_send()['foo'], 1)
+
     def test_broadcastTokenUpdate(self):
         socket1 = SocketDummy()
         socket2 = SocketDummy()
@@ -382,6 +480,33 @@ class PlayerCacheTest(EngineBaseTest):
             self.assertEqual(data['OPID'], 'REFRESH')
             self.assertEqual(data['background'], None)
         
+    def test_fetchSnapshot(self):
+        gm_cache = self.engine.cache.get_from_url('foo')
+        game_cache = gm_cache.get_from_url('bar')
+        player_cache = game_cache.insert('arthur', 'red', False)
+        player_cache.socket = SocketDummy()
+
+        with db_session:
+            game = gm_cache.db.Game.select(lambda g: g.url == 'bar').first()
+            active = game.active
+            token_id = [t.id for t in gm_cache.db.Token.select(lambda t: t.scene.id == active and t.size != -1)][0]
+
+        # snapshot of the active scene is reused
+        snapshot = game_cache.fetch_snapshot(active)
+        self.assertIs(game_cache.fetch_snapshot(active), snapshot)
+        self.assertEqual(game_cache.fetch_refresh(active), snapshot.data)
+
+        # updating a token drops the snapshot
+        game_cache.on_update_token(player_cache, {'changes': [{'id': token_id, 'posx': 70, 'posy': 80}]})
+        other = game_cache.fetch_snapshot(active)
+        self.assertIsNot(other, snapshot)
+        token = [t for t in other.data['tokens'] if t['id'] == token_id][0]
+        self.assertEqual(token['posx'], 70)
+
+        # deleting a token drops the snapshot
+        game_cache.on_delete_token(player_cache, {'tokens': [token_id]})
+        self.assertNotIn(token_id, [t['id'] for t in game_cache.fetch_snapshot(active).data['tokens']])
+
     def test_onPing(self):
         socket = SocketDummy()
         
@@ -785,6 +910,8 @@ class PlayerCacheTest(EngineBaseTest):
             token = gm_cache.db.Token(scene=scene, url='/test', posx=30, posy=15, size=20)
 
         def query_token(tid=token.id):
+            # write back in-memory state
+            game_cache.flush()
             with db_session:
                 _game = gm_cache.db.Game.select(lambda g: g.url == 'bar').first()
                 gm_cache.db.Scene.select(lambda s: s.id == _game.active).first()
@@ -837,6 +964,10 @@ class PlayerCacheTest(EngineBaseTest):
         self.assertEqual(answer1, answer3)
         self.assertEqual(answer1['OPID'], 'UPDATE')
         self.assertEqual(len(answer1['tokens']), 1)
+        # expect delta holding only the changed fields
+        self.assertTrue(answer1['delta'])
+        self.assertEqual(answer1['tokens'][0], {'id': token.id, 'version': 1, 'posx': 38, 'posy': 43,
+                                                'uuid': player_cache1.uuid})
         token = query_token()
         self.assertEqual(token.posx, 38)
         self.assertEqual(token.posy, 43)
@@ -1065,6 +1196,29 @@ class PlayerCacheTest(EngineBaseTest):
         socket2.clear_all()
         socket3.clear_all()
         
+    def test_onUpdateTokenWriteBack(self):
+        gm_cache = self.engine.cache.get_from_url('foo')
+        game_cache = gm_cache.get_from_url('bar')
+        player_cache = game_cache.insert('arthur', 'red', False)
+        player_cache.socket = SocketDummy()
+
+        with db_session:
+            token_id = self.active_scene().tokens.select(lambda _t: _t.size != -1).first().id
+
+        # update is answered from memory
+        game_cache.on_update_token(player_cache, {'changes': [{'id': token_id, 'posx': 111, 'posy': 99}]})
+        self.assertEqual(game_cache.get_scene().get(token_id).posx, 111)
+        self.assertIn(token_id, gm_cache.writer.tokens)
+
+        # ... and written back later
+        game_cache.flush()
+        self.assertEqual(len(gm_cache.writer), 0)
+        with db_session:
+            token = self.get_token(token_id)
+            self.assertEqual(token.posx, 111)
+            self.assertEqual(token.posy, 99)
+            self.assertGreater(self.get_game().timeid, 0)
+
     def test_onCreateToken(self):
         socket1 = SocketDummy()
         socket2 = SocketDummy()
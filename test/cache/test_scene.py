@@ -0,0 +1,85 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import unittest
+
+from vtt.cache.scene import SceneCache, TokenState
+from vtt.orm.constants import MAX_SCENE_WIDTH
+
+
+def make_token(token_id: int, posx: int, posy: int, size: int = 20, timeid: float = 0.0) -> dict:
+    return {'id': token_id, 'scene': 1, 'url': '/foo', 'posx': posx, 'posy': posy, 'zorder': 0, 'size': size,
+            'rotate': 0.0, 'flipx': False, 'locked': False, 'timeid': timeid, 'back': None, 'text': '', 'color': ''}
+
+
+class SceneCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = SceneCache(1, 1, [make_token(1, 0, 0, size=-1), make_token(2, 10, 10), make_token(3, 50, 50)])
+
+    def test_tokenStateUpdate(self):
+        token = TokenState(make_token(4, 10, 10))
+        self.assertTrue(token.update(timeid=5.0, pos=(MAX_SCENE_WIDTH + 100, 20)))
+        self.assertEqual(token.posx, MAX_SCENE_WIDTH)
+        self.assertEqual(token.posy, 20)
+        self.assertEqual(token.timeid, 5.0)
+
+        # locked tokens are not updated
+        self.assertTrue(token.update(timeid=6.0, locked=True))
+        self.assertFalse(token.update(timeid=7.0, size=50))
+        self.assertEqual(token.size, 20)
+
+        # dict matches entity layout
+        self.assertEqual(set(token.to_dict().keys()), set(TokenState.fields + ('version',)))
+
+    def test_tokenStatePatch(self):
+        token = TokenState(make_token(4, 10, 10))
+        delta = token.patch(timeid=5.0, pos=(10, 30), size=20)
+        self.assertEqual(delta, {'id': 4, 'version': 1, 'posy': 30})
+
+        delta = token.patch(timeid=6.0, text=('foo', 'red'))
+        self.assertEqual(delta, {'id': 4, 'version': 2, 'text': 'foo', 'color': 'red'})
+
+        # rejected updates do not create a delta
+        token.update(timeid=7.0, locked=True)
+        self.assertIsNone(token.patch(timeid=8.0, size=50))
+
+    def test_selectRange(self):
+        self.assertEqual(self.scene.select_range(0, 0, 20, 20), [2])
+        self.assertEqual(self.scene.select_range(0, 0, 100, 100), [2, 3])
+        self.assertEqual(self.scene.select_range(200, 200, 10, 10), [])
+
+    def test_selectSince(self):
+        self.scene.get(3).timeid = 10.0
+        self.assertEqual([t.id for t in self.scene.select_since(5.0)], [3])
+
+    def test_getChanges(self):
+        data = self.scene.get(2).get_changes()
+        self.assertNotIn('id', data)
+        self.assertEqual(set(data.keys()), set(TokenState.mutable))
+
+    def test_removeBackground(self):
+        self.scene.remove(1)
+        self.assertIsNone(self.scene.background)
+        self.assertIsNone(self.scene.get(1))
+
+    def test_snapshot(self):
+        snapshot = self.scene.get_snapshot()
+        self.assertEqual(snapshot.data['OPID'], 'REFRESH')
+        self.assertEqual(snapshot.data['background'], 1)
+        self.assertEqual(len(snapshot.data['tokens']), 3)
+
+        # snapshot is reused until the scene changes
+        self.assertIs(self.scene.get_snapshot(), snapshot)
+        self.scene.add(make_token(4, 70, 70))
+        self.assertIsNot(self.scene.get_snapshot(), snapshot)
+        self.assertEqual(len(self.scene.get_snapshot().data['tokens']), 4)
+
+        snapshot = self.scene.get_snapshot()
+        self.scene.remove(4)
+        self.assertIsNot(self.scene.get_snapshot(), snapshot)
+        self.assertEqual(len(self.scene.get_snapshot().data['tokens']), 3)
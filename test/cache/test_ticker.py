@@ -0,0 +1,105 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import json
+
+import gevent
+from pony.orm import db_session
+
+from test.common import EngineBaseTest, SocketDummy
+
+
+class BroadcastTickerTest(EngineBaseTest):
+
+    def setUp(self):
+        super().setUp()
+
+        with db_session:
+            gm = self.engine.main_db.GM(name='user123', url='foo', identity='user123', sid='123456')
+            gm.post_setup()
+
+        self.gm_cache = self.engine.cache.get(gm)
+        self.gm_cache.connect_db()
+
+        with db_session:
+            game = self.gm_cache.db.Game(url='bar', gm_url='foo')
+            game.post_setup()
+            scene = self.gm_cache.db.Scene(game=game)
+            self.gm_cache.db.commit()
+            game.active = scene.id
+            self.token = self.gm_cache.db.Token(scene=scene, url='/foo', posx=20, posy=30, size=40)
+
+        self.game_cache = self.gm_cache.get_from_url('bar')
+        self.ticker = self.game_cache.ticker
+
+        self.player_cache = self.game_cache.insert('arthur', 'red', False)
+        self.player_cache.socket = SocketDummy()
+
+    def pop_messages(self) -> list:
+        gevent.sleep(0)
+        buffer = self.player_cache.socket.write_buffer
+        messages = [json.loads(raw) for raw in buffer]
+        buffer.clear()
+        return messages
+
+    def test_broadcastImmediatelyByDefault(self):
+        self.assertEqual(self.ticker.interval, 0.0)
+        self.game_cache.on_update_token(self.player_cache, {'changes': [{'id': self.token.id, 'posx': 50, 'posy': 30}]})
+        messages = self.pop_messages()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['OPID'], 'UPDATE')
+        self.assertEqual(len(self.ticker), 0)
+
+    def test_mergeTokenUpdates(self):
+        self.ticker.interval = 60.0
+        for x in range(10):
+            self.game_cache.on_update_token(self.player_cache, {'changes': [{'id': self.token.id, 'posx': x + 1, 'posy': 30}]})
+        self.game_cache.on_update_token(self.player_cache, {'changes': [{'id': self.token.id, 'size': 50}]})
+        self.assertEqual(self.pop_messages(), [])
+        self.assertEqual(len(self.ticker), 1)
+
+        self.assertEqual(self.ticker.flush(), 1)
+        messages = self.pop_messages()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['OPID'], 'BATCH')
+        update = messages[0]['messages'][0]
+        self.assertEqual(update['OPID'], 'UPDATE')
+        self.assertEqual(update['tokens'], [{'id': self.token.id, 'version': 11, 'posx': 10, 'size': 50,
+                                             'uuid': self.player_cache.uuid}])
+
+        # nothing left to broadcast
+        self.assertEqual(self.ticker.flush(), 0)
+        self.assertEqual(self.pop_messages(), [])
+
+    def test_mergeSelectionsPerPlayer(self):
+        self.ticker.interval = 60.0
+        self.game_cache.on_select(self.player_cache, {'selected': [1]})
+        self.game_cache.on_select(self.player_cache, {'selected': [self.token.id]})
+        other_cache = self.game_cache.insert('bob', 'blue', False)
+        self.game_cache.on_select(other_cache, {'selected': []})
+
+        self.assertEqual(self.ticker.flush(), 2)
+        batch = self.pop_messages()[0]['messages']
+        self.assertEqual(batch[0], {'OPID': 'SELECT', 'color': 'red', 'selected': [self.token.id]})
+        self.assertEqual(batch[1], {'OPID': 'SELECT', 'color': 'blue', 'selected': []})
+
+    def test_broadcastOnTick(self):
+        self.ticker.interval = 0.01
+        self.game_cache.on_select(self.player_cache, {'selected': [self.token.id]})
+        self.assertEqual(self.pop_messages(), [])
+        gevent.sleep(0.05)
+        messages = self.pop_messages()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['OPID'], 'BATCH')
+
+    def test_rollBypassesTick(self):
+        self.ticker.interval = 60.0
+        self.game_cache.on_select(self.player_cache, {'selected': [self.token.id]})
+        self.game_cache.on_roll(self.player_cache, {'sides': 20})
+        messages = self.pop_messages()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['OPID'], 'ROLL')
@@ -0,0 +1,72 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+from pony.orm import db_session
+
+from test.common import EngineBaseTest
+from vtt.cache.warmup import WarmUp
+
+
+class WarmUpTest(EngineBaseTest):
+
+    def setUp(self):
+        super().setUp()
+
+        # create GMs with some games, which are unloaded afterwards
+        with db_session:
+            for gm_url in ['foo', 'bar', 'lol']:
+                gm = self.engine.main_db.GM(name=gm_url, url=gm_url, identity=gm_url, sid=gm_url)
+                gm.post_setup()
+
+        for gm_url, num_games in [('foo', 2), ('bar', 1), ('lol', 0)]:
+            gm_cache = self.engine.cache.get_from_url(gm_url)
+            with db_session:
+                for i in range(num_games):
+                    game = gm_cache.db.Game(url='game{0}'.format(i), gm_url=gm_url)
+                    game.post_setup()
+                    img_path = self.engine.paths.get_game_path(gm_url, game.url)
+                    with open(img_path / '{0}.png'.format(game.get_next_id()), 'w') as h:
+                        h.write(gm_url)
+            gm_cache.evict_idle(gm_cache.last_access + 1, 0)
+            self.assertFalse(gm_cache.is_loaded())
+        self.engine.checksums.clear()
+
+    def test_run(self):
+        warmup = WarmUp(self.engine, 2)
+        self.assertEqual(warmup.get_status()['state'], 'idle')
+
+        warmup.run()
+
+        status = warmup.get_status()
+        self.assertEqual(status['state'], 'done')
+        self.assertEqual(status['gms'], {'total': 3, 'loaded': 3, 'failed': 0})
+        self.assertEqual(status['games'], 3)
+        self.assertEqual(status['md5s'], 3)
+        self.assertEqual(status['workers'], 2)
+        self.assertGreaterEqual(status['elapsed'], 0.0)
+
+        # all GMs and games are loaded
+        for gm_url, num_games in [('foo', 2), ('bar', 1), ('lol', 0)]:
+            gm_cache = self.engine.cache.get_from_url(gm_url)
+            self.assertTrue(gm_cache.is_loaded())
+            self.assertEqual(len(gm_cache.games), num_games)
+        self.assertEqual(len(self.engine.checksums), 3)
+
+    def test_runWithFailure(self):
+        # GM's database cannot be opened
+        db_path = self.engine.paths.get_database_path('bar')
+        db_path.unlink()
+        db_path.mkdir()
+
+        warmup = WarmUp(self.engine, 0)
+        warmup.run()
+
+        status = warmup.get_status()
+        self.assertEqual(status['state'], 'done')
+        self.assertEqual(status['gms'], {'total': 3, 'loaded': 2, 'failed': 1})
+        self.assertEqual(status['games'], 2)
+        self.assertEqual(status['workers'], 1)
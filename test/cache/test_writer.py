@@ -0,0 +1,97 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import gevent
+from pony.orm import db_session
+
+from test.common import EngineBaseTest, SocketDummy
+
+
+class WriteBehindQueueTest(EngineBaseTest):
+
+    def setUp(self):
+        super().setUp()
+
+        with db_session:
+            gm = self.engine.main_db.GM(name='user123', url='foo', identity='user123', sid='123456')
+            gm.post_setup()
+
+        self.gm_cache = self.engine.cache.get(gm)
+        self.gm_cache.connect_db()
+        self.writer = self.gm_cache.writer
+
+        with db_session:
+            game = self.gm_cache.db.Game(url='bar', gm_url='foo')
+            game.post_setup()
+            scene = self.gm_cache.db.Scene(game=game)
+            self.gm_cache.db.commit()
+            game.active = scene.id
+            self.token = self.gm_cache.db.Token(scene=scene, url='/foo', posx=20, posy=30, size=40)
+
+        self.game_cache = self.gm_cache.get_from_url('bar')
+
+    def query_token(self):
+        with db_session:
+            return self.gm_cache.db.Token.select(lambda t: t.id == self.token.id).first()
+
+    def test_coalescesUpdates(self):
+        self.writer.interval = 60.0
+        for x in range(10):
+            self.writer.push_token(self.token.id, {'posx': x, 'posy': 2 * x})
+        self.assertEqual(len(self.writer), 1)
+        self.assertEqual(self.query_token().posx, 20)
+
+        self.assertEqual(self.writer.flush(), 1)
+        self.assertEqual(self.query_token().posx, 9)
+        self.assertEqual(self.query_token().posy, 18)
+        self.assertEqual(len(self.writer), 0)
+
+        # nothing left to write
+        self.assertEqual(self.writer.flush(), 0)
+
+    def test_flushAfterInterval(self):
+        self.writer.interval = 0.01
+        self.writer.push_token(self.token.id, {'posx': 100})
+        self.assertEqual(self.query_token().posx, 20)
+        gevent.sleep(0.05)
+        self.assertEqual(self.query_token().posx, 100)
+
+    def test_flushAfterMaxChanges(self):
+        self.writer.interval = 60.0
+        self.writer.max_changes = 1
+        self.writer.push_token(self.token.id, {'posx': 100})
+        gevent.sleep(0)
+        self.assertEqual(self.query_token().posx, 100)
+
+    def test_writeThrough(self):
+        self.writer.interval = 0.0
+        self.writer.push_token(self.token.id, {'posx': 100})
+        self.assertEqual(self.query_token().posx, 100)
+
+    def test_flushOnGameActivity(self):
+        self.writer.interval = 60.0
+        self.writer.push_game('bar', 1234.0)
+        self.writer.flush()
+        with db_session:
+            game = self.gm_cache.db.Game.select(lambda g: g.url == 'bar').first()
+            self.assertEqual(game.timeid, 1234.0)
+
+    def test_flushOnLogout(self):
+        self.writer.interval = 60.0
+        player_cache = self.game_cache.insert('arthur', 'red', False)
+        player_cache.socket = SocketDummy()
+        self.game_cache.on_update_token(player_cache, {'changes': [{'id': self.token.id, 'posx': 50, 'posy': 60}]})
+        self.assertEqual(self.query_token().posx, 20)
+
+        self.game_cache.logout(player_cache)
+        self.assertEqual(self.query_token().posx, 50)
+
+    def test_flushOnShutdown(self):
+        self.writer.interval = 60.0
+        self.writer.push_token(self.token.id, {'posx': 100})
+        self.engine.cache.flush()
+        self.assertEqual(self.query_token().posx, 100)
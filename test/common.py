@@ -15,6 +15,7 @@ import os
 import functools
 
 import bottle
+import gevent
 import webtest
 from PIL import Image
 from geventwebsocket.exceptions import WebSocketError
@@ -134,6 +135,8 @@ class SocketDummy:
         self.clear_all()
         
     def clear_all(self) -> None:
+        # let queued frames be sent before dropping them
+        gevent.sleep(0)
         self.read_buffer = list()
         self.write_buffer = list()
         
@@ -160,6 +163,8 @@ class SocketDummy:
         self.write_buffer.append(s)
         
     def pop_send(self) -> dict | None:
+        # let queued frames be sent
+        gevent.sleep(0)
         if len(self.write_buffer) > 0:
             return json.loads(self.write_buffer.pop(0))
         return None
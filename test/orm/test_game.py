@@ -17,7 +17,7 @@ from bottle import FileUpload
 from pony.orm import db_session
 
 from test.common import EngineBaseTest
-from vtt import orm
+from vtt import orm, utils
 
 
 class GameTest(EngineBaseTest):
@@ -87,22 +87,18 @@ class GameTest(EngineBaseTest):
 
         # assume md5 file to be empty 
         md5_path = self.engine.paths.get_md5_path(game.gm_url, game.url)
-        with open(md5_path, 'r') as handle:
-            data = json.load(handle)
-            self.assertEqual(len(data), 0)
+        self.assertEqual(len(utils.ChecksumIndex(md5_path)), 0)
         
         # assume empty cache
         cache_instance = self.engine.checksums[game.get_url()]
         self.assertEqual(len(cache_instance), 0)
         
         # create md5s
-        game.make_md5s()
+        self.assertEqual(game.make_md5s(), 1)
 
         # expect md5 file with single hash
         self.assertTrue(os.path.exists(md5_path))
-        with open(md5_path, 'r') as handle:
-            data = json.load(handle)
-            self.assertEqual(len(data), 1)
+        self.assertEqual(len(utils.ChecksumIndex(md5_path)), 1)
 
         # create more files
         id2 = game.get_next_id()
@@ -118,14 +114,13 @@ class GameTest(EngineBaseTest):
         with open(p4, 'w') as h:  # write different content because of hashing
             h.write('4')
 
-        # update md5s
-        game.make_md5s()
+        # update md5s (only new images are hashed)
+        self.assertEqual(game.make_md5s(), 3)
+        self.assertEqual(game.make_md5s(), 0)
 
         # expect md5 file with multiple hashs
         self.assertTrue(os.path.exists(md5_path))
-        with open(md5_path, 'r') as handle:
-            data = json.load(handle)
-            self.assertEqual(len(data), 4)
+        self.assertEqual(len(utils.ChecksumIndex(md5_path)), 4)
         
         # test image IDs in cache
         cache_instance = self.engine.checksums[game.get_url()]
@@ -221,6 +216,9 @@ class GameTest(EngineBaseTest):
         game.remove_md5(id3)
         queried_id = game.get_id_by_md5(md5_3)
         self.assertIsNone(queried_id)
+        self.assertIsNone(self.engine.checksums[game.get_url()].get_md5(id3))
+        md5_path = self.engine.paths.get_md5_path(game.gm_url, game.url)
+        self.assertNotIn(id3, utils.ChecksumIndex(md5_path).entries)
     
     @db_session
     def test_postSetup(self):
@@ -293,11 +291,24 @@ class GameTest(EngineBaseTest):
         game.post_setup()
         
         # starting id
-        i = game.get_next_id()
+        i = game.peek_next_id()
         self.assertEqual(i, 0)
         
+        # ids are handed out once
         i = game.get_next_id()
         self.assertEqual(i, 0)
+        i = game.get_next_id()
+        self.assertEqual(i, 1)
+        self.assertEqual(game.peek_next_id(), 2)
+        
+        # counter is persisted
+        self.engine.next_ids.clear()
+        self.assertEqual(game.peek_next_id(), 2)
+        
+    @db_session
+    def test_seedNextId(self):
+        game = self.db.Game(url='foo', gm_url='url456')
+        game.post_setup()
         
         # gaps ignored for next_id
         img_path = self.engine.paths.get_game_path(game.gm_url, game.url)
@@ -307,11 +318,17 @@ class GameTest(EngineBaseTest):
         i = game.get_next_id()
         self.assertEqual(i, 13)
         
-        # first unused id
-        p = img_path / '5.png'
-        p.touch()     
+        # disk is not scanned again
+        p = img_path / '20.png'
+        p.touch()
         i = game.get_next_id()
-        self.assertEqual(i, 13)
+        self.assertEqual(i, 14)
+        
+        # unless the counter is lost
+        self.engine.next_ids.clear()
+        os.remove(self.engine.paths.get_next_id_path(game.gm_url, game.url))
+        i = game.get_next_id()
+        self.assertEqual(i, 21)
     
     @db_session
     def test_getImageUrl(self):
@@ -370,9 +387,9 @@ class GameTest(EngineBaseTest):
                 fupload = FileUpload(rh, 'test.png', 'test.png')
                 
                 # test upload result
-                old_id = game.get_next_id()
+                old_id = game.peek_next_id()
                 url = game.upload(fupload)
-                new_id = game.get_next_id()
+                new_id = game.peek_next_id()
                 self.assertEqual(old_id + 1, new_id)
                 self.assertEqual(url, game.get_image_url(old_id))
                 
@@ -385,11 +402,15 @@ class GameTest(EngineBaseTest):
                 md5 = self.engine.get_md5(fupload.file)
                 checksums = self.engine.checksums[game.get_url()]
                 self.assertIn(md5, checksums)
+
+                # check md5 being persisted
+                md5_path = self.engine.paths.get_md5_path(game.gm_url, game.url)
+                self.assertEqual(utils.ChecksumIndex(md5_path).get_checksums()[md5], old_id)
                 
                 # try to reupload file: same file used
-                old_id = game.get_next_id()
+                old_id = game.peek_next_id()
                 new_url = game.upload(fupload)
-                new_id = game.get_next_id()
+                new_id = game.peek_next_id()
                 self.assertEqual(old_id, new_id)
                 self.assertEqual(url, new_url)
         
@@ -400,7 +421,7 @@ class GameTest(EngineBaseTest):
                     with open(wh2.name, 'rb') as rh2:
                         # upload 2nd file
                         fupload2 = FileUpload(rh2, 'test.png', 'test.png') 
-                        new_id = game.get_next_id()
+                        new_id = game.peek_next_id()
                         game.upload(fupload2)
                         
                         # test 2nd file exists   
@@ -418,7 +439,7 @@ class GameTest(EngineBaseTest):
                         self.assertEqual(b, 82)
                         self.assertEqual(r, 0)
                         self.assertEqual(t, 0)
-                        self.assertEqual(m, 1)
+                        self.assertEqual(m, 0)  # uploads are already indexed
                         checksums = self.engine.checksums[game.get_url()]
                         self.assertNotIn(md5, checksums)
                         self.assertFalse(os.path.exists(p))
@@ -426,7 +447,7 @@ class GameTest(EngineBaseTest):
                         self.assertTrue(os.path.exists(p2))
 
                         # reupload 1st file            
-                        p1_new = img_path2 / '{0}.png'.format(game.get_next_id())
+                        p1_new = img_path2 / '{0}.png'.format(game.peek_next_id())
                         game.upload(fupload)
                         checksums = self.engine.checksums[game.get_url()]
                         self.assertIn(md5, checksums)
@@ -445,7 +466,53 @@ class GameTest(EngineBaseTest):
                 game.get_next_id()
                 url = game.upload(fupload)
                 self.assertIsNone(url)
+
+        # cannot upload too large file
+        pil_img = Image.new(mode='RGB', size=(64, 64))
+        with tempfile.NamedTemporaryFile('wb') as wh:
+            pil_img.save(wh.name, 'PNG')
+            with open(wh.name, 'rb') as rh:
+                fupload = FileUpload(rh, 'test.png', 'test.png')
+                next_id = game.peek_next_id()
+                url = game.upload(fupload, max_size=64)
+                self.assertIsNone(url)
+                self.assertEqual(game.peek_next_id(), next_id)
         
+    @db_session
+    def test_uploadNormalized(self):
+        game = self.db.Game(url='foo', gm_url='url456')
+        game.post_setup()
+        self.engine.image_limit['token'] = 16
+        self.engine.image_limit['background'] = 32
+
+        pil_img = Image.new(mode='RGB', size=(64, 48))
+        with tempfile.NamedTemporaryFile('wb') as wh:
+            pil_img.save(wh.name, 'PNG')
+            with open(wh.name, 'rb') as rh:
+                fupload = FileUpload(rh, 'test.png', 'test.png')
+                md5 = self.engine.get_md5(fupload.file)
+
+                # token is downscaled and re-encoded
+                url = game.upload(fupload, background=False)
+                img_path = self.engine.paths.get_game_path(game.gm_url, game.url)
+                with Image.open(img_path / url.split('/')[-1]) as img:
+                    self.assertEqual(img.format, 'WEBP')
+                    self.assertEqual(img.size, (16, 12))
+
+                # original md5 is still mapped (e.g. for hashtest)
+                self.assertEqual(game.get_image_url(game.get_id_by_md5(md5)), url)
+                self.assertEqual(game.upload(fupload, background=False), url)
+                self.assertEqual(game.make_md5s(), 0)
+
+        # background uses separate limit
+        pil_img = Image.new(mode='RGB', size=(64, 64), color='red')
+        with tempfile.NamedTemporaryFile('wb') as wh:
+            pil_img.save(wh.name, 'PNG')
+            with open(wh.name, 'rb') as rh:
+                url = game.upload(FileUpload(rh, 'test.png', 'test.png'))
+                with Image.open(img_path / url.split('/')[-1]) as img:
+                    self.assertEqual(img.size, (32, 32))
+
     def test_getIdFromUrl(self):
         self.assertEqual(self.db.Game.get_id_from_url('/foo/bar/3.17.png'), 3)
         self.assertEqual(self.db.Game.get_id_from_url('/0.'), 0)
@@ -461,13 +528,13 @@ class GameTest(EngineBaseTest):
         img_path = self.engine.paths.get_game_path(game.gm_url, game.url)
         id1 = game.get_next_id()
         p1 = img_path / '{0}.png'.format(id1)
-        p1.touch()
+        p1.write_bytes(b'0' * 10)
         id2 = game.get_next_id()
         p2 = img_path / '{0}.png'.format(id2)
         p2.touch()
         id3 = game.get_next_id()
         p3 = img_path / '{0}.png'.format(id3)
-        p3.touch()
+        p3.write_bytes(b'0' * 32)
         id4 = game.get_next_id()
         p4 = img_path / '{0}.png'.format(id4)
         p4.touch()
@@ -480,7 +547,9 @@ class GameTest(EngineBaseTest):
         
         # expect 1st and 3rd file to be abandoned
         # @NOTE: 2nd is assigned, 4th is the last (keeps next id consistent)
-        abandoned = game.get_abandoned_images()
+        abandoned, num_bytes = game.get_abandoned_images()
+        self.assertEqual(len(abandoned), 2)
+        self.assertEqual(num_bytes, 42)
         self.assertIn(str(p1), abandoned)
         self.assertNotIn(str(p2), abandoned)
         self.assertIn(str(p3), abandoned)
@@ -0,0 +1,91 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import pathlib
+import tempfile
+import unittest
+from pony.orm import db_session
+
+from test.common import EngineBaseTest
+from vtt import orm
+
+
+class SqliteProfileTest(unittest.TestCase):
+
+    def test_getSqlitePragmas(self):
+        pragmas = orm.get_sqlite_pragmas({'journal_mode': 'wal', 'synchronous': 'normal', 'mmap_size': 1024,
+                                          'cache_size': '-2000', 'busy_timeout': 100})
+        self.assertEqual(pragmas, ['PRAGMA journal_mode = WAL', 'PRAGMA synchronous = NORMAL',
+                                   'PRAGMA mmap_size = 1024', 'PRAGMA cache_size = -2000',
+                                   'PRAGMA busy_timeout = 100'])
+        self.assertEqual(orm.get_sqlite_pragmas(dict()), [])
+
+        # invalid settings
+        with self.assertRaises(ValueError):
+            orm.get_sqlite_pragmas({'journal_mode': 'WAL; DROP TABLE Token'})
+        with self.assertRaises(ValueError):
+            orm.get_sqlite_pragmas({'synchronous': 'SOMETIMES'})
+        with self.assertRaises(ValueError):
+            orm.get_sqlite_pragmas({'cache_size': 'large'})
+
+
+class SqliteProfileEngineTest(EngineBaseTest):
+
+    def test_profileIsApplied(self):
+        self.engine.sqlite = {'journal_mode': 'WAL', 'synchronous': 'OFF', 'mmap_size': 4096, 'cache_size': -1024,
+                              'busy_timeout': 1234}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = orm.create_gm_database(self.engine, str(pathlib.Path(tmpdir) / 'gm.db'))
+            with db_session:
+                self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+                self.assertEqual(db.execute('PRAGMA synchronous').fetchone()[0], 0)
+                self.assertEqual(db.execute('PRAGMA mmap_size').fetchone()[0], 4096)
+                self.assertEqual(db.execute('PRAGMA cache_size').fetchone()[0], -1024)
+                self.assertEqual(db.execute('PRAGMA busy_timeout').fetchone()[0], 1234)
+            db.disconnect()
+
+    def test_mainDatabaseUsesProfile(self):
+        with db_session:
+            self.assertEqual(self.engine.main_db.execute('PRAGMA journal_mode').fetchone()[0],
+                             self.engine.sqlite['journal_mode'].lower())
+            self.assertEqual(self.engine.main_db.execute('PRAGMA busy_timeout').fetchone()[0],
+                             self.engine.sqlite['busy_timeout'])
+
+
+class IndexesTest(unittest.TestCase):
+
+    indexes = ['idx_token__scene_timeid', 'idx_token__scene_posx_posy', 'idx_token__url', 'idx_roll__game_timeid']
+
+    def get_indexes(self, db) -> set[str]:
+        with db_session:
+            return set(db.select("name FROM sqlite_master WHERE type = 'index'"))
+
+    def test_indexesAreCreated(self):
+        db = orm.create_gm_database(engine=None, filename=':memory:')
+        indexes = self.get_indexes(db)
+        for name in self.indexes:
+            self.assertIn(name, indexes)
+
+    def test_indexesAreAddedToExistingDatabase(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = str(pathlib.Path(tmpdir) / 'gm.db')
+            db = orm.create_gm_database(engine=None, filename=filename)
+            with db_session:
+                # drop indexes like in an outdated database
+                for name in self.indexes:
+                    db.execute(f'DROP INDEX "{name}"')
+                game = db.Game(url='foo', gm_url='bar')
+                db.Token(scene=db.Scene(game=game), url='/static/token.png', posx=0, posy=0, size=20)
+            db.disconnect()
+
+            db = orm.create_gm_database(engine=None, filename=filename)
+            indexes = self.get_indexes(db)
+            for name in self.indexes:
+                self.assertIn(name, indexes)
+            with db_session:
+                self.assertEqual(db.Token.select().count(), 1)
+            db.disconnect()
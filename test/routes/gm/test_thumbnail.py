@@ -5,6 +5,11 @@ Copyright (c) 2020-2023 Christian Glöckner
 License: MIT (see LICENSE for details)
 """
 
+import io
+
+from bottle import FileUpload
+from PIL import Image
+
 from test.common import EngineBaseTest, make_image
 from vtt import routes, orm
 
@@ -35,8 +40,7 @@ class ThumbnailRoutesTest(EngineBaseTest):
         ret = self.app.get('/vtt/thumbnail/arthur/test-game-1')
         self.assertEqual(ret.status_int, 302)
         ret = ret.follow()
-        self.assertEqual(ret.status_int, 302)
-        ret = ret.follow()
+        self.assertEqual(ret.status_int, 200)
         self.assertEqual(ret.content_type, 'image/png')
 
     def test_cannot_query_unknown_gm_thumbnail(self):
@@ -49,9 +53,37 @@ class ThumbnailRoutesTest(EngineBaseTest):
 
     def test_can_query_game_scene_thumbnail(self):
         ret = self.app.get('/vtt/thumbnail/arthur/test-game-1/1')
-        self.assertEqual(ret.status_int, 302)
-        ret = ret.follow()
+        self.assertEqual(ret.status_int, 200)
         self.assertEqual(ret.content_type, 'image/png')
+        self.assertIn('max-age', ret.headers['Cache-Control'])
+
+        # thumbnail is downscaled and cached
+        with Image.open(io.BytesIO(ret.body)) as img:
+            self.assertEqual(max(img.size), self.engine.thumbnails['size'])
+        thumbnails_path = self.engine.paths.get_thumbnails_path('arthur', 'test-game-1')
+        self.assertEqual(len(list(thumbnails_path.glob('1_*.png'))), 1)
+
+        # thumbnail is not modified
+        ret = self.app.get('/vtt/thumbnail/arthur/test-game-1/1', headers={'If-None-Match': ret.headers['ETag']})
+        self.assertEqual(ret.status_int, 304)
+
+    def test_scene_thumbnail_is_replaced_with_background(self):
+        ret = self.app.get('/vtt/thumbnail/arthur/test-game-1/1')
+        self.assertEqual(ret.status_int, 200)
+        etag = ret.headers['ETag']
+
+        # set another background
+        gm_cache = self.engine.cache.get_from_url('arthur')
+        with orm.db_session:
+            scene = gm_cache.db.Scene.select(lambda scn: scn.id == 1 and scn.game.url == 'test-game-1').first()
+            url = scene.game.upload(FileUpload(io.BytesIO(make_image(1024, 768)), 'test.png', 'test.png'))
+            scene.backing = gm_cache.db.Token(scene=scene, url=url, posx=0, posy=0, size=-1)
+
+        ret = self.app.get('/vtt/thumbnail/arthur/test-game-1/1', headers={'If-None-Match': etag})
+        self.assertEqual(ret.status_int, 200)
+        self.assertNotEqual(ret.headers['ETag'], etag)
+        thumbnails_path = self.engine.paths.get_thumbnails_path('arthur', 'test-game-1')
+        self.assertEqual(len(list(thumbnails_path.glob('1_*.png'))), 1)
 
     def test_cannot_query_known_games_unknown_scene_thumbnail(self):
         ret = self.app.get('/vtt/thumbnail/arthur/test-game-1/7', expect_errors=True)
@@ -75,3 +107,47 @@ class ThumbnailRoutesTest(EngineBaseTest):
         self.assertEqual(ret.status_int, 302)
         ret = ret.follow()
         self.assertEqual(ret.content_type, 'image/jpeg')
+
+    def test_can_query_scene_preview(self):
+        ret = self.app.get('/vtt/preview/arthur/test-game-1/1')
+        self.assertEqual(ret.status_int, 200)
+        self.assertEqual(ret.content_type, 'image/png')
+        self.assertIn('max-age', ret.headers['Cache-Control'])
+        with Image.open(io.BytesIO(ret.body)) as img:
+            self.assertEqual(img.width, self.engine.thumbnails['preview'])
+
+        # preview is cached and not modified
+        previews_path = self.engine.paths.get_previews_path('arthur', 'test-game-1')
+        self.assertEqual(len(list(previews_path.glob('1_*.png'))), 1)
+        etag = ret.headers['ETag']
+        ret = self.app.get('/vtt/preview/arthur/test-game-1/1', headers={'If-None-Match': etag})
+        self.assertEqual(ret.status_int, 304)
+
+        # preview is re-rendered after tokens changed
+        gm_cache = self.engine.cache.get_from_url('arthur')
+        with orm.db_session:
+            scene = gm_cache.db.Scene.select(lambda scn: scn.id == 1 and scn.game.url == 'test-game-1').first()
+            gm_cache.db.Token(scene=scene, url=scene.backing.url, posx=100, posy=100, size=50, timeid=42.0)
+
+        ret = self.app.get('/vtt/preview/arthur/test-game-1/1', headers={'If-None-Match': etag})
+        self.assertEqual(ret.status_int, 200)
+        self.assertNotEqual(ret.headers['ETag'], etag)
+        self.assertEqual(len(list(previews_path.glob('1_*.png'))), 1)
+
+    def test_can_query_scene_preview_if_no_background_was_set(self):
+        gm_cache = self.engine.cache.get_from_url('arthur')
+        with orm.db_session:
+            scene = gm_cache.db.Scene.select(lambda scn: scn.id == 1 and scn.game.url == 'test-game-1').first()
+            scene.backing.delete()
+
+        ret = self.app.get('/vtt/preview/arthur/test-game-1/1')
+        self.assertEqual(ret.status_int, 200)
+        self.assertEqual(ret.content_type, 'image/png')
+
+    def test_cannot_query_unknown_scene_preview(self):
+        ret = self.app.get('/vtt/preview/arthur/test-game-1/7', expect_errors=True)
+        self.assertEqual(ret.status_int, 404)
+        ret = self.app.get('/vtt/preview/arthur/test-game-123/1', expect_errors=True)
+        self.assertEqual(ret.status_int, 404)
+        ret = self.app.get('/vtt/preview/bob/test-game-1/1', expect_errors=True)
+        self.assertEqual(ret.status_int, 404)
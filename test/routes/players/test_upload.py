@@ -101,7 +101,7 @@ class UploadRoutesTest(EngineBaseTest):
 
     def test_uploads_with_too_large_images_are_ignored_completly(self):
         images = os.listdir(self.engine.paths.get_game_path('arthur', 'test-game-1'))
-        self.assertEqual(len(images), 2)  # background + md5-file
+        self.assertEqual(len(images), 3)  # background + md5-file + id-counter
         ret = self.app.post('/game/arthur/test-game-1/upload',
                             upload_files=[
                                 ('file[]', 'another.jpg', self.img_small4),
@@ -111,7 +111,7 @@ class UploadRoutesTest(EngineBaseTest):
         self.assertEqual(ret.status_int, 403)
         # expect no new images in directory
         images = os.listdir(self.engine.paths.get_game_path('arthur', 'test-game-1'))
-        self.assertEqual(len(images), 2)  # background + md5-file
+        self.assertEqual(len(images), 3)  # background + md5-file + id-counter
         self.assertIn('0.png', images)
         self.assertNotIn('1.png', images)
 
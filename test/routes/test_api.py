@@ -32,6 +32,10 @@ class ApiRoutesTest(EngineBaseTest):
         ret = self.app.get('/vtt/api/auth', expect_errors=True)
         self.assertEqual(ret.status_int, 200)
 
+        ret = self.app.get('/vtt/api/warmup', expect_errors=True)
+        self.assertEqual(ret.status_int, 200)
+        self.assertEqual(ret.json['state'], 'idle')
+
     def test_cannot_query_games_and_assets_as_default_user(self):
         # register arthur
         ret = self.app.post('/vtt/join', {'gmname': 'arthur'}, xhr=True)
@@ -5,9 +5,12 @@ Copyright (c) 2020-2023 Christian Glöckner
 License: MIT (see LICENSE for details)
 """
 
+import io
 import os
 import shutil
 
+from PIL import Image
+
 from test.common import EngineBaseTest, make_image
 from vtt import routes
 
@@ -92,3 +95,61 @@ class ResourcesRoutesTest(EngineBaseTest):
             h.write('hello world')
         ret = self.app.get('/static/sub/test.txt', expect_errors=True)
         self.assertEqual(ret.status_int, 404)
+
+    def test_can_load_image_variant(self):
+        ret = self.app.get('/asset/arthur/test-game-1/0.png?size=128')
+        self.assertEqual(ret.status_int, 200)
+        with Image.open(io.BytesIO(ret.body)) as img:
+            self.assertEqual(img.size, (128, 128))
+
+        # variant is cached on disk
+        variant_path = self.engine.paths.get_variant_path('arthur', 'test-game-1', 0, 128)
+        self.assertTrue(os.path.exists(variant_path))
+        mtime = os.path.getmtime(variant_path)
+        ret = self.app.get('/asset/arthur/test-game-1/0.png?size=128')
+        self.assertEqual(ret.status_int, 200)
+        self.assertEqual(os.path.getmtime(variant_path), mtime)
+
+        # small images are served as they are
+        ret = self.app.get('/asset/arthur/test-game-1/0.png?size=1024')
+        self.assertEqual(ret.status_int, 200)
+        self.assertEqual(ret.body, make_image(512, 512))
+
+    def test_cannot_load_unsupported_image_variant(self):
+        ret = self.app.get('/asset/arthur/test-game-1/0.png?size=100', expect_errors=True)
+        self.assertEqual(ret.status_int, 404)
+        ret = self.app.get('/asset/arthur/test-game-1/0.png?size=large', expect_errors=True)
+        self.assertEqual(ret.status_int, 404)
+        ret = self.app.get('/asset/arthur/test-game-1/7.png?size=128', expect_errors=True)
+        self.assertEqual(ret.status_int, 404)
+
+    def test_image_is_cached_by_checksum(self):
+        ret = self.app.get('/asset/arthur/test-game-1/0.png')
+        self.assertEqual(ret.status_int, 200)
+        md5 = self.engine.checksums['arthur/test-game-1'].get_md5(0)
+        self.assertEqual(ret.headers['ETag'], f'"{md5}"')
+        self.assertIn('immutable', ret.headers['Cache-Control'])
+
+        # not modified
+        ret = self.app.get('/asset/arthur/test-game-1/0.png', headers={'If-None-Match': f'"{md5}"'})
+        self.assertEqual(ret.status_int, 304)
+        self.assertEqual(ret.body, b'')
+
+        # modified
+        ret = self.app.get('/asset/arthur/test-game-1/0.png', headers={'If-None-Match': '"foo"'})
+        self.assertEqual(ret.status_int, 200)
+
+        # variants are cached separately
+        ret = self.app.get('/asset/arthur/test-game-1/0.png?size=128', headers={'If-None-Match': f'"{md5}"'})
+        self.assertEqual(ret.status_int, 200)
+        self.assertEqual(ret.headers['ETag'], f'"{md5}-128"')
+        ret = self.app.get('/asset/arthur/test-game-1/0.png?size=128', headers={'If-None-Match': f'"{md5}-128"'})
+        self.assertEqual(ret.status_int, 304)
+
+    def test_image_without_checksum_is_not_cached_permanently(self):
+        # @NOTE: 1.png is a copy of 0.png, so its checksum refers to 0.png
+        ret = self.app.get('/asset/arthur/test-game-1/1.png')
+        self.assertEqual(ret.status_int, 200)
+        self.assertNotIn('ETag', ret.headers)
+        self.assertNotIn('Cache-Control', ret.headers)
+        self.assertIn('Last-Modified', ret.headers)
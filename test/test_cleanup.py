@@ -0,0 +1,95 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import os
+import time
+
+from pony.orm import db_session
+
+from test.common import EngineBaseTest
+from vtt.cleanup import CleanupThread, CleanupCursor
+
+
+class NotifierDummy:
+
+    def __init__(self):
+        self.reports = list()
+
+    def on_cleanup(self, report: dict) -> None:
+        self.reports.append(report)
+
+
+class CleanupThreadTest(EngineBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.engine.cleanup['slice'] = 0.0
+        self.engine.cleanup['pause'] = 0.0
+
+        # create GMs, the first and last one expired
+        now = time.time()
+        self.gm_ids = list()
+        with db_session:
+            for i, url in enumerate(['first', 'second', 'third']):
+                gm = self.engine.main_db.GM(name=url, url=url, identity=url, sid=str(i))
+                gm.post_setup()
+                if url != 'second':
+                    gm.timeid = now - self.engine.cleanup['expire'] - 10
+                gm.flush()
+                self.gm_ids.append(gm.id)
+
+        self.worker = CleanupThread(self.engine, start=False)
+
+    def get_gm_urls(self) -> list[str]:
+        with db_session:
+            return sorted(gm.url for gm in self.engine.main_db.GM.select())
+
+    def test_cleanupInSlices(self):
+        self.engine.notify_api = NotifierDummy()
+        reports = self.engine.notify_api.reports
+        self.worker.cleanup()
+
+        self.assertEqual(self.get_gm_urls(), ['second'])
+        self.assertEqual(len(reports), 1)
+        self.assertEqual(reports[0]['gms'], ['first', 'third'])
+        # one GM per slice (then a slice detecting that all GMs are done)
+        self.assertEqual([s['gms'] for s in reports[0]['slices']], [1, 1, 1, 0])
+        self.assertGreaterEqual(reports[0]['time'], sum(s['time'] for s in reports[0]['slices']))
+
+        # cursor is dropped
+        self.assertFalse(os.path.exists(self.engine.paths.get_cleanup_path()))
+        self.assertFalse(self.worker.cursor.is_running())
+
+    def test_cleanupWithTimeBox(self):
+        self.engine.notify_api = NotifierDummy()
+        reports = self.engine.notify_api.reports
+        self.engine.cleanup['slice'] = 60.0
+        self.worker.cleanup()
+
+        self.assertEqual(self.get_gm_urls(), ['second'])
+        self.assertEqual([s['gms'] for s in reports[0]['slices']], [3])
+
+    def test_resumeCleanup(self):
+        # mimic server restart after the first GM's slice
+        self.worker.cursor.start(time.time(), self.engine.get_cleanup_report())
+        self.assertFalse(self.worker.run_slice())
+        self.assertEqual(self.get_gm_urls(), ['second', 'third'])
+
+        worker = CleanupThread(self.engine, start=False)
+        self.assertTrue(worker.cursor.is_running())
+        self.assertEqual(worker.cursor.gm_id, self.gm_ids[0])
+        worker.cleanup()
+
+        self.assertEqual(self.get_gm_urls(), ['second'])
+        self.assertFalse(os.path.exists(self.engine.paths.get_cleanup_path()))
+
+    def test_cursorIgnoresBrokenFile(self):
+        path = self.engine.paths.get_cleanup_path()
+        with open(path, 'w') as handle:
+            handle.write('{"now": 12')
+        cursor = CleanupCursor(path)
+        self.assertFalse(cursor.is_running())
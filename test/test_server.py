@@ -5,11 +5,16 @@ Copyright (c) 2020-2024 Christian Glöckner
 License: MIT (see LICENSE for details)
 """
 
+import io
+import json
 import unittest
 import tempfile
 import pathlib
 import socket
 
+import msgpack
+from geventwebsocket.websocket import Header, WebSocket
+
 from vtt import server
 
 
@@ -43,3 +48,86 @@ class ServerTest(unittest.TestCase):
 #            path = pathlib.Path(name) / 'test.sock'
 #            s = server.VttServer(host='example.com', port=1234, unixsocket=path)
 #            self.assertIsInstance(s.listener, socket.socket)
+
+    def test_can_create_Server_with_compression(self) -> None:
+        s = server.VttServer(host='example.com', port=1234, compress_threshold=1024)
+        self.assertEqual(s.compress_threshold, 1024)
+        self.assertNotIn('compress_threshold', s.options)
+
+
+class StreamDummy:
+
+    def __init__(self, data: bytes = b'') -> None:
+        self.buffer = io.BytesIO(data)
+        self.written = b''
+
+    def read(self, size: int) -> bytes:
+        return self.buffer.read(size)
+
+    def write(self, data: bytes) -> None:
+        self.written += data
+
+
+class DeflateTest(unittest.TestCase):
+
+    def test_compress_message_roundtrip(self) -> None:
+        raw = json.dumps({'OPID': 'REFRESH', 'tokens': [{'id': i, 'url': '/foo'} for i in range(100)]})
+        data = server.compress_message(raw)
+        self.assertLess(len(data), len(raw))
+        self.assertFalse(data.endswith(server.DEFLATE_TAIL))
+        self.assertEqual(server.decompress_message(data).decode('utf-8'), raw)
+
+    def test_accepts_deflate(self) -> None:
+        environ = {'HTTP_SEC_WEBSOCKET_EXTENSIONS': 'permessage-deflate; client_max_window_bits'}
+        self.assertTrue(server.accepts_deflate(environ))
+        environ = {'HTTP_SEC_WEBSOCKET_EXTENSIONS': 'x-webkit-deflate-frame'}
+        self.assertFalse(server.accepts_deflate(environ))
+        self.assertFalse(server.accepts_deflate({}))
+
+    def test_outgoing_message_is_encoded_once(self) -> None:
+        data = {'OPID': 'UPDATE', 'tokens': [{'id': 5, 'posx': 20, 'rotate': 22.5}]}
+        message = server.OutgoingMessage(data)
+        self.assertEqual(json.loads(message.text), data)
+        self.assertEqual(msgpack.unpackb(message.binary), data)
+        self.assertLess(len(message.binary), len(message.text))
+        self.assertIs(message.text, message.text)
+        self.assertIs(message.binary.deflated, message.binary.deflated)
+
+    def test_decode_message(self) -> None:
+        data = {'OPID': 'ROLL', 'sides': 20}
+        self.assertEqual(server.decode_message(json.dumps(data)), data)
+        self.assertEqual(server.decode_message(bytearray(msgpack.packb(data))), data)
+
+    def test_send_compresses_large_messages(self) -> None:
+        stream = StreamDummy()
+        ws = server.DeflateWebSocket({}, stream, None, threshold=100)
+
+        ws.send('small')
+        header = Header.decode_header(io.BytesIO(stream.written))
+        self.assertEqual(header.flags, 0)
+        self.assertEqual(stream.written[2:], b'small')
+
+        stream.written = b''
+        message = server.OutgoingMessage({'data': 'large' * 100})
+        ws.send(message.text)
+        header = Header.decode_header(io.BytesIO(stream.written))
+        self.assertEqual(header.flags, Header.RSV0_MASK)
+        self.assertEqual(header.opcode, WebSocket.OPCODE_TEXT)
+        self.assertEqual(server.decompress_message(stream.written[-header.length:]).decode('utf-8'), message.text)
+
+        stream.written = b''
+        ws.send(message.binary)
+        header = Header.decode_header(io.BytesIO(stream.written))
+        self.assertEqual(header.flags, Header.RSV0_MASK)
+        self.assertEqual(header.opcode, WebSocket.OPCODE_BINARY)
+        self.assertEqual(server.decompress_message(stream.written[-header.length:]), message.binary)
+
+    def test_receive_inflates_compressed_messages(self) -> None:
+        raw = json.dumps({'OPID': 'PING'})
+        data = server.compress_message(raw)
+        frame = Header.encode_header(True, WebSocket.OPCODE_TEXT, b'', len(data), Header.RSV0_MASK) + data
+        frame += Header.encode_header(True, WebSocket.OPCODE_TEXT, b'', len(raw), 0) + raw.encode('utf-8')
+
+        ws = server.DeflateWebSocket({}, StreamDummy(frame), None, threshold=100)
+        self.assertEqual(ws.receive(), raw)
+        self.assertEqual(ws.receive(), raw)
@@ -0,0 +1,108 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import unittest
+
+from vtt import utils
+
+
+class ChecksumIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.path = self.root / 'gm.md5'
+        self.num_hashed = 0
+
+    def tearDown(self):
+        del self.tmpdir
+
+    def get_md5(self, handle) -> str:
+        self.num_hashed += 1
+        return hashlib.md5(handle.read()).hexdigest()
+
+    def create_image(self, image_id: int, content: str) -> pathlib.Path:
+        path = self.root / f'{image_id}.png'
+        with open(path, 'w') as handle:
+            handle.write(content)
+        return path
+
+    def count_lines(self) -> int:
+        with open(self.path, 'r') as handle:
+            return len(handle.read().splitlines())
+
+    def test_verifyHashesChangedImagesOnly(self):
+        self.create_image(0, 'foo')
+        self.create_image(1, 'bar')
+
+        index = utils.ChecksumIndex(self.path)
+        self.assertEqual(index.verify(self.root, self.get_md5), 2)
+        self.assertEqual(len(index), 2)
+
+        # reloading the index does not hash again
+        index = utils.ChecksumIndex(self.path)
+        self.assertEqual(index.verify(self.root, self.get_md5), 0)
+        self.assertEqual(self.num_hashed, 2)
+
+        # modified image is hashed again, removed image is dropped
+        self.create_image(1, 'foobar')
+        os.remove(self.root / '0.png')
+        self.assertEqual(index.verify(self.root, self.get_md5), 1)
+        self.assertEqual(index.get_checksums(), {hashlib.md5(b'foobar').hexdigest(): 1})
+
+        index = utils.ChecksumIndex(self.path)
+        self.assertEqual(index.get_checksums(), {hashlib.md5(b'foobar').hexdigest(): 1})
+
+    def test_addAndRemoveAppend(self):
+        index = utils.ChecksumIndex(self.path)
+        path = self.create_image(0, 'foo')
+        index.add(0, 'abc', path)
+        path = self.create_image(1, 'bar')
+        index.add(1, 'def', path)
+        os.remove(self.root / '0.png')
+        index.remove(0)
+        self.assertEqual(self.count_lines(), 3)
+
+        index = utils.ChecksumIndex(self.path)
+        self.assertEqual(index.get_checksums(), {'def': 1})
+
+        # index is up to date
+        self.assertEqual(index.verify(self.root, self.get_md5), 0)
+
+    def test_compactOutdatedLines(self):
+        index = utils.ChecksumIndex(self.path)
+        path = self.create_image(0, 'foo')
+        for i in range(100):
+            index.add(0, 'abc', path)
+        self.assertLess(self.count_lines(), 100)
+
+        index = utils.ChecksumIndex(self.path)
+        self.assertEqual(index.get_checksums(), {'abc': 0})
+
+    def test_migrateLegacyFormat(self):
+        self.create_image(3, 'foo')
+        self.create_image(4, 'bar')
+        with open(self.path, 'w') as handle:
+            json.dump({'abc': 3, 'def': 5}, handle)
+
+        index = utils.ChecksumIndex(self.path)
+        self.assertEqual(index.verify(self.root, self.get_md5), 1)
+
+        # legacy checksums are trusted, missing images are dropped
+        self.assertEqual(index.get_checksums(), {'abc': 3, hashlib.md5(b'bar').hexdigest(): 4})
+        self.assertEqual(self.count_lines(), 2)
+
+    def test_duplicateChecksumUsesLowestId(self):
+        index = utils.ChecksumIndex(self.path)
+        index.add(7, 'abc', self.create_image(7, 'foo'))
+        index.add(2, 'abc', self.create_image(2, 'foo'))
+        self.assertEqual(index.get_checksums(), {'abc': 2})
@@ -0,0 +1,56 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import unittest
+
+from vtt import utils
+
+
+class ChecksumMapTest(unittest.TestCase):
+
+    def test_lookupBothDirections(self):
+        checksums = utils.ChecksumMap({'abc': 0, 'def': 1})
+        self.assertEqual(len(checksums), 2)
+        self.assertIn('abc', checksums)
+        self.assertEqual(checksums['def'], 1)
+        self.assertEqual(checksums.get_md5(0), 'abc')
+        self.assertIsNone(checksums.get('xyz'))
+        self.assertIsNone(checksums.get_md5(2))
+        self.assertEqual(set(checksums), {'abc', 'def'})
+
+    def test_addReplacesBothDirections(self):
+        checksums = utils.ChecksumMap()
+        checksums.add('abc', 0)
+        checksums['def'] = 1
+
+        # checksum moves to another image
+        checksums.add('abc', 2)
+        self.assertIsNone(checksums.get_md5(0))
+        self.assertEqual(checksums.get_md5(2), 'abc')
+
+        # image gets another checksum
+        checksums.add('xyz', 1)
+        self.assertNotIn('def', checksums)
+        self.assertEqual(checksums.get_md5(1), 'xyz')
+        self.assertEqual(dict(checksums.items()), {'abc': 2, 'xyz': 1})
+
+    def test_remove(self):
+        checksums = utils.ChecksumMap({'abc': 0, 'def': 1})
+        self.assertEqual(checksums.remove_id(0), 'abc')
+        self.assertNotIn('abc', checksums)
+        self.assertIsNone(checksums.remove_id(0))
+
+        self.assertEqual(checksums.remove_md5('def'), 1)
+        self.assertIsNone(checksums.get_md5(1))
+        self.assertEqual(len(checksums), 0)
+
+    def test_reset(self):
+        checksums = utils.ChecksumMap({'abc': 0})
+        checksums.reset({'def': 1})
+        self.assertEqual(dict(checksums.items()), {'def': 1})
+        self.assertIsNone(checksums.get_md5(0))
+        self.assertEqual(checksums.get_md5(1), 'def')
@@ -31,6 +31,7 @@ class ConstantExportTest(unittest.TestCase):
                 'num_music': 7
             }
             playercolors: list[str] = ['#ff0000', '#00ff00', '#0000ff']
+            image_variants: list[int] = [32, 512]
 
         mock_engine = MockEngine()
 
@@ -48,6 +49,7 @@ class ConstantExportTest(unittest.TestCase):
         self.assertEqual(e['MAX_GAME_FILESIZE'], 40)
         self.assertEqual(e['MAX_MUSIC_FILESIZE'], 6)
         self.assertEqual(e['MAX_MUSIC_SLOTS'], 7)
+        self.assertEqual(e['IMAGE_VARIANTS'], [32, 512])
 
         self.assertEqual(e['SUGGESTED_PLAYER_COLORS'], mock_engine.playercolors)
 
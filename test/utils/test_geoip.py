@@ -0,0 +1,85 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import pathlib
+import tempfile
+import unittest
+
+from vtt import utils
+
+
+class CountingResolver:
+
+    def __init__(self, result: str) -> None:
+        self.result = result
+        self.calls = 0
+
+    def resolve(self, ip: str) -> str:
+        self.calls += 1
+        return self.result
+
+
+class GeoIpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name) / 'ranges.csv'
+        with open(self.path, 'w') as handle:
+            handle.write('first,last,country\n')
+            handle.write('"5.0.0.0","5.0.255.255","DE"\n')
+            handle.write('1.0.0.0,1.0.0.255,AU\n')
+            handle.write('16777472,16778239,CN\n')  # 1.0.1.0 - 1.0.3.255
+            handle.write('2001:db8::,2001:db8::ffff,FR\n')
+            handle.write('9.0.0.0,9.0.0.255,-\n')
+
+    def tearDown(self):
+        del self.tmpdir
+
+    def test_parseCountryCode(self):
+        self.assertEqual(utils.parse_country_code('DE '), 'de')
+        self.assertEqual(utils.parse_country_code('-'), '?')
+        self.assertEqual(utils.parse_country_code('ZZZ'), '?')
+
+    def test_rangeResolver(self):
+        resolver = utils.RangeResolver(self.path)
+        self.assertEqual(len(resolver), 5)
+
+        self.assertEqual(resolver.resolve('1.0.0.0'), 'au')
+        self.assertEqual(resolver.resolve('1.0.0.255'), 'au')
+        self.assertEqual(resolver.resolve('1.0.2.17'), 'cn')
+        self.assertEqual(resolver.resolve('5.0.100.1'), 'de')
+        self.assertEqual(resolver.resolve('2001:db8::12'), 'fr')
+
+        # gaps, bounds and invalid addresses are unknown
+        self.assertEqual(resolver.resolve('0.255.255.255'), '?')
+        self.assertEqual(resolver.resolve('1.0.4.0'), '?')
+        self.assertEqual(resolver.resolve('200.0.0.1'), '?')
+        self.assertEqual(resolver.resolve('::1'), '?')
+        self.assertEqual(resolver.resolve('9.0.0.1'), '?')
+        self.assertEqual(resolver.resolve('not-an-ip'), '?')
+        self.assertEqual(resolver.resolve(None), '?')
+
+    def test_cachedResolver(self):
+        inner = CountingResolver('de')
+        resolver = utils.CachedResolver(inner, maxsize=2)
+
+        self.assertEqual(resolver.resolve('1.2.3.4'), 'de')
+        self.assertEqual(resolver.resolve('1.2.3.4'), 'de')
+        self.assertEqual(inner.calls, 1)
+
+        # least recently used ip is dropped
+        resolver.resolve('1.2.3.5')
+        resolver.resolve('1.2.3.6')
+        resolver.resolve('1.2.3.4')
+        self.assertEqual(inner.calls, 4)
+
+    def test_cachedResolverSkipsFailures(self):
+        inner = CountingResolver('?')
+        resolver = utils.CachedResolver(inner, maxsize=2)
+        resolver.resolve('1.2.3.4')
+        resolver.resolve('1.2.3.4')
+        self.assertEqual(inner.calls, 2)
@@ -0,0 +1,86 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import hashlib
+import io
+import os
+import pathlib
+import tempfile
+import unittest
+
+from PIL import Image
+
+from test.common import make_image
+from vtt import utils
+
+
+class IngestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+
+    def tearDown(self):
+        del self.tmpdir
+
+    def test_sniffImage(self):
+        self.assertEqual(utils.sniff_image(make_image(32, 32)), 'BMP')
+        # truncated data is fine, since the image is not decoded
+        self.assertEqual(utils.sniff_image(make_image(512, 512)[:1024]), 'BMP')
+        self.assertIsNone(utils.sniff_image(b'0' * 1024))
+        self.assertIsNone(utils.sniff_image(b''))
+
+    def test_ingestImage(self):
+        data = make_image(512, 512)
+        src = io.BytesIO(data)
+
+        tmp_path, md5, size = utils.ingest_image(src, self.root, len(data))
+        self.assertEqual(tmp_path.parent, self.root)
+        self.assertEqual(md5, hashlib.md5(data).hexdigest())
+        self.assertEqual(size, len(data))
+        with open(tmp_path, 'rb') as handle:
+            self.assertEqual(handle.read(), data)
+
+        # source is rewound
+        self.assertEqual(src.tell(), 0)
+
+    def test_cannotIngestOtherFiles(self):
+        src = io.BytesIO(b'0' * 2**20)
+        self.assertIsNone(utils.ingest_image(src, self.root, 2**21))
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_cannotIngestTooLargeImage(self):
+        data = make_image(512, 512)
+        src = io.BytesIO(data)
+        self.assertIsNone(utils.ingest_image(src, self.root, len(data) - 1))
+        self.assertEqual(os.listdir(self.root), [])
+        self.assertEqual(src.tell(), 0)
+
+    def test_normalizeImage(self):
+        path = self.root / '0.png'
+        with open(path, 'wb') as handle:
+            handle.write(make_image(512, 256))
+
+        # disabled or within limit
+        self.assertFalse(utils.normalize_image(path, 0, 'WEBP'))
+        self.assertFalse(utils.normalize_image(path, 512, 'WEBP'))
+
+        # downscaled and re-encoded
+        self.assertTrue(utils.normalize_image(path, 128, 'WEBP'))
+        with Image.open(path) as img:
+            self.assertEqual(img.format, 'WEBP')
+            self.assertEqual(img.size, (128, 64))
+        self.assertEqual(os.listdir(self.root), ['0.png'])
+
+    def test_normalizeTransparentImageAsJpeg(self):
+        path = self.root / '0.png'
+        Image.new(mode='RGBA', size=(64, 64)).save(path, 'PNG')
+
+        self.assertTrue(utils.normalize_image(path, 32, 'JPEG'))
+        with Image.open(path) as img:
+            self.assertEqual(img.format, 'JPEG')
+            self.assertEqual(img.size, (32, 32))
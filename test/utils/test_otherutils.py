@@ -42,3 +42,11 @@ class OtherTests(unittest.TestCase):
         self.assertEqual(d['test'], 0)
         self.assertEqual(d['foo'], 2)
         self.assertEqual(d['bar'], 1)
+
+    def test_etagMatches(self):
+        self.assertFalse(utils.etag_matches(None, '"abc"'))
+        self.assertFalse(utils.etag_matches('"def"', '"abc"'))
+        self.assertTrue(utils.etag_matches('"abc"', '"abc"'))
+        self.assertTrue(utils.etag_matches('"def", "abc"', '"abc"'))
+        self.assertTrue(utils.etag_matches('W/"abc"', '"abc"'))
+        self.assertTrue(utils.etag_matches('*', '"abc"'))
@@ -64,6 +64,7 @@ class PathApiTest(unittest.TestCase):
         self.paths.get_constants_path()
         self.paths.get_ssl_path()
         self.paths.get_log_path('foo')
+        self.paths.get_cleanup_path()
         
     def test_advanced_path_getter(self):
         # test GM(s) Path(s)
@@ -0,0 +1,79 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+import unittest
+
+from PIL import Image
+
+from vtt import utils, orm
+
+
+def make_token(token_id: int, url: str, posx: int, posy: int, size: int, zorder: int = 0, timeid: float = 0.0,
+               rotate: float = 0.0, flipx: bool = False) -> dict:
+    return {'id': token_id, 'url': url, 'posx': posx, 'posy': posy, 'size': size, 'zorder': zorder,
+            'timeid': timeid, 'rotate': rotate, 'flipx': flipx}
+
+
+class PreviewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.images = {
+            'red': Image.new('RGB', (64, 32), (255, 0, 0)),
+            'green': Image.new('RGB', (16, 16), (0, 255, 0)),
+            'blue': Image.new('RGB', (16, 16), (0, 0, 255))
+        }
+        self.loaded = list()
+
+    def load_image(self, url: str, edge: int) -> Image.Image | None:
+        self.loaded.append((url, edge))
+        img = self.images.get(url)
+        return img.copy() if img is not None else None
+
+    def test_getPreviewKey(self):
+        tokens = [make_token(1, 'red', 0, 0, -1, timeid=1.0), make_token(2, 'green', 0, 0, 10, timeid=2.0)]
+        key = utils.get_preview_key(tokens)
+        # independent of order
+        self.assertEqual(utils.get_preview_key(list(reversed(tokens))), key)
+        # changed with timeid
+        tokens[1]['timeid'] = 3.0
+        self.assertNotEqual(utils.get_preview_key(tokens), key)
+        # changed with removed token
+        self.assertNotEqual(utils.get_preview_key(tokens[:1]), key)
+
+    def test_renderPreview(self):
+        width = orm.MAX_SCENE_WIDTH // 4
+        cx = orm.MAX_SCENE_WIDTH // 2
+        cy = orm.MAX_SCENE_HEIGHT // 2
+        tokens = [
+            make_token(3, 'blue', cx, cy, 100, zorder=2),
+            make_token(2, 'green', cx, cy, 200, zorder=1),
+            make_token(1, 'red', cx, cy, -1),
+            make_token(4, 'missing', 0, 0, 100)
+        ]
+        img = utils.render_preview(tokens, width, self.load_image)
+        self.assertEqual(img.width, width)
+        self.assertEqual(img.height, int(width * orm.MAX_SCENE_HEIGHT / orm.MAX_SCENE_WIDTH))
+
+        # background is fit into the scene, tokens are drawn by z-order
+        self.assertEqual(img.getpixel((width // 2, img.height // 2)), (0, 0, 255, 255))
+        self.assertEqual(img.getpixel((width // 2 + 20, img.height // 2)), (0, 255, 0, 255))
+        self.assertEqual(img.getpixel((5, img.height // 2)), (255, 0, 0, 255))
+        # letterboxed background
+        self.assertEqual(img.getpixel((5, 2)), utils.PREVIEW_BACKGROUND)
+
+        # images are requested in the size they are drawn
+        self.assertIn(('blue', 26), self.loaded)
+        self.assertIn(('red', width), self.loaded)
+        self.assertIn(('missing', 26), self.loaded)
+
+    def test_renderRotatedToken(self):
+        width = orm.MAX_SCENE_WIDTH
+        self.images['bar'] = Image.new('RGB', (100, 10), (255, 255, 255))
+        tokens = [make_token(1, 'bar', 500, 300, 100, rotate=90.0)]
+        img = utils.render_preview(tokens, width, self.load_image)
+        self.assertEqual(img.getpixel((500, 260)), (255, 255, 255, 255))
+        self.assertEqual(img.getpixel((540, 300)), utils.PREVIEW_BACKGROUND)
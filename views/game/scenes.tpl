@@ -10,11 +10,7 @@
 %for i, scene_id in enumerate(game.order):
     %for s in game.scenes:
         %if scene_id == s.id:
-            %if s.backing is None:
-                %url = "/static/transparent.png"
-            %else:
-                %url = "/vtt/thumbnail/" + '/'.join([game.gm_url, game.url, str(s.id)])
-            %end
+            %url = "/vtt/preview/" + '/'.join([game.gm_url, game.url, str(s.id)])
             %css  = "thumbnail"
             %hint = "SWITCH TO SCENE"
             %if game.active == s.id:
@@ -3,7 +3,7 @@
     %for g in all_games.order_by(lambda g: g.id):
         %url = "/vtt/thumbnail/" + '/'.join([g.gm_url, g.url])
         <div class="element">
-            <a href="{{server}}/game/{{g.get_url()}}" draggable="false" target="_blank"><img class="thumbnail" draggable="false" src="{{url}}" title="{{g.url.upper()}}" /></a>
+            <a href="{{server}}/game/{{g.get_url()}}" draggable="false" target="_blank"><img class="thumbnail" draggable="false" loading="lazy" src="{{url}}" title="{{g.url.upper()}}" /></a>
             <div class="controls">
                 <img class="icon" src="/static/cleanup.png" onClick="cleanUp('{{g.url}}');" draggable="false" title="CLEAN UP" />
                 <a href="/vtt/export-game/{{g.url}}" draggable="false"><img class="icon" src="/static/export.png" draggable="false" title="EXPORT GAME" ></a>
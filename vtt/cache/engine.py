@@ -9,11 +9,14 @@ __author__ = 'Christian Glöckner'
 __licence__ = 'MIT'
 
 import json
+import time
 
+import gevent
 from gevent import lock
 
 from vtt.orm.register import db_session
 from .gm import GmCache
+from .warmup import WarmUp
 
 
 class EngineCache:
@@ -31,10 +34,9 @@ class EngineCache:
                 self.engine.logging.info('Creating GM {0}/{1} #{2}'.format(i + 1, len(gms), gm.url))
                 self.insert(gm)
 
-        # initialize GMs databases
-        for i, gm in enumerate(self.gms):
-            self.gms[gm].connect_db()
-            self.engine.logging.info('Loaded GM {0}/{1} #{2}'.format(i + 1, len(self.gms), gm))
+        # @NOTE: GM databases and games are loaded on first access or
+        # ahead of time by the optional warm-up
+        self.warmup = WarmUp(engine, engine.warmup['workers'])
 
         self.engine.logging.info('EngineCache created')
 
@@ -63,6 +65,45 @@ class EngineCache:
         with self.lock:
             del self.gms[gm.url]
 
+    def flush(self):
+        """ Write back all queued token updates, e.g. on shutdown. """
+        with self.lock:
+            gm_caches = list(self.gms.values())
+        for gm_cache in gm_caches:
+            gm_cache.writer.flush()
+
+    # --- idle eviction -----------------------------------------------
+
+    def evict_idle(self, now: float) -> tuple[int, int]:
+        """ Unload idle games and GM databases. Returns the number of
+        unloaded games and GM databases.
+        """
+        timeout = self.engine.eviction['timeout']
+        with self.lock:
+            gm_caches = list(self.gms.values())
+
+        num_games = 0
+        num_gms = 0
+        for gm_cache in gm_caches:
+            if not gm_cache.is_loaded():
+                continue
+            num_games += gm_cache.evict_idle(now, timeout)
+            if not gm_cache.is_loaded():
+                num_gms += 1
+
+        if num_games > 0 or num_gms > 0:
+            self.engine.logging.info('Unloaded {0} idle games and {1} idle GM databases'.format(num_games, num_gms))
+        return num_games, num_gms
+
+    def run_eviction(self) -> None:
+        """ Periodically unload idle games and GM databases. """
+        while True:
+            gevent.sleep(self.engine.eviction['interval'])
+            try:
+                self.evict_idle(time.time())
+            except Exception as error:
+                self.engine.logging.error('Cannot unload idle games: {0}'.format(error))
+
     # --- websocket implementation ------------------------------------
 
     def listen(self, socket):
@@ -92,6 +133,7 @@ class EngineCache:
 
         # with player_cache.lock: # note: atm deadlocking
         player_cache.socket = socket
+        player_cache.binary = data.get('encoding') == 'msgpack'
         game_cache.login(player_cache)
 
         # handle incoming data
@@ -99,6 +141,7 @@ class EngineCache:
         # because the route, which calls this listen() has its own
         # db_session due to the bottle configuration
         player_cache.handle_async()
+        player_cache.locate_async()
 
         return player_cache
 
@@ -8,17 +8,18 @@ License: MIT (see LICENSE for details)
 __author__ = 'Christian Glöckner'
 __licence__ = 'MIT'
 
-import json
 import os
 import random
 import time
 
 from bottle import request
 from gevent import lock
-from geventwebsocket.exceptions import WebSocketError
 
 from vtt.orm.register import db_session
+from vtt.server import OutgoingMessage
 from .player import PlayerCache
+from .scene import SceneCache, TokenState
+from .ticker import BroadcastTicker
 
 
 class GameCache:
@@ -34,6 +35,14 @@ class GameCache:
         self.url = game.url
         self.players = dict()  # name => player
         self.next_id = 0  # used for player indexing in UI
+        self.last_access = time.time()  # used to unload idle games
+
+        # in-memory state of the active scene (loaded on first access)
+        self.game_id = None
+        self.scene = None
+
+        # optional tick-based broadcast of updates and selections
+        self.ticker = BroadcastTicker(engine, self)
 
         self.playback = list()
         for slot_id in range(engine.file_limit['num_music']):
@@ -107,6 +116,69 @@ class GameCache:
                 if os.path.exists(fname):
                     os.remove(fname)
 
+    # --- scene state implementation ----------------------------------
+
+    def get_game_id(self):
+        """ Return the game's database id (queried once). """
+        with self.lock:
+            if self.game_id is None:
+                with db_session:
+                    g = self.parent.db.Game.select(lambda g: g.url == self.url).first()
+                    if g is not None:
+                        self.game_id = g.id
+            return self.game_id
+
+    def load_scene(self, scene_id):
+        """ Load a scene and its tokens from the GM's database. """
+        with db_session:
+            s = self.parent.db.Scene.select(lambda s: s.id == scene_id).first()
+            if s is None:
+                return None
+            bg = s.backing
+            background_id = bg.id if bg is not None else None
+            tokens = [t.to_dict() for t in s.tokens]
+
+        return SceneCache(scene_id, background_id, tokens)
+
+    def get_scene(self):
+        """ Return the in-memory state of the active scene. It is loaded
+        from the GM's database on first access and answers all token
+        operations afterwards.
+        """
+        with self.lock:
+            if self.scene is None:
+                with db_session:
+                    g = self.parent.db.Game.select(lambda g: g.url == self.url).first()
+                    if g is None:
+                        return None
+                    self.game_id = g.id
+                    active = g.active
+                self.scene = self.load_scene(active)
+            return self.scene
+
+    def switch_scene(self, scene_id):
+        """ Write back the current scene and load the given one. """
+        self.flush()
+        with self.lock:
+            self.scene = self.load_scene(scene_id)
+            return self.scene
+
+    def reload(self):
+        """ Write back and drop the in-memory state, e.g. after the
+        database was modified from outside this cache.
+        """
+        self.flush()
+        with self.lock:
+            self.scene = None
+
+    def touch(self, now):
+        """ Remember the game's latest activity for the next write-back. """
+        self.parent.writer.push_game(self.url, now)
+
+    def flush(self):
+        """ Write queued token data back to the GM's database. """
+        self.parent.writer.flush()
+
     # --- cache implementation ----------------------------------------
 
     def insert(self, name, color, is_gm):
@@ -197,7 +269,9 @@ class GameCache:
             'playback': self.playback
         })
 
-        player.write(self.fetch_refresh(g.active))
+        snapshot = self.fetch_snapshot(g.active)
+        if snapshot is not None:
+            player.send(snapshot)
 
         # broadcast join to all players
         self.broadcast({
@@ -238,6 +312,9 @@ class GameCache:
             'uuid': player.uuid
         })
 
+        # write back what the player changed
+        self.flush()
+
     def disconnect(self, uuid):
         """ Close single socket. """
         with self.lock:
@@ -254,6 +331,9 @@ class GameCache:
 
     def cleanup(self):
         """ Cleanup game. """
+        # write back and drop scene state
+        self.reload()
+
         # disconnect all players
         with self.lock:
             for name in self.players:
@@ -264,40 +344,30 @@ class GameCache:
 
     def broadcast(self, data):
         """ Broadcast given data to all clients. """
-        # dump once, send multiple times
-        raw = json.dumps(data)
+        # dump once per encoding, send multiple times
+        message = data if isinstance(data, OutgoingMessage) else OutgoingMessage(data)
 
         with self.lock:
-            force_logout = list()
-            # broadcast
+            # @NOTE: sending is done by each player's greenlet
             for name in self.players:
-                s = self.players[name].socket
-                try:
-                    # self.players[name].write(data)
-                    if s is not None:
-                        s.send(raw)
-                except WebSocketError:
-                    pass
+                self.players[name].send(message)
 
     def broadcast_token_update(self, player, since):
         """ Broadcast updated tokens. """
+        scene = self.get_scene()
+        if scene is None:
+            self.engine.logging.warning(
+                'A token update broadcast could not be performed at {0}/{1} by {2}, because the game was not found'.format(
+                    self.parent.url, self.url, self.engine.get_client_ip(request)))
+            return;
+        self.touch(time.time())
+
         # fetch all changed tokens
         all_data = list()
-
-        now = time.time()
-        with db_session:
-            g = self.parent.db.Game.select(lambda g: g.url == self.url).first()
-            if g is None:
-                self.engine.logging.warning(
-                    'A token update broadcast could not be performed at {0}/{1} by {2}, because the game was not found'.format(
-                        self.parent.url, self.url, self.engine.get_client_ip(request)))
-                return;
-            g.timeid = now
-
-            for t in self.parent.db.Token.select(lambda t: t.scene.id == g.active and t.timeid >= since):
-                tmp = t.to_dict()
-                tmp['uuid'] = player.uuid
-                all_data.append(tmp)
+        for t in scene.select_since(since):
+            tmp = t.to_dict()
+            tmp['uuid'] = player.uuid
+            all_data.append(tmp)
 
         # broadcast update
         self.broadcast({
@@ -307,37 +377,41 @@ class GameCache:
 
     def broadcast_scene_switch(self, game):
         """ Broadcast scene switch. """
+        # send pending updates of the previous scene
+        self.ticker.flush()
+
+        # load the new scene into memory
+        self.switch_scene(game.active)
+
         # collect all tokens for the given scene
-        refresh_data = self.fetch_refresh(game.active)
+        snapshot = self.fetch_snapshot(game.active)
 
         # broadcast switch
-        self.broadcast(refresh_data);
+        if snapshot is not None:
+            self.broadcast(snapshot)
 
     def fetch_refresh(self, scene_id):
         """ Performs a full refresh on all tokens. """
-        tokens = list()
-        background_id = 0
-        with db_session:
-            scene = self.parent.db.Scene.select(lambda s: s.id == scene_id).first()
-            if scene is None:
-                self.engine.logging.warning(
-                    'Game {0}/{1} switched to scene #{2}, but the scene was not found.'.format(self.parent.url,
-                                                                                               self.url, scene_id))
-                return;
-
-            # get background if set
-            bg = scene.backing
-            background_id = bg.id if bg is not None else None
+        snapshot = self.fetch_snapshot(scene_id)
+        if snapshot is not None:
+            return snapshot.data
 
-            # fetch token data
-            for t in self.parent.db.Token.select(lambda t: t.scene.id == scene_id):
-                tokens.append(t.to_dict())
+    def fetch_snapshot(self, scene_id):
+        """ Return the serialized REFRESH message of the given scene. The
+        active scene's message is kept until its tokens are changed.
+        """
+        scene = self.get_scene()
+        if scene is None or scene.id != scene_id:
+            # not the active scene, so query it
+            scene = self.load_scene(scene_id)
+        if scene is None:
+            self.engine.logging.warning(
+                'Game {0}/{1} switched to scene #{2}, but the scene was not found.'.format(self.parent.url,
+                                                                                           self.url, scene_id))
+            return;
 
-        return {
-            'OPID': 'REFRESH',
-            'tokens': tokens,
-            'background': background_id
-        }
+        with self.lock:
+            return scene.get_snapshot()
 
     def on_ping(self, player, data):
         """ Handle player pinging the server. """
@@ -363,23 +437,23 @@ class GameCache:
             # ignore unsupported dice
             return
 
+        game_id = self.get_game_id()
+        if game_id is None:
+            self.engine.logging.warning(
+                'Player {0} tried to roll 1d{1} at {2}/{3} by {4}, but the game was not found'.format(player.name,
+                                                                                                      sides,
+                                                                                                      self.parent.url,
+                                                                                                      self.url,
+                                                                                                      player.ip))
+            return;
+
         now = time.time()
+        self.touch(now)
 
         with db_session:
-            g = self.parent.db.Game.select(lambda g: g.url == self.url).first()
-            if g is None:
-                self.engine.logging.warning(
-                    'Player {0} tried to roll 1d{1} at {2}/{3} by {4}, but the game was not found'.format(player.name,
-                                                                                                          sides,
-                                                                                                          self.parent.url,
-                                                                                                          self.url,
-                                                                                                          player.ip))
-                return;
-
-            g.timeid = now
-
             # roll dice
-            self.parent.db.Roll(game=g, name=player.name, color=player.color, sides=sides, result=result, timeid=now)
+            self.parent.db.Roll(game=game_id, name=player.name, color=player.color, sides=sides, result=result,
+                                timeid=now)
 
         # broadcast dice result
         self.broadcast({
@@ -397,7 +471,7 @@ class GameCache:
         player.selected = data['selected']
 
         # broadcast selection
-        self.broadcast({
+        self.ticker.push_select(player, {
             'OPID': 'SELECT',
             'color': player.color,
             'selected': player.selected,
@@ -416,37 +490,25 @@ class GameCache:
             # ignore incomplete range query
             return
 
-        now = time.time()
         # query inside given rectangle
-        with db_session:
-            g = self.parent.db.Game.select(lambda g: g.url == self.url).first()
-            if g is None:
-                self.engine.logging.warning(
-                    'Player {0} tried range select at {1}/{2} by {3}, but the game was not found'.format(player.name,
-                                                                                                         self.parent.url,
-                                                                                                         self.url,
-                                                                                                         player.ip))
-                return
-            g.timeid = now
-
-            s = self.parent.db.Scene.select(lambda s: s.id == g.active).first()
-            if s is None:
-                self.engine.logging.warning(
-                    'Player {0} tried range select at {1}/{2} in scene #{3} by {4}, but the scene was not found'.format(
-                        player.name, self.parent.url, self.url, g.active, player.ip))
-                return
+        scene = self.get_scene()
+        if scene is None:
+            self.engine.logging.warning(
+                'Player {0} tried range select at {1}/{2} by {3}, but the scene was not found'.format(player.name,
+                                                                                                      self.parent.url,
+                                                                                                      self.url,
+                                                                                                      player.ip))
+            return
+        self.touch(time.time())
 
-            token_ids = player.selected if adding else list()
-            for t in self.parent.db.Token.select(
-                    lambda t: t.scene == s and left <= t.posx and t.posx <= left + width and top <= t.posy and t.posy <= top + height):
-                if t.size != -1:
-                    token_ids.append(t.id)
+        token_ids = player.selected if adding else list()
+        token_ids.extend(scene.select_range(left, top, width, height))
 
         # store selection
         player.selected = token_ids
 
         # broadcast selection
-        self.broadcast({
+        self.ticker.push_select(player, {
             'OPID': 'SELECT',
             'color': player.color,
             'selected': player.selected,
@@ -487,55 +549,73 @@ class GameCache:
             'indices': update
         });
 
+    @staticmethod
+    def get_token_changes(player, data):
+        """ Fetch changed data (accepting None) for `Token.update`. """
+        posx = data.get('posx')
+        posy = data.get('posy')
+        text = data.get('text')
+        return {
+            'pos': None if posx is None or posy is None else (posx, posy),
+            'zorder': data.get('zorder'),
+            'size': data.get('size'),
+            'rotate': data.get('rotate'),
+            'flipx': data.get('flipx'),
+            'locked': data.get('locked'),
+            'text': None if text is None else (text, player.color)
+        }
+
     def on_update_token(self, player, data):
         """ Handle player changing token data. """
         # fetch changes' data
         changes = data['changes']
         changes.sort(key=lambda elem: elem['id'])
-        ids = [item['id'] for item in changes]
         update = list()
 
-        now = time.time()
-        with db_session:
-            g = self.parent.db.Game.select(lambda g: g.url == self.url).first()
-            if g is None:
-                self.engine.logging.warning(
-                    'Player {0} tried to update token data at {1}/{2} by {3}, but the game was not found'.format(
-                        player.name, self.parent.url, self.url, player.ip))
-                return;
-            g.timeid = now
+        scene = self.get_scene()
+        if scene is None:
+            self.engine.logging.warning(
+                'Player {0} tried to update token data at {1}/{2} by {3}, but the game was not found'.format(
+                    player.name, self.parent.url, self.url, player.ip))
+            return;
 
-            # iterate provided tokens
-            tokens = self.parent.db.Token.select(lambda t: t.id in ids)
+        now = time.time()
+        self.touch(now)
 
-            for i, token in enumerate(tokens):
+        # update tokens of the active scene in memory
+        unknown = list()
+        with self.lock:
+            for data in changes:
+                token = scene.get(data['id'])
                 if token is None:
-                    # ignore deleted token
+                    unknown.append(data)
                     continue
 
-                data = changes[i]
-                # fetch changed data (accepting None)
-                posx = data.get('posx')
-                posy = data.get('posy')
-                pos = None if posx is None or posy is None else (posx, posy)
-                zorder = data.get('zorder')
-                size = data.get('size')
-                rotate = data.get('rotate')
-                flipx = data.get('flipx')
-                locked = data.get('locked')
-                text = data.get('text')
-                label = None if text is None else (text, player.color)
-                if token.update(timeid=now, pos=pos, zorder=zorder, size=size,
-                                rotate=rotate, flipx=flipx, locked=locked, text=label):
+                delta = token.patch(timeid=now, **self.get_token_changes(player, data))
+                if delta is not None:
+                    scene.invalidate()
+                    self.parent.writer.push_token(token.id, token.get_changes())
                     # add to broadcast data
-                    tmp = token.to_dict()
-                    tmp['uuid'] = player.uuid
-                    update.append(tmp)
-
-        self.broadcast({
-            'OPID': 'UPDATE',
-            'tokens': update
-        });
+                    delta['uuid'] = player.uuid
+                    update.append(delta)
+
+        if len(unknown) > 0:
+            # tokens outside the active scene are updated directly
+            with db_session:
+                for data in unknown:
+                    token = self.parent.db.Token.select(lambda t: t.id == data['id']).first()
+                    if token is None:
+                        # ignore deleted token
+                        continue
+
+                    if token.update(timeid=now, **self.get_token_changes(player, data)):
+                        # add to broadcast data
+                        tmp = token.to_dict()
+                        tmp['uuid'] = player.uuid
+                        update.append(tmp)
+
+        # @NOTE: a delta update holds only the changed fields of each token
+        self.ticker.push_update(update)
 
     def on_create_token(self, player, data):
         """ Handle player creating tokens. """
@@ -550,25 +630,26 @@ class GameCache:
             labels = data['labels']
             color = player.color
 
+        scene = self.get_scene()
+        if scene is None:
+            self.engine.logging.warning(
+                'Player {0} tried creating a tokens at {1}/{2}, but the scene was not found'.format(player.name,
+                                                                                                    self.parent.url,
+                                                                                                    self.url))
+            return
+
         # create tokens
         now = time.time()
+        self.touch(now)
         n = len(urls)
         tokens = list()
+        removed = list()
         with db_session:
-            g = self.parent.db.Game.select(lambda g: g.url == self.url).first()
-            if g is None:
-                self.engine.logging.warning(
-                    'Player {0} tried creating a tokens at {1}/{2}, but the game was not found'.format(player.name,
-                                                                                                       self.parent.url,
-                                                                                                       self.url))
-                return
-            g.timeid = now
-
-            s = self.parent.db.Scene.select(lambda s: s.id == g.active).first()
-            if g is None:
+            s = self.parent.db.Scene.select(lambda s: s.id == scene.id).first()
+            if s is None:
                 self.engine.logging.warning(
-                    'Player {0} tried creating a tokens at {1}/{2}, but the scene #{4} was not found'.format(
-                        player.name, self.parent.url, self.url, g.active))
+                    'Player {0} tried creating a tokens at {1}/{2}, but the scene #{3} was not found'.format(
+                        player.name, self.parent.url, self.url, scene.id))
                 return
 
             for k, url in enumerate(urls):
@@ -586,11 +667,21 @@ class GameCache:
                 # apply as background if size equals -1
                 if t.size == -1:
                     if s.backing is not None:
+                        removed.append(s.backing.id)
                         s.backing.delete()
                     s.backing = t
 
                 tokens.append(t.to_dict())
 
+        # keep in-memory scene in sync
+        with self.lock:
+            for token_id in removed:
+                scene.remove(token_id)
+            for t in tokens:
+                scene.add(t)
+                if t['size'] == -1:
+                    scene.background = t['id']
+
         # broadcast creation
         self.broadcast({
             'OPID': 'CREATE',
@@ -604,16 +695,33 @@ class GameCache:
         posx = data['posx']
         posy = data['posy']
 
-        # calculate tokens' center of mass
-        centerx = 0
-        centery = 0
+        scene = self.get_scene()
+        if scene is None:
+            self.engine.logging.warning(
+                'Player {0} tried clone tokens at {1}/{2} by {3}, but the scene was not found'.format(player.name,
+                                                                                                      self.parent.url,
+                                                                                                      self.url,
+                                                                                                      player.ip))
+            return;
+
+        # fetch source tokens (from memory if possible)
+        sources = list()
         with db_session:
-            for k, tid in enumerate(ids):
-                t = self.parent.db.Token.select(lambda t: t.id == tid).first()
+            for tid in ids:
+                t = scene.get(tid)
                 if t is None:
+                    t = self.parent.db.Token.select(lambda t: t.id == tid).first()
+                if t is None:
+                    # ignore, t was deleted in the meantime
                     continue
-                centerx += t.posx
-                centery += t.posy
+                sources.append(TokenState(t.to_dict()))
+
+        # calculate tokens' center of mass
+        centerx = 0
+        centery = 0
+        for t in sources:
+            centerx += t.posx
+            centery += t.posy
         centerx /= len(ids)
         centery /= len(ids)
 
@@ -623,35 +731,14 @@ class GameCache:
         # create tokens
         tokens = list()
         now = time.time()
+        self.touch(now)
         with db_session:
-            g = self.parent.db.Game.select(lambda g: g.url == self.url).first()
-            if g is None:
-                self.engine.logging.warning(
-                    'Player {0} tried clone tokens at {1}/{2} by {3}, but the game was not found'.format(player.name,
-                                                                                                         self.parent.url,
-                                                                                                         self.url,
-                                                                                                         player.ip))
-                return;
-
-            g.timeid = now
-            s = self.parent.db.Scene.select(lambda s: s.id == g.active).first()
-            if s is None:
-                self.engine.logging.warning(
-                    'Player {0} tried clone tokens at {1}/{2} by {4}, but the scene #{3} was not found'.format(
-                        player.name, self.parent.url, self.url, g.active, player.ip))
-                return;
-
-            # iterate provided tokens
-            for k, tid in enumerate(ids):
-                t = self.parent.db.Token.select(lambda t: t.id == tid).first()
-                if t is None:
-                    # ignore, t was deleted in the meantime
-                    continue
+            for t in sources:
                 # keep relative distance
                 x = int(t.posx + move_dx)
                 y = int(t.posy + move_dy)
                 # clone token
-                t = self.parent.db.Token(scene=s, url=t.url, posx=x, posy=y,
+                t = self.parent.db.Token(scene=scene.id, url=t.url, posx=x, posy=y,
                                          zorder=t.zorder, size=t.size, rotate=t.rotate, flipx=t.flipx,
                                          timeid=now, text=t.text, color=t.color)
                 # enforce position to be within bounds
@@ -660,6 +747,11 @@ class GameCache:
                 self.parent.db.commit()
                 tokens.append(t.to_dict())
 
+        # keep in-memory scene in sync
+        with self.lock:
+            for t in tokens:
+                scene.add(t)
+
         # broadcast creation
         self.broadcast({
             'OPID': 'CREATE',
@@ -668,16 +760,28 @@ class GameCache:
 
     def on_delete_token(self, player, data):
         """ Handle player deleting tokens. """
+        scene = self.get_scene()
+
         # delete tokens
         tokens = data['tokens']
         ids = list()
         with db_session:
             for tid in tokens:
                 t = self.parent.db.Token.select(lambda t: t.id == tid).first()
-                if t is not None and not t.locked:
+                if t is None:
+                    continue
+                # in-memory state is more recent
+                state = scene.get(tid) if scene is not None else None
+                locked = state.locked if state is not None else t.locked
+                if not locked:
                     ids.append(tid)
                     t.delete()
 
+        if scene is not None:
+            with self.lock:
+                for tid in ids:
+                    scene.remove(tid)
+
         if len(ids) > 0:
             # broadcast delete
             self.broadcast({
@@ -822,6 +926,9 @@ class GameCache:
 
         scene_id = data['scene']
 
+        # make sure the database holds the latest token data
+        self.flush()
+
         # query game
         now = time.time()
         with db_session:
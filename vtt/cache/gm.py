@@ -8,15 +8,20 @@ License: MIT (see LICENSE for details)
 __author__ = 'Christian Glöckner'
 __licence__ = 'MIT'
 
+import time
+
+import gevent
 from gevent import lock
 
 from vtt.orm.register import db_session, create_gm_database
 from .game import GameCache
+from .writer import WriteBehindQueue
 
 
 class GmCache:
     """ Thread-safe GM dict using game-url as key.
-    Holds GM-databases.
+    Holds GM-databases. Both the database and the games are loaded on
+    first access and can be unloaded again once they became idle.
     """
 
     def __init__(self, engine: any, gm: any) -> None:
@@ -27,25 +32,37 @@ class GmCache:
         self.engine = engine
         self.lock = lock.RLock()
         self.url = gm.url
-        self.games = dict()
-        self.db = None  # needs connect_db to be run (but outside a db_session)
+        self.games = dict()  # loaded games only
+        self.database = None  # connected on first access (see db)
+        self.writer = WriteBehindQueue(engine, self)  # batches token updates
+        self.last_access = time.time()
 
         # self.engine.logging.info('GmCache {0} with {0} created'.format(self.url, self.db_path))
 
+    @property
+    def db(self):
+        """ GM's database, which is connected on first access. """
+        self.last_access = time.time()
+        if self.database is None:
+            self.connect_db()
+        return self.database
+
     def connect_db(self):
-        # connect to GM's database
-        self.db = create_gm_database(self.engine, str(self.db_path))
+        with self.lock:
+            if self.database is not None:
+                return
 
-        # add all existing games to the cache
-        with db_session:
-            for game in self.db.Game.select():
-                self.insert(game)
-                # reorder scenes by ID if necessary
-                if game.order == list():
-                    game.reorder_scenes()
+            # @NOTE: creating a database is not possible from within a
+            # db_session (e.g. inside a bottle route), so it's done by
+            # another greenlet
+            tmp = gevent.spawn(create_gm_database, self.engine, str(self.db_path))
+            self.database = tmp.get()
 
         # self.engine.logging.info('GmCache {0} with {0} loaded'.format(self.url, self.db_path))
 
+    def is_loaded(self) -> bool:
+        return self.database is not None
+
     # --- cache implementation ----------------------------------------
 
     def insert(self, game):
@@ -57,16 +74,64 @@ class GmCache:
             self.games[url] = GameCache(self.engine, self, game)
             return self.games[url]
 
+    def load(self, game: any) -> any:
+        """ Return the game's cache and create it if necessary. """
+        with self.lock:
+            game_cache = self.games.get(game.url)
+            if game_cache is None:
+                game_cache = self.insert(game)
+                # reorder scenes by ID if necessary
+                if game.order == list():
+                    game.reorder_scenes()
+            game_cache.last_access = time.time()
+            return game_cache
+
     def get(self, game: any) -> str:
         return self.get_from_url(game.url)
 
     def get_from_url(self, url: str) -> str | None:
+        """ Return the game's cache, the game is loaded if necessary. """
         with self.lock:
-            try:
-                return self.games[url]
-            except KeyError:
-                return None
+            game_cache = self.games.get(url)
+            if game_cache is not None:
+                game_cache.last_access = time.time()
+                return game_cache
+
+            with db_session:
+                game = self.db.Game.select(lambda g: g.url == url).first()
+                if game is None:
+                    return None
+                return self.load(game)
+
+    def get_loaded(self, url: str) -> any:
+        """ Return the game's cache without loading it. """
+        with self.lock:
+            return self.games.get(url)
 
     def remove(self, game: any) -> None:
         with self.lock:
             del self.games[game.url]
+
+    # --- idle eviction -----------------------------------------------
+
+    def evict_idle(self, now: float, timeout: int) -> int:
+        """ Unload all games without players which were not accessed within
+        the timeout. The database is closed as well once all games were
+        unloaded. Returns the number of unloaded games.
+        """
+        with self.lock:
+            idle = [url for url, game_cache in self.games.items()
+                    if len(game_cache.players) == 0 and now - game_cache.last_access >= timeout]
+            for url in idle:
+                del self.games[url]
+                with self.engine.locks[self.url]:
+                    self.engine.checksums.pop(f'{self.url}/{url}', None)
+                    self.engine.checksum_indices.pop(f'{self.url}/{url}', None)
+                    self.engine.next_ids.pop(f'{self.url}/{url}', None)
+
+            if self.database is not None and len(self.games) == 0 and now - self.last_access >= timeout:
+                # write back pending changes before closing the database
+                self.writer.flush()
+                self.database = None
+
+        return len(idle)
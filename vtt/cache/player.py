@@ -15,7 +15,9 @@ import uuid
 import flag
 import gevent
 from bottle import request
-from gevent import lock
+from gevent import lock, queue
+
+from vtt.server import OutgoingMessage, decode_message
 
 
 class PlayerCache:
@@ -38,19 +40,19 @@ class PlayerCache:
 
         self.greenlet = None
 
-        # fetch country flag from ip
+        # country flag is resolved from ip after the socket was accepted
         self.ip = self.engine.get_client_ip(request)
-        self.country = self.engine.get_country_from_ip(self.ip)
+        self.country = '?'
         self.agent = self.engine.get_client_agent(request)
-        # ? = localhost, 'unknown' = unittest
-        self.flag = flag.flag(self.country) if self.country not in ['?', 'unknown'] else ''
-
-        # add login to stats
-        login_data = [time.time(), self.country, self.ip, self.agent]
-        self.engine.logging.logins(json.dumps(login_data))
+        self.flag = ''
 
         self.lock = lock.RLock()
         self.socket = None
+        self.binary = False  # whether messages are sent as MessagePack
+
+        # outbound frames are sent by a separate greenlet
+        self.outbox = queue.Queue(maxsize=engine.send_queue['size'])
+        self.sender = None
 
         self.dispatch_map = {
             'PING': self.parent.on_ping,
@@ -94,17 +96,89 @@ class PlayerCache:
         # with self.lock:# note: atm deadlocking
         raw = self.socket.receive()
         if raw is not None:
-            # parse data
-            return json.loads(raw)
+            # parse data (JSON or MessagePack)
+            return decode_message(raw)
 
     def write(self, data: any):
         """ Write JSON object to socket. """
-        # dump data
-        raw = json.dumps(data)
-        # send data
-        # with self.lock: # note: atm deadlocking
-        if self.socket is not None:
-            self.socket.send(raw)
+        self.send(OutgoingMessage(data))
+
+    def send(self, message: OutgoingMessage) -> None:
+        """ Queue message to be sent to the socket. This never blocks. """
+        if self.socket is None:
+            return
+
+        try:
+            self.outbox.put_nowait(message)
+        except queue.Full:
+            self.on_overflow(message)
+            return
+
+        if self.sender is None or self.sender.dead:
+            self.sender = gevent.spawn(self.drain)
+
+    def on_overflow(self, message: OutgoingMessage) -> None:
+        """ Handle a client that cannot keep up with sending. """
+        if self.engine.send_queue['overflow'] == 'drop':
+            # drop the oldest frame
+            try:
+                self.outbox.get_nowait()
+                self.outbox.put_nowait(message)
+            except (queue.Empty, queue.Full):
+                pass
+            return
+
+        # close the socket, the client will reconnect and receive a full refresh
+        self.engine.logging.warning('Player {0} at {1}/{2} by {3} is too slow, closing socket'.format(
+            self.name, self.parent.parent.url, self.parent.url, self.ip))
+        self.close()
+
+    def drain(self) -> None:
+        """ Send all queued data to the socket. """
+        while not self.outbox.empty():
+            message = self.outbox.get_nowait()
+            socket = self.socket
+            if socket is None:
+                break
+            try:
+                # encode as negotiated
+                socket.send(message.binary if self.binary else message.text)
+            except Exception as error:
+                self.engine.logging.warning('WebSocket cannot send: {0}'.format(error))
+                self.close()
+                break
+
+    def close(self) -> None:
+        """ Close the socket and drop all queued data. """
+        while not self.outbox.empty():
+            self.outbox.get_nowait()
+        socket = self.socket
+        if socket is not None and not socket.closed:
+            try:
+                socket.close()
+            except Exception:
+                pass
+
+    def locate(self) -> None:
+        """ Resolve the country from the player's ip and broadcast it. """
+        self.country = self.engine.get_country_from_ip(self.ip)
+        # ? = localhost, 'unknown' = unittest
+        self.flag = flag.flag(self.country) if self.country not in ['?', 'unknown'] else ''
+
+        # add login to stats
+        login_data = [time.time(), self.country, self.ip, self.agent]
+        self.engine.logging.logins(json.dumps(login_data))
+
+        self.parent.broadcast({
+            'OPID': 'LOCATE',
+            'uuid': self.uuid,
+            'country': self.country,
+            'flag': self.flag
+        })
+
+    def locate_async(self) -> None:
+        """ Runs a greenlet to locate the player without delaying the login. """
+        gevent.spawn(self.locate)
 
     def fetch(self, data: dict, key: any) -> any:
         """ Try to fetch key from data or raise ProtocolError. """
@@ -0,0 +1,109 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+from vtt.orm.token import update_token
+from vtt.server import OutgoingMessage
+
+
+class TokenState:
+    """In-memory copy of a single token. """
+
+    fields = ('id', 'scene', 'url', 'posx', 'posy', 'zorder', 'size', 'rotate', 'flipx', 'locked', 'timeid', 'back',
+              'text', 'color')
+    mutable = ('posx', 'posy', 'zorder', 'size', 'rotate', 'flipx', 'locked', 'timeid', 'text', 'color')
+    __slots__ = fields + ('version',)
+
+    def __init__(self, data: dict) -> None:
+        for key in TokenState.fields:
+            setattr(self, key, data.get(key))
+        self.version = 0  # increased with every update, used by delta updates
+
+    def update(self, timeid: float, **kwargs) -> bool:
+        """ Apply the same update rules as the Token entity. """
+        return update_token(self, timeid, **kwargs)
+
+    def patch(self, timeid: float, **kwargs) -> dict | None:
+        """ Apply an update and return a delta holding the token's id, its
+        new version and all fields that actually changed (or None if the
+        update was rejected).
+        """
+        before = self.get_changes()
+        if not self.update(timeid, **kwargs):
+            return None
+        self.version += 1
+
+        delta = {'id': self.id, 'version': self.version}
+        for key, value in self.get_changes().items():
+            # @NOTE: timeid is not used by the client
+            if key != 'timeid' and before[key] != value:
+                delta[key] = value
+        return delta
+
+    def to_dict(self) -> dict:
+        data = {key: getattr(self, key) for key in TokenState.fields}
+        data['version'] = self.version
+        return data
+
+    def get_changes(self) -> dict:
+        """ Return all fields that can be updated. """
+        return {key: getattr(self, key) for key in TokenState.mutable}
+
+
+class SceneCache:
+    """Authoritative in-memory state of a game's active scene. """
+
+    def __init__(self, scene_id: int, background_id: int | None, tokens: list[dict]) -> None:
+        self.id = scene_id
+        self.background = background_id
+        self.tokens = dict()  # id => TokenState
+        self.snapshot = None  # serialized REFRESH message (dropped on changes)
+
+        for data in tokens:
+            self.add(data)
+
+    def get(self, token_id: int) -> TokenState | None:
+        return self.tokens.get(token_id)
+
+    def add(self, data: dict) -> TokenState:
+        state = TokenState(data)
+        self.tokens[state.id] = state
+        self.invalidate()
+        return state
+
+    def remove(self, token_id: int) -> None:
+        self.tokens.pop(token_id, None)
+        self.invalidate()
+        if self.background == token_id:
+            self.background = None
+
+    def select_range(self, left: int, top: int, width: int, height: int) -> list[int]:
+        """ Return ids of all non-background tokens inside the given rectangle. """
+        return [t.id for t in self.tokens.values()
+                if left <= t.posx <= left + width and top <= t.posy <= top + height and t.size != -1]
+
+    def select_since(self, since: float) -> list[TokenState]:
+        return [t for t in self.tokens.values() if t.timeid >= since]
+
+    def to_list(self) -> list[dict]:
+        return [t.to_dict() for t in self.tokens.values()]
+
+    def invalidate(self) -> None:
+        """ Drop the REFRESH snapshot after tokens were changed. """
+        self.snapshot = None
+
+    def get_snapshot(self) -> OutgoingMessage:
+        """ Return the REFRESH message, which is only serialized once per change. """
+        if self.snapshot is None:
+            self.snapshot = OutgoingMessage({
+                'OPID': 'REFRESH',
+                'tokens': self.to_list(),
+                'background': self.background
+            })
+        return self.snapshot
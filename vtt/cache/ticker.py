@@ -0,0 +1,80 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+import gevent
+from gevent import lock
+
+
+class BroadcastTicker:
+    """ Collects UPDATE and SELECT messages of a game and broadcasts them as
+    a single BATCH frame per tick. Pending token updates are merged per token
+    and selections per player (last write wins).
+    """
+
+    def __init__(self, engine: any, parent: any) -> None:
+        self.parent = parent  # GameCache to broadcast to
+        self.lock = lock.RLock()
+        self.tokens = dict()  # token id => merged token data
+        self.selects = dict()  # player uuid => latest selection message
+        self.timer = None  # greenlet waiting for the next tick
+
+        rate = engine.broadcast_tick['rate']
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.tokens) + len(self.selects)
+
+    def push_update(self, tokens: list) -> None:
+        """ Queue the given token updates for the next tick. """
+        if self.interval <= 0.0:
+            # ticks are disabled
+            self.parent.broadcast({'OPID': 'UPDATE', 'delta': True, 'tokens': tokens})
+            return
+
+        with self.lock:
+            for data in tokens:
+                pending = self.tokens.get(data['id'])
+                if pending is None:
+                    self.tokens[data['id']] = dict(data)
+                else:
+                    pending.update(data)
+        self.schedule()
+
+    def push_select(self, player: any, data: dict) -> None:
+        """ Queue the given player's selection for the next tick. """
+        if self.interval <= 0.0:
+            # ticks are disabled
+            self.parent.broadcast(data)
+            return
+
+        with self.lock:
+            self.selects[player.uuid] = data
+        self.schedule()
+
+    def schedule(self) -> None:
+        with self.lock:
+            if self.timer is None or self.timer.dead:
+                self.timer = gevent.spawn_later(self.interval, self.flush)
+
+    def flush(self) -> int:
+        """ Broadcast all pending messages and return their number. """
+        with self.lock:
+            tokens, self.tokens = self.tokens, dict()
+            selects, self.selects = self.selects, dict()
+
+        messages = list()
+        if len(tokens) > 0:
+            messages.append({'OPID': 'UPDATE', 'delta': True, 'tokens': list(tokens.values())})
+        messages.extend(selects.values())
+
+        if len(messages) > 0:
+            self.parent.broadcast({'OPID': 'BATCH', 'messages': messages})
+        return len(messages)
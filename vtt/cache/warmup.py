@@ -0,0 +1,105 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+import time
+
+from gevent import lock, pool
+
+from vtt.orm.register import db_session
+
+
+class WarmUp:
+    """ Loads all GM databases and their games ahead of time, using a bounded
+    pool of workers. The progress can be queried while it is running.
+    """
+
+    def __init__(self, engine: any, num_workers: int) -> None:
+        self.engine = engine
+        self.lock = lock.RLock()
+        self.num_workers = max(num_workers, 1)
+
+        self.state = 'idle'  # 'idle', 'running' or 'done'
+        self.total = 0  # number of GMs
+        self.num_gms = 0  # number of loaded GMs
+        self.num_games = 0  # number of loaded games
+        self.num_md5s = 0  # number of generated md5 hashes
+        self.num_failed = 0  # number of GMs that could not be loaded
+        self.started = None
+        self.elapsed = 0.0
+
+    def get_status(self) -> dict:
+        with self.lock:
+            elapsed = self.elapsed
+            if self.state == 'running':
+                elapsed = time.time() - self.started
+            return {
+                'state': self.state,
+                'gms': {
+                    'total': self.total,
+                    'loaded': self.num_gms,
+                    'failed': self.num_failed
+                },
+                'games': self.num_games,
+                'md5s': self.num_md5s,
+                'workers': self.num_workers,
+                'elapsed': elapsed
+            }
+
+    def load_gm(self, url: str) -> None:
+        """ Connect to the GM's database and load all of their games. """
+        gm_cache = self.engine.cache.get_from_url(url)
+        if gm_cache is None:
+            # @NOTE: GM was deleted in the meantime
+            return
+
+        num_games = 0
+        num_md5s = 0
+        gm_cache.connect_db()
+        with db_session:
+            for game in gm_cache.db.Game.select():
+                num_md5s += game.make_md5s()
+                gm_cache.load(game)
+                num_games += 1
+
+        with self.lock:
+            self.num_gms += 1
+            self.num_games += num_games
+            self.num_md5s += num_md5s
+            done = self.num_gms + self.num_failed
+        self.engine.logging.info('Warmed up GM {0}/{1} #{2} with {3} games'.format(done, self.total, url, num_games))
+
+    def load_gm_safe(self, url: str) -> None:
+        try:
+            self.load_gm(url)
+        except Exception as error:
+            with self.lock:
+                self.num_failed += 1
+            self.engine.logging.error('Cannot warm up GM #{0}: {1}'.format(url, error))
+
+    def run(self) -> None:
+        """ Load all GMs and block until done. """
+        with self.engine.cache.lock:
+            urls = list(self.engine.cache.gms)
+
+        with self.lock:
+            self.state = 'running'
+            self.total = len(urls)
+            self.started = time.time()
+        self.engine.logging.info('Warming up {0} GMs using {1} workers'.format(len(urls), self.num_workers))
+
+        workers = pool.Pool(self.num_workers)
+        for _ in workers.imap_unordered(self.load_gm_safe, urls):
+            pass
+
+        with self.lock:
+            self.state = 'done'
+            self.elapsed = time.time() - self.started
+        self.engine.logging.info('Warm-up of {0} GMs with {1} games done after {2:.2f}s ({3} MD5 hashes generated)'.format(
+            self.num_gms, self.num_games, self.elapsed, self.num_md5s))
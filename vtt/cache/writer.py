@@ -0,0 +1,94 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+import gevent
+from gevent import lock
+
+from vtt.orm.register import db_session
+
+
+class WriteBehindQueue:
+    """ Collects token updates of all games of a GM and writes them back to
+    the GM's database within a single transaction. Repeated updates of the
+    same token are coalesced (last write wins).
+    """
+
+    def __init__(self, engine: any, parent: any) -> None:
+        self.engine = engine
+        self.parent = parent  # GmCache holding the database
+        self.lock = lock.RLock()
+        self.tokens = dict()  # token id => latest token data
+        self.games = dict()  # game url => latest activity
+        self.timer = None  # greenlet waiting for the next flush
+
+        self.interval = engine.write_behind['interval'] / 1000.0
+        self.max_changes = engine.write_behind['changes']
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.tokens)
+
+    def push_token(self, token_id: int, data: dict) -> None:
+        """ Queue the given token data for write-back. """
+        with self.lock:
+            self.tokens[token_id] = data
+            full = len(self.tokens) >= self.max_changes
+        self.schedule(immediately=full)
+
+    def push_game(self, url: str, timeid: float) -> None:
+        """ Queue the given game's latest activity for write-back. """
+        with self.lock:
+            self.games[url] = timeid
+        self.schedule()
+
+    def schedule(self, immediately: bool = False) -> None:
+        """ Flush once the interval elapsed or right now if requested. """
+        if self.interval <= 0.0:
+            # write-behind is disabled
+            self.flush()
+            return
+
+        with self.lock:
+            if immediately:
+                gevent.spawn(self.flush_async)
+            elif self.timer is None or self.timer.dead:
+                self.timer = gevent.spawn_later(self.interval, self.flush_async)
+
+    def flush_async(self) -> None:
+        try:
+            self.flush()
+        except Exception as error:
+            self.engine.logging.error('Cannot write back GM {0}: {1}'.format(self.parent.url, error))
+
+    def flush(self) -> int:
+        """ Write all queued data back and return the number of tokens. """
+        with self.lock:
+            tokens, self.tokens = self.tokens, dict()
+            games, self.games = self.games, dict()
+
+        if len(tokens) == 0 and len(games) == 0:
+            return 0
+
+        db = self.parent.db
+        with db_session:
+            for url, timeid in games.items():
+                g = db.Game.select(lambda g: g.url == url).first()
+                if g is not None:
+                    g.timeid = timeid
+
+            for token_id, data in tokens.items():
+                t = db.Token.select(lambda t: t.id == token_id).first()
+                if t is None:
+                    # ignore deleted token
+                    continue
+                for key in data:
+                    setattr(t, key, data[key])
+
+        return len(tokens)
@@ -7,38 +7,116 @@ Copyright (c) 2020-2022 Christian Glöckner
 License: MIT (see LICENSE for details)
 """
 
-import threading, time, datetime
+import threading, time, datetime, json, os
 
 
 __author__ = 'Christian Glöckner'
 __licence__ = 'MIT'
 
 
+class CleanupCursor(object):
+    """ Progress of a running cleanup. It is persisted after each GM, so a
+    restarted server resumes the cleanup where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.now = None  # reference time of the running cleanup (None if not running)
+        self.gm_id = 0  # id of the latest processed GM
+        self.report = None  # results so far
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as handle:
+                data = json.load(handle)
+            self.now = data['now']
+            self.gm_id = data['gm_id']
+            self.report = data['report']
+        except (ValueError, KeyError):
+            # @NOTE: partially written file, so the cleanup starts over
+            self.now = None
+
+    def save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as handle:
+            json.dump({'now': self.now, 'gm_id': self.gm_id, 'report': self.report}, handle)
+        os.replace(tmp_path, self.path)
+
+    def is_running(self):
+        return self.now is not None
+
+    def start(self, now, report):
+        self.now = now
+        self.gm_id = 0
+        self.report = report
+        self.report['slices'] = list()
+        self.report['time'] = 0.0
+        self.save()
+
+    def finish(self):
+        self.now = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
 class CleanupThread(object):
 
-    def __init__(self, engine):
+    def __init__(self, engine, start=True):
         self.engine = engine
-        
-        self.worker = threading.Thread(target=self.run)
-        self.worker.setDaemon(True)
-        self.worker.start()
+        self.cursor = CleanupCursor(engine.paths.get_cleanup_path())
+
+        if start:
+            self.worker = threading.Thread(target=self.run)
+            self.worker.setDaemon(True)
+            self.worker.start()
+
+    def run_slice(self):
+        """ Cleanup GMs until the slice's time is up (at least one GM).
+        Returns whether all GMs were processed.
+        """
+        start = time.time()
+        num_gms = 0
+        done = False
+        while True:
+            gm_id = self.engine.get_next_gm_id(self.cursor.gm_id)
+            if gm_id is None:
+                done = True
+                break
+
+            self.engine.cleanup_gm(gm_id, self.cursor.now, self.cursor.report)
+            self.cursor.gm_id = gm_id
+            num_gms += 1
+            self.cursor.save()
+
+            if time.time() - start >= self.engine.cleanup['slice']:
+                break
+
+        delta = time.time() - start
+        self.cursor.report['slices'].append({'gms': num_gms, 'time': delta})
+        self.cursor.report['time'] += delta
+        self.cursor.save()
+        return done
 
     def cleanup(self):
+        # start cleanup unless resuming an interrupted one
+        if self.cursor.is_running():
+            self.engine.logging.info('Resuming cleanup after GM #{0}'.format(self.cursor.gm_id))
+        else:
+            self.cursor.start(time.time(), self.engine.get_cleanup_report())
+
         # cleanup and measure time
+        while not self.run_slice():
+            # give live games some time
+            time.sleep(self.engine.cleanup['pause'])
         start = time.time()
-        gms, games, num_zips, num_bytes, num_rolls, num_tokens, num_md5s = self.engine.cleanup_all()
-        delta = time.time() - start
-        
-        results = {
-            'gms'    : gms,
-            'games'  : games,
-            'zips'   : num_zips,
-            'bytes'  : num_bytes,
-            'rolls'  : num_rolls,
-            'tokens' : num_tokens,
-            'md5s'   : num_md5s,
-            'time'   : delta
-        }
+        self.engine.cleanup_exports(self.cursor.report)
+        self.cursor.report['time'] += time.time() - start
+
+        results = self.cursor.report
+        self.cursor.finish()
 
         # notify about cleanup results
         if self.engine.notify_api is None:
@@ -46,7 +124,7 @@ class CleanupThread(object):
         else:
             self.engine.notify_api.on_cleanup(results)
 
-    def getNextUpdate(self):      
+    def getNextUpdate(self):
         h, m   = self.engine.cleanup['daytime'].split(':')
         now    = datetime.datetime.today()
         future = datetime.datetime(now.year, now.month, now.day, int(h), int(m))
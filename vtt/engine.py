@@ -21,6 +21,8 @@ import time
 import uuid
 
 import bottle
+import gevent
+import gevent.threadpool
 import atomicx
 
 import vtt.utils as utils
@@ -53,6 +55,8 @@ class Engine(object):
 
         # setup per-game stuff
         self.checksums = dict()
+        self.checksum_indices = dict()  # game url => persistent md5 index
+        self.next_ids = dict()  # game url => next image id
         self.locks = dict()
         
         # webserver stuff
@@ -78,6 +82,38 @@ class Engine(object):
             "music"      : int(os.getenv('VTT_LIMIT_MUSIC', 10)),
             "num_music"  : int(os.getenv('VTT_NUM_MUSIC', 5))
         }
+
+        # maximum edge of uploaded images in pixels (0 = keep original size),
+        # larger images are downscaled and re-encoded using the given format
+        self.image_limit = {
+            "token"      : int(os.getenv('VTT_MAX_EDGE_TOKEN', 0)),
+            "background" : int(os.getenv('VTT_MAX_EDGE_BG', 0)),
+            "format"     : os.getenv('VTT_IMAGE_FORMAT', 'WEBP')
+        }
+        # downscaled variants of images that clients can request (max edge in pixels)
+        self.image_variants = [int(size) for size in os.getenv('VTT_IMAGE_VARIANTS', '64,128,256,1024').split(',')
+                               if size.strip() != '']
+        # SQLite settings applied to every database connection (see https://www.sqlite.org/pragma.html),
+        # WAL with NORMAL sync is durable against application crashes and avoids a sync per commit
+        self.sqlite = {
+            "journal_mode" : os.getenv('VTT_SQLITE_JOURNAL_MODE', 'WAL'),
+            "synchronous"  : os.getenv('VTT_SQLITE_SYNCHRONOUS', 'NORMAL'),
+            "mmap_size"    : int(os.getenv('VTT_SQLITE_MMAP_SIZE', 64 * 1024 * 1024)),  # in bytes
+            "cache_size"   : int(os.getenv('VTT_SQLITE_CACHE_SIZE', -8 * 1024)),  # in pages or KiB if negative
+            "busy_timeout" : int(os.getenv('VTT_SQLITE_BUSY_TIMEOUT', 5000))  # in ms
+        }
+        # how long browsers may cache images without revalidation (in seconds), they are
+        # content-addressed so their urls never refer to another image
+        self.asset_cache = {
+            "max_age" : int(os.getenv('VTT_ASSET_MAX_AGE', 31536000))
+        }
+        # scene thumbnails (max edge in pixels), composite scene previews (width in pixels) and how long
+        # browsers may use them without revalidation
+        self.thumbnails = {
+            "size"    : int(os.getenv('VTT_THUMBNAIL_SIZE', 256)),
+            "preview" : int(os.getenv('VTT_PREVIEW_WIDTH', 320)),
+            "max_age" : int(os.getenv('VTT_THUMBNAIL_MAX_AGE', 60))
+        }
         self.playercolors = ['#FF0000', '#00FF00', '#0000FF', '#FFFF00', '#FF00FF', "#C52828", "#13AA4F", "#ECBC15", "#7F99C7", "#9251B7", "#797A90", "#80533F", "#21A0B7"]
         
         self.title = os.getenv('VTT_TITLE', appname)
@@ -101,13 +137,66 @@ class Engine(object):
                     'url': value
                 })
         
+        # the cleanup processes GMs in time-boxed slices (in seconds) and pauses between them
         self.cleanup = {
             'expire':  int(os.getenv('VTT_CLEANUP_EXPIRE', 2592000)),
-            'daytime': os.getenv('VTT_CLEANUP_TIME', '03:00')
+            'daytime': os.getenv('VTT_CLEANUP_TIME', '03:00'),
+            'slice':   float(os.getenv('VTT_CLEANUP_SLICE', 0.5)),
+            'pause':   float(os.getenv('VTT_CLEANUP_PAUSE', 0.5))
+        }
+
+        # write-behind of token updates (interval in ms, 0 = write-through)
+        self.write_behind = {
+            'interval': int(os.getenv('VTT_FLUSH_INTERVAL', 500)),
+            'changes':  int(os.getenv('VTT_FLUSH_CHANGES', 200))
         }
 
+        # outbound queue per player (frames) and overflow policy ('close' or 'drop')
+        self.send_queue = {
+            'size':     int(os.getenv('VTT_SEND_QUEUE', 256)),
+            'overflow': os.getenv('VTT_SEND_OVERFLOW', 'close')
+        }
+
+        # minimum size of websocket messages to be compressed (0 = disabled)
+        self.compression = {
+            'threshold': int(os.getenv('VTT_COMPRESS_THRESHOLD', 0))
+        }
+
+        # broadcast ticks per second (0 = broadcast immediately)
+        self.broadcast_tick = {
+            'rate': int(os.getenv('VTT_TICK_RATE', 0))
+        }
+
+        # offline database of IP ranges (CSV) and number of cached IPs
+        self.geoip = {
+            'database': os.getenv('VTT_GEOIP_DB', ''),
+            'cache':    int(os.getenv('VTT_GEOIP_CACHE', 4096))
+        }
+
+        # unload games and GM databases after being idle for some seconds
+        # (0 = keep loaded), checked every interval seconds
+        self.eviction = {
+            'timeout':  int(os.getenv('VTT_IDLE_TIMEOUT', 1800)),
+            'interval': int(os.getenv('VTT_IDLE_INTERVAL', 60))
+        }
+
+        # number of workers loading all GMs and games at startup (0 = load on demand)
+        self.warmup = {
+            'workers': int(os.getenv('VTT_WARMUP_WORKERS', 0))
+        }
+
+        # number of native threads for blocking maintenance work like cleanup, zip export and md5 hashing
+        # (0 = run on the event loop)
+        self.maintenance = {
+            'threads': int(os.getenv('VTT_MAINTENANCE_THREADS', 2))
+        }
+        self.threadpool = None
+        if self.maintenance['threads'] > 0:
+            self.threadpool = gevent.threadpool.ThreadPool(self.maintenance['threads'])
+
         self.notify_api = None # notify api instance
         self.login_api = None   # login api instance
+        self.country_resolver = None  # resolves player locations
         self.cache = None   # later engine cache
 
         # handle commandline arguments
@@ -129,6 +218,14 @@ class Engine(object):
         )
         
         self.logging.info(f'Started Modes: {sys.argv}')
+
+        # setup country lookup
+        if self.geoip['database'] != '':
+            resolver = utils.RangeResolver(pathlib.Path(self.geoip['database']))
+            self.logging.info(f'Loaded {len(resolver)} IP ranges from {self.geoip["database"]}')
+        else:
+            resolver = utils.IpApiResolver(on_error=self.logging.warning)
+        self.country_resolver = utils.CachedResolver(resolver, self.geoip['cache'])
         
         # load fancy url generator api ... lol
         self.url_generator = utils.FancyUrlApi(self.paths)
@@ -258,13 +355,23 @@ class Engine(object):
         if self.notify_api is not None:
             self.notify_api.on_start()
 
-        bottle.run(
-            host       = self.listen,
-            port       = self.hosting['port'],
-            debug      = self.debug,
-            quiet      = self.quiet,
-            server     = VttServer,
-        )
+        if self.warmup['workers'] > 0:
+            gevent.spawn(self.cache.warmup.run)
+        if self.eviction['timeout'] > 0:
+            gevent.spawn(self.cache.run_eviction)
+
+        try:
+            bottle.run(
+                host       = self.listen,
+                port       = self.hosting['port'],
+                debug      = self.debug,
+                quiet      = self.quiet,
+                server     = VttServer,
+                compress_threshold = self.compression['threshold'],
+            )
+        finally:
+            # write back pending token updates
+            self.cache.flush()
         
     def get_domain(self):
         if self.localhost:
@@ -336,16 +443,8 @@ class Engine(object):
     def get_client_agent(self, request):
         return request.environ.get('HTTP_USER_AGENT')
         
-    def get_country_from_ip(self, ip, timeout=3):
-        result = '?' # fallback case
-        try:
-            html = requests.get('http://ip-api.com/json/{0}'.format(ip), timeout=timeout)
-            d = json.loads(html.text)
-            if 'countryCode' in d:
-                result = d['countryCode'].lower()
-        except requests.exceptions.ReadTimeout as e:
-            self.logging.warning('Cannot query location of IP {0}'.format(ip))
-        return result
+    def get_country_from_ip(self, ip):
+        return self.country_resolver.resolve(ip)
         
     def get_public_ip(self):
         try:
@@ -378,6 +477,15 @@ class Engine(object):
         if self.notify_api is not None:
             self.notify_api.on_error(error_id, message)
 
+    def offload(self, func, *args):
+        """ Run blocking work in a native worker thread and return its result.
+        Only the calling greenlet waits, while the event loop keeps serving
+        all players. The work must not touch the databases or the caches.
+        """
+        if self.threadpool is None:
+            return func(*args)
+        return self.threadpool.apply(func, args)
+
     @staticmethod
     def get_md5(handle):
         hash_md5 = hashlib.md5()
@@ -389,59 +497,89 @@ class Engine(object):
         return hash_md5.hexdigest()
         
     def get_size(self, file_upload):
-        """ Determine size of a file upload.
+        """ Determine size of a file upload without reading it.
         """
         offset = file_upload.file.tell()
-        size = len(file_upload.file.read())
+        size = file_upload.file.seek(0, os.SEEK_END) - offset
         file_upload.file.seek(offset)
         return size
         
     def get_supported_dice(self):
         return [2, 4, 6, 8, 10, 12, 20, 100]
         
-    def cleanup_all(self):
-        """ Deletes all export games' zip files, unused images and
-        outdated dice roll results from all games.
-        Inactive games or even GMs are deleted
-        (see engine.cleanup['expire']).
-        """
-        now = time.time()
-        gms   = list()
-        games = list()
-        num_bytes  = 0
-        num_rolls  = 0
-        num_tokens = 0
-        num_md5s   = 0
-        
+    @staticmethod
+    def get_cleanup_report() -> dict:
+        return {
+            'gms':    list(),  # removed GMs
+            'games':  list(),  # removed games
+            'zips':   0,
+            'bytes':  0,
+            'rolls':  0,
+            'tokens': 0,
+            'md5s':   0
+        }
+
+    def get_next_gm_id(self, gm_id: int) -> int | None:
+        """ Return the id of the GM following the given one (or None). """
         with db_session:
-            for gm in self.main_db.GM.select():
-                gm_cache = self.cache.get(gm)
-
-                # check if GM expired
-                if gm.has_expired(now, gm_cache.db):
-                    # remove expired GM
-                    num_bytes += gm.pre_delete()
-                    gms.append(gm.url)
-                    gm.delete()
-                    continue
+            gm = self.main_db.GM.select(lambda g: g.id > gm_id).order_by(lambda g: g.id).first()
+            return gm.id if gm is not None else None
 
-                # cleanup GM's games
-                g, b, r, t, m = gm.cleanup(gm_cache.db, now)
-                games.extend(g)
-                num_bytes  += b
-                num_rolls  += r
-                num_tokens += t
-                num_md5s   += m
-        
-        # remove all exported games' zip files
+    def cleanup_gm(self, gm_id: int, now: float, report: dict) -> None:
+        """ Delete unused images and outdated dice roll results of the GM's
+        games and add the results to the report. Inactive games or even the
+        GM are deleted (see engine.cleanup['expire']).
+        """
+        with db_session:
+            gm = self.main_db.GM.get(id=gm_id)
+            if gm is None:
+                # @NOTE: GM was deleted in the meantime
+                return
+            gm_cache = self.cache.get(gm)
+
+            # check if GM expired
+            if gm.has_expired(now, gm_cache.db):
+                # remove expired GM
+                report['bytes'] += gm.pre_delete()
+                report['gms'].append(gm.url)
+                gm.delete()
+                return
+
+            # cleanup GM's games
+            g, b, r, t, m = gm.cleanup(gm_cache.db, now)
+            report['games'].extend(g)
+            report['bytes']  += b
+            report['rolls']  += r
+            report['tokens'] += t
+            report['md5s']   += m
+
+    def cleanup_exports(self, report: dict) -> None:
+        """ Delete all exported games' zip files and add the results to the report. """
         export_path = self.paths.get_export_path()
         num_zips = len(os.listdir(export_path))
         if num_zips > 0:
-            num_bytes += os.path.getsize(export_path)
+            report['zips']  += num_zips
+            report['bytes'] += os.path.getsize(export_path)
             shutil.rmtree(export_path)
             self.paths.ensure(export_path)
 
-        return gms, games, num_zips, num_bytes, num_rolls, num_tokens, num_md5s
+    def cleanup_all(self):
+        """ Deletes all export games' zip files, unused images and
+        outdated dice roll results from all games at once.
+        Inactive games or even GMs are deleted
+        (see engine.cleanup['expire']).
+        """
+        now = time.time()
+        report = self.get_cleanup_report()
+
+        gm_id = self.get_next_gm_id(0)
+        while gm_id is not None:
+            self.cleanup_gm(gm_id, now, report)
+            gm_id = self.get_next_gm_id(gm_id)
+        self.cleanup_exports(report)
+
+        return (report['gms'], report['games'], report['zips'], report['bytes'], report['rolls'], report['tokens'],
+                report['md5s'])
 
     def save_to_dict(self):
         """ Export all GMs and their games (including scenes and tokens)
@@ -18,15 +18,67 @@ import pathlib
 import typing
 
 import bottle
-from PIL import Image, UnidentifiedImageError
 from pony.orm import *
 
+from vtt.utils.checksum_index import ChecksumIndex
+from vtt.utils.checksum_map import ChecksumMap
+from vtt.utils.ingest import ingest_image, normalize_image
 from .gm import BaseGm
 
 
 CleanupReport = tuple[int, int, int, int]
 
 
+# @NOTE: the following functions only do file IO, so they can be run by the engine's worker threads
+
+def find_files(root: pathlib.Path, predicate: typing.Callable[[str], bool]) -> list[pathlib.Path]:
+    """ Return all files inside the directory whose names match the predicate. """
+    if not root.exists():
+        return list()
+    with os.scandir(root) as it:
+        return [root / entry.name for entry in it if entry.is_file() and predicate(entry.name)]
+
+
+def remove_files(paths: typing.Iterable[pathlib.Path]) -> int:
+    """ Remove all existing files and return their total size in bytes. """
+    num_bytes = 0
+    for path in paths:
+        if os.path.exists(path):
+            num_bytes += os.path.getsize(path)
+            os.remove(path)
+    return num_bytes
+
+
+def find_abandoned_images(root: pathlib.Path, used: set[str], keep: str) -> tuple[list[str], int]:
+    """ Return the paths of all images inside the directory that are neither
+    used nor kept, and their total size in bytes.
+    """
+    abandoned = list()
+    num_bytes = 0
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.name.endswith('.png') and entry.name != keep and entry.name not in used:
+                abandoned.append(os.path.join(root, entry.name))
+                num_bytes += entry.stat().st_size
+    return abandoned, num_bytes
+
+
+def write_zip(path: pathlib.Path, data: dict, root: pathlib.Path) -> None:
+    """ Write the game's data and all of its images to a zip file. """
+    with zipfile.ZipFile(path, "w") as h:
+        # create temporary file and add it to the zip
+        with tempfile.NamedTemporaryFile() as tmp:
+            s = json.dumps(data, indent=4)
+            tmp.write(s.encode('utf-8'))
+            tmp.seek(0)  # rewind!
+            h.write(tmp.name, 'game.json')
+
+        # add images to the zip, too
+        for img in os.listdir(root):
+            if img.endswith('.png'):
+                h.write(root / img, img)
+
+
 def register(engine: any, db: Database):
 
     class Game(db.Entity):
@@ -49,54 +101,47 @@ def register(engine: any, db: Database):
         def get_url(self) -> str:
             return f'{self.gm_url}/{self.url}'
 
+        def get_md5_index(self) -> ChecksumIndex:
+            """Note: needs to be called from a threadsafe context."""
+            index = engine.checksum_indices.get(self.get_url())
+            if index is None:
+                index = ChecksumIndex(engine.paths.get_md5_path(self.gm_url, self.url))
+                engine.checksum_indices[self.get_url()] = index
+            return index
+
         def make_md5s(self) -> int:
-            md5_path = engine.paths.get_md5_path(self.gm_url, self.url)
+            """ Update the md5 hashes of all new or modified images. """
             root = engine.paths.get_game_path(self.gm_url, self.url)
-            all_images = self.get_all_images()
-
-            # load md5 hashes from json-file
-            data = dict()
-            if os.path.exists(md5_path):
-                with open(md5_path, 'r') as handle:
-                    data = json.load(handle)
-
-            # check if image exists for all md5 hashes
-            for md5 in data.copy():
-                filename = '{0}.png'.format(data[md5])
-                if not os.path.exists(root / filename):
-                    del data[md5]
-
-            # check for images without md5
-            missing = list()
-            for filename in all_images:
-                filename_id = int(filename.split('.')[0])
-                if filename_id not in data.values():
-                    missing.append(filename)
-
-            # create missing md5 hashes
-            for filename in missing:
-                # create md5 of file (assumed to be images)
-                with open(root / filename, "rb") as handle:
-                    md5 = engine.get_md5(handle)
-                    data[md5] = int(filename.split('.')[0])
-            engine.checksums[self.get_url()] = data
-
-            # save md5 hashes to json-file
-            with open(md5_path, 'w') as handle:
-                json.dump(data, handle)
-
-            return len(missing)
+            with engine.locks[self.gm_url]:  # make IO access safe
+                index = self.get_md5_index()
+                num_hashed = engine.offload(index.verify, root, engine.get_md5)
+                checksums = engine.checksums.get(self.get_url())
+                if checksums is None:
+                    engine.checksums[self.get_url()] = ChecksumMap(index.get_checksums())
+                else:
+                    checksums.reset(index.get_checksums())
+
+            return num_hashed
+
+        def get_checksums(self) -> ChecksumMap:
+            """ Return the game's md5 hashes, which are loaded if necessary. """
+            if self.get_url() not in engine.checksums:
+                self.make_md5s()
+            return engine.checksums[self.get_url()]
 
         def get_id_by_md5(self, md5: str) -> int | None:
-            return engine.checksums[self.get_url()].get(md5, None)
+            return self.get_checksums().get(md5, None)
+
+        def add_md5(self, md5: str, img_id: int):
+            """Note: needs to be called from a threadsafe context."""
+            self.get_checksums().add(md5, img_id)
+            local_path = engine.paths.get_game_path(self.gm_url, self.url) / f'{img_id}.png'
+            self.get_md5_index().add(img_id, md5, local_path)
 
         def remove_md5(self, img_id: int):
-            cache = engine.checksums[self.get_url()]
-            # linear search for image hash
-            for k, v in cache.items():
-                if v == img_id:
-                    del cache[k]
-                    return
+            with engine.locks[self.gm_url]:  # make IO access safe
+                self.get_md5_index().remove(img_id)
+                self.get_checksums().remove_id(img_id)
 
         def post_setup(self):
             """ Adds the game's directory and prepare the md5 cache."""
@@ -126,8 +171,9 @@ def register(engine: any, db: Database):
             root = engine.paths.get_game_path(self.gm_url, self.url)
             return [f for f in os.listdir(root) if f.endswith('.png')]
 
-        def get_next_id(self) -> int:
-            """Note: needs to be called from a threadsafe context."""
+        def seed_next_id(self) -> int:
+            """ Determine the next image id from the images on disk.
+            Note: needs to be called from a threadsafe context."""
             max_id = 0
             filenames = self.get_all_images()
 
@@ -137,8 +183,43 @@ def register(engine: any, db: Database):
             if len(filenames) > 0:
                 last_png = max(filenames, key=split)
                 max_id = split(last_png) + 1
+            self.save_next_id(max_id)
             return max_id
 
+        def save_next_id(self, next_id: int) -> None:
+            """Note: needs to be called from a threadsafe context."""
+            engine.next_ids[self.get_url()] = next_id
+            path = engine.paths.get_next_id_path(self.gm_url, self.url)
+            tmp_path = path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as handle:
+                handle.write(str(next_id))
+            os.replace(tmp_path, path)
+
+        def peek_next_id(self) -> int:
+            """ Return the next image id without handing it out. """
+            with engine.locks[self.gm_url]:  # make IO access safe
+                next_id = engine.next_ids.get(self.get_url())
+                if next_id is not None:
+                    return next_id
+
+                # load persisted counter or seed it once from disk
+                path = engine.paths.get_next_id_path(self.gm_url, self.url)
+                try:
+                    with open(path, 'r') as handle:
+                        next_id = int(handle.read())
+                except (FileNotFoundError, ValueError):
+                    return self.seed_next_id()
+
+                engine.next_ids[self.get_url()] = next_id
+                return next_id
+
+        def get_next_id(self) -> int:
+            """ Hand out the next image id. Ids are never reused. """
+            with engine.locks[self.gm_url]:  # make IO access safe
+                next_id = self.peek_next_id()
+                self.save_next_id(next_id + 1)
+                return next_id
+
         def get_image_url(self, image_id: int) -> str:
             return f'/asset/{self.gm_url}/{self.url}/{image_id}.png'
 
@@ -148,79 +229,75 @@ def register(engine: any, db: Database):
             local_path = os.path.join(game_root, img_filename)
             return os.path.getsize(local_path)
 
-        def upload(self, handle: bottle.FileUpload) -> str | None:
-            """Save the given image via file handle and return the url to the image."""
-            suffix = '.{0}'.format(handle.filename.split(".")[-1])
-            with tempfile.NamedTemporaryFile(suffix=suffix) as tmp_file:
-                # save image to temporary file
-                handle.save(tmp_file.name, overwrite=True)
-
-                # check file format
-                try:
-                    Image.open(tmp_file.name)
-                except UnidentifiedImageError:
-                    # unsupported file format
-                    return None
+        def upload(self, handle: bottle.FileUpload, max_size: int | None = None, background: bool = True) -> str | None:
+            """Stream the given image into the game's directory and return the url to the image.
+            Returns None if the file is no image or exceeds max_size bytes (background limit by default).
+            Oversized images are downscaled, but remain mapped by the md5 of the uploaded file."""
+            if max_size is None:
+                max_size = engine.file_limit['background'] * 1024 * 1024
 
-                # create md5 checksum for duplication test
-                new_md5 = engine.get_md5(tmp_file.file)
-
-                game_root = engine.paths.get_game_path(self.gm_url, self.url)
-                image_id = self.get_next_id()
-                local_path = game_root / f'{image_id}.png'
-                with engine.locks[self.gm_url]:  # make IO access safe
-                    if new_md5 not in engine.checksums[self.get_url()]:
-                        # copy image to target
-                        shutil.copyfile(tmp_file.name, local_path)
-
-                        # store pair: checksum => image_id
-                        engine.checksums[self.get_url()][new_md5] = image_id
-
-                # fetch remote path (query image_id via by checksum)
-                remote_path = self.get_image_url(engine.checksums[self.get_url()][new_md5])
-
-                # assure image file exists
-                img_id = int(remote_path.split('/')[-1].split('.png')[0])
-                local_path = game_root / f'{img_id}.png'
-                with engine.locks[self.gm_url]:  # make IO access safe
-                    if not os.path.exists(local_path):
-                        # copy image to target
-                        shutil.copyfile(tmp_file.name, local_path)
+            # save image while hashing it
+            game_root = engine.paths.get_game_path(self.gm_url, self.url)
+            result = ingest_image(handle.file, game_root, max_size)
+            if result is None:
+                # unsupported file format or too large
+                return None
+            tmp_path, new_md5, _ = result
 
-                        engine.logging.warning('Image got re-uploaded to fix a cache error')
-                        if engine.notify_api is not None:
-                            engine.notify_api(remote_path,
-                                              f'Image got re-uploaded to fix a cache error:\n {remote_path}')
+            max_edge = engine.image_limit['background' if background else 'token']
+            try:
+                normalize_image(tmp_path, max_edge, engine.image_limit['format'])
+            except (OSError, ValueError) as error:
+                # keep the original image
+                engine.logging.warning(f'Cannot normalize image upload: {error}')
 
-                return remote_path
+            fixed = False
+            with engine.locks[self.gm_url]:  # make IO access safe
+                image_id = self.get_id_by_md5(new_md5)
+                if image_id is None:
+                    # move image into place and store pair: checksum => image_id
+                    image_id = self.get_next_id()
+                    os.replace(tmp_path, game_root / f'{image_id}.png')
+                    self.add_md5(new_md5, image_id)
+
+                elif not os.path.exists(game_root / f'{image_id}.png'):
+                    # assure image file exists
+                    os.replace(tmp_path, game_root / f'{image_id}.png')
+                    self.add_md5(new_md5, image_id)
+                    fixed = True
+
+                else:
+                    # image is already known
+                    os.remove(tmp_path)
+
+            remote_path = self.get_image_url(image_id)
+            if fixed:
+                engine.logging.warning('Image got re-uploaded to fix a cache error')
+                if engine.notify_api is not None:
+                    engine.notify_api(remote_path, f'Image got re-uploaded to fix a cache error:\n {remote_path}')
+
+            return remote_path
 
         @staticmethod
         def get_id_from_url(url: str) -> id:
             return int(url.split('/')[-1].split('.')[0])
 
-        def get_abandoned_images(self) -> list[str]:
+        def get_abandoned_images(self) -> tuple[list[str], int]:
+            """ Return the paths of all images that are not used by any token
+            and their total size in bytes.
+            """
+            # query all image urls that are used by tokens
+            prefix = self.get_image_url(0).removesuffix('0.png')
+            used = {url.removeprefix(prefix) for url in select(t.url for t in db.Token if t.url.startswith(prefix))}
+
             # check all existing images
+            # @NOTE: the last image is kept to avoid next id to cause unexpected browser cache behavior
             game_root = engine.paths.get_game_path(self.gm_url, self.url)
+            keep = '{0}.png'.format(self.peek_next_id() - 1)
             with engine.locks[self.gm_url]:  # make IO access safe
-                all_images = self.get_all_images()
+                abandoned, num_bytes = engine.offload(find_abandoned_images, game_root, used, keep)
 
-            abandoned = list()
-            last_id = self.get_next_id() - 1
-            for image_id in all_images:
-                this_id = int(image_id.split('.')[0])
-                if this_id == last_id:
-                    # keep this image to avoid next id to cause
-                    # unexpected browser cache behavior
-                    continue
-                # create url (ignore png-extension due to os.listdir)
-                url = self.get_image_url(this_id)
-                # check for any tokens
-                token = db.Token.select(lambda t: t.url == url).first()
-                if token is None:
-                    # found abandoned image
-                    abandoned.append(os.path.join(game_root, image_id))
-
-            return abandoned
+            return abandoned, num_bytes
 
         def get_broken_tokens(self) -> list[db.Entity]:
             # query all images
@@ -250,14 +327,31 @@ def register(engine: any, db: Database):
             """ Cleanup game's unused image and token data. """
             num_bytes = 0
 
+            # write back the live game's token data before touching it
+            gm_cache = engine.cache.get_from_url(self.gm_url)
+            game_cache = gm_cache.get_loaded(self.url) if gm_cache is not None else None
+            if game_cache is not None:
+                game_cache.reload()
+
             # query and remove all images that are not used as tokens
-            relevant = self.get_abandoned_images()
+            relevant, num_bytes = self.get_abandoned_images()
+            image_ids = [self.get_id_from_url(filename) for filename in relevant]
+            # including their downscaled variants and scene thumbnails
+            variant_paths = [engine.paths.get_variant_path(self.gm_url, self.url, image_id, size)
+                             for image_id in image_ids for size in engine.image_variants]
+            thumbnails_path = engine.paths.get_thumbnails_path(self.gm_url, self.url)
+            thumbnail_suffixes = tuple(f'_{image_id}.png' for image_id in image_ids)
+
+            def remove_images() -> int:
+                thumbnail_paths = find_files(thumbnails_path, lambda name: name.endswith(thumbnail_suffixes))
+                remove_files(relevant)
+                return remove_files(variant_paths + thumbnail_paths)
+
             with engine.locks[self.gm_url]:  # make IO access safe
-                for filename in relevant:
-                    num_bytes += os.path.getsize(filename)
-                    os.remove(filename)
+                num_bytes += engine.offload(remove_images)
+                for image_id in image_ids:
                     # remove image's md5 hash from cache
-                    self.remove_md5(self.get_id_from_url(filename))
+                    self.remove_md5(image_id)
 
             # delete all outdated rolls
             rolls = db.Roll.select(lambda r: r.game == self and r.timeid < now - engine.latest_rolls)
@@ -270,6 +364,16 @@ def register(engine: any, db: Database):
             for t in relevant:
                 t.delete()
 
+            # remove previews of deleted scenes
+            previews_path = engine.paths.get_previews_path(self.gm_url, self.url)
+            scene_ids = {s.id for s in self.scenes}
+
+            def remove_previews() -> int:
+                return remove_files(find_files(previews_path, lambda name: int(name.split('_')[0]) not in scene_ids))
+
+            with engine.locks[self.gm_url]:  # make IO access safe
+                num_bytes += engine.offload(remove_previews)
+
             num_md5s = self.make_md5s()
 
             return num_bytes, num_rolls, num_tokens, num_md5s
@@ -284,11 +388,15 @@ def register(engine: any, db: Database):
             num_bytes = os.path.getsize(game_path)
 
             with engine.locks[self.gm_url]:  # make IO access safe
-                shutil.rmtree(game_path)
+                engine.offload(shutil.rmtree, game_path)
+                engine.checksum_indices.pop(self.get_url(), None)
+                engine.checksums.pop(self.get_url(), None)
+                engine.next_ids.pop(self.get_url(), None)
 
             # remove game from GM's cache
             gm_cache = engine.cache.get_from_url(self.gm_url)
-            gm_cache.remove(self)
+            if gm_cache.get_loaded(self.url) is not None:
+                gm_cache.remove(self)
 
             # remove all scenes
             for s in self.scenes:
@@ -352,19 +460,9 @@ def register(engine: any, db: Database):
             # build zip file
             zip_path = engine.paths.get_export_path()
             zip_file = '{0}_{1}.zip'.format(self.gm_url, self.url)
-
-            with zipfile.ZipFile(zip_path / zip_file, "w") as h:
-                # create temporary file and add it to the zip
-                with tempfile.NamedTemporaryFile() as tmp:
-                    s = json.dumps(data, indent=4)
-                    tmp.write(s.encode('utf-8'))
-                    tmp.seek(0)  # rewind!
-                    h.write(tmp.name, 'game.json')
-
-                # add images to the zip, too
-                p = engine.paths.get_game_path(self.gm_url, self.url)
-                for img in self.get_all_images():
-                    h.write(p / img, img)
+            root = engine.paths.get_game_path(self.gm_url, self.url)
+            with engine.locks[self.gm_url]:  # make IO access safe
+                engine.offload(write_zip, zip_path / zip_file, data, root)
 
             return zip_file, zip_path
 
@@ -482,6 +580,8 @@ def register(engine: any, db: Database):
                         src_path = os.path.join(tmp_dir, filename)
                         dst_path = img_path / filename
                         shutil.copyfile(src_path, dst_path)
+                with engine.locks[gm.url]:  # make IO access safe
+                    game.seed_next_id()
 
                 # create scenes
                 try:
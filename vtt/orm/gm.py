@@ -119,7 +119,7 @@ def register(engine: any, db: Database):
             num_bytes = os.path.getsize(root_path)
 
             with engine.locks[self.url]:  # make IO access safe
-                shutil.rmtree(root_path)
+                engine.offload(shutil.rmtree, root_path)
 
             # remove GM from engine's cache
             engine.cache.remove(self)
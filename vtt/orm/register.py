@@ -13,6 +13,53 @@ from pony.orm import *
 from . import token, scene, roll, game, gm
 
 
+SQLITE_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SQLITE_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def get_sqlite_pragmas(profile: dict) -> list[str]:
+    """ Return the PRAGMA statements for the given SQLite profile. Settings
+    that are not part of the profile keep SQLite's defaults.
+    """
+    pragmas = list()
+    if 'journal_mode' in profile:
+        journal_mode = profile['journal_mode'].upper()
+        if journal_mode not in SQLITE_JOURNAL_MODES:
+            raise ValueError(f'Invalid SQLite journal mode: {journal_mode}')
+        pragmas.append(f'PRAGMA journal_mode = {journal_mode}')
+    if 'synchronous' in profile:
+        synchronous = profile['synchronous'].upper()
+        if synchronous not in SQLITE_SYNCHRONOUS:
+            raise ValueError(f'Invalid SQLite synchronous level: {synchronous}')
+        pragmas.append(f'PRAGMA synchronous = {synchronous}')
+    for key in ('mmap_size', 'cache_size', 'busy_timeout'):
+        if key in profile:
+            pragmas.append(f'PRAGMA {key} = {int(profile[key])}')
+    return pragmas
+
+
+def apply_sqlite_profile(db: Database, engine: any) -> None:
+    """ Apply the engine's SQLite profile to every connection of the database. """
+    if engine is None:
+        return
+    pragmas = get_sqlite_pragmas(engine.sqlite)
+
+    @db.on_connect(provider='sqlite')
+    def set_pragmas(_, connection):
+        cursor = connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+
+
+def create_indexes(db: Database, statements: list[str]) -> None:
+    """ Create indexes that cannot be declared via Pony. Missing indexes are
+    also added to existing databases.
+    """
+    with db_session:
+        for statement in statements:
+            db.execute(statement)
+
+
 def create_gm_database(engine: any, filename: str) -> Database:
     """ Creates a new database for with GM entities such as Tokens, Scenes etc."""
     db = Database()
@@ -22,8 +69,10 @@ def create_gm_database(engine: any, filename: str) -> Database:
     roll.register(engine, db)
     game.register(engine, db)
 
+    apply_sqlite_profile(db, engine)
     db.bind('sqlite', filename, create_db=True)
     db.generate_mapping(create_tables=True)
+    create_indexes(db, token.INDEXES + roll.INDEXES)
     return db
 
 
@@ -33,6 +82,7 @@ def create_main_database(engine: any) -> Database:
 
     gm.register(engine, db)
 
+    apply_sqlite_profile(db, engine)
     main_db_path = engine.paths.get_main_database_path()
     db.bind('sqlite', str(main_db_path), create_db=True)
     db.generate_mapping(create_tables=True)
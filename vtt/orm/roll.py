@@ -11,6 +11,11 @@ __licence__ = 'MIT'
 from pony.orm import *
 
 
+# @NOTE: Pony does not support float attributes inside of composite indexes
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS "idx_roll__game_timeid" ON "Roll" ("game", "timeid")'  # used for latest rolls and cleanup
+]
+
 def register(_: any, db: Database):
 
     class Roll(db.Entity):
@@ -15,12 +15,72 @@ from pony.orm import *
 from .constants import *
 
 
+# @NOTE: Pony does not support float attributes inside of composite indexes
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS "idx_token__scene_timeid" ON "Token" ("scene", "timeid")'  # used for token updates
+]
+
+
+def update_token(token: any, timeid: float, pos: tuple[int, int] | None = None, zorder: int | None = None,
+                 size: int | None = None, rotate: float | None = None, flipx: bool | None = None,
+                 locked: bool | None = None, text: str | None = None) -> bool:
+    """Handle update of several data fields of a token-like object (either a
+    Token entity or its in-memory copy). The time-id is set if anything has
+    actually changed.
+    """
+    updated = False
+
+    if token.locked and locked is None:
+        # token is locked and not unlocked
+        return updated
+
+    if locked is not None and token.locked != locked:
+        token.timeid = timeid
+        token.locked = locked
+        updated = True
+
+    if pos is not None:
+        # force position onto scene (canvas)
+        token.posx = min(MAX_SCENE_WIDTH, max(0, pos[0]))
+        token.posy = min(MAX_SCENE_HEIGHT, max(0, pos[1]))
+        token.timeid = timeid
+        updated = True
+
+    if zorder is not None:
+        token.zorder = zorder
+        token.timeid = timeid
+        updated = True
+
+    if size is not None:
+        token.size = min(MAX_TOKEN_SIZE, max(MIN_TOKEN_SIZE, size))
+        token.timeid = timeid
+        updated = True
+
+    if rotate is not None:
+        token.rotate = rotate
+        token.timeid = timeid
+        updated = True
+
+    if flipx is not None:
+        token.flipx = flipx
+        token.timeid = timeid
+        updated = True
+
+    if text is not None:
+        token.text = text[0][:MAX_TOKEN_LABEL_SIZE]
+        token.color = text[1]
+        token.timeid = timeid
+        updated = True
+
+    return updated
+
+
 def register(_: any, db: Database):
 
     class Token(db.Entity):
         id = PrimaryKey(int, auto=True)
         scene = Required("Scene")
-        url = Required(str)
+        url = Required(str, index=True)  # used to find abandoned images
         posx = Required(int)
         posy = Required(int)
         zorder = Required(int, default=0)
@@ -33,57 +93,16 @@ def register(_: any, db: Database):
         text = Optional(str)  # text
         color = Optional(str)  # used for label
 
+        composite_index(scene, posx, posy)  # used for range selection
+
         def update(self, timeid: float, pos: tuple[int, int] | None = None, zorder: int | None = None,
                    size: int | None = None, rotate: float | None = None, flipx: bool | None = None,
                    locked: bool | None = None, text: str | None = None):
             """Handle update of several data fields. The time-id is set if anything
             has actually changed.
             """
-            updated = False
-
-            if self.locked and locked is None:
-                # token is locked and not unlocked
-                return updated
-
-            if locked is not None and self.locked != locked:
-                self.timeid = timeid
-                self.locked = locked
-                updated = True
-
-            if pos is not None:
-                # force position onto scene (canvas)
-                self.posx = min(MAX_SCENE_WIDTH, max(0, pos[0]))
-                self.posy = min(MAX_SCENE_HEIGHT, max(0, pos[1]))
-                self.timeid = timeid
-                updated = True
-
-            if zorder is not None:
-                self.zorder = zorder
-                self.timeid = timeid
-                updated = True
-
-            if size is not None:
-                self.size = min(MAX_TOKEN_SIZE, max(MIN_TOKEN_SIZE, size))
-                self.timeid = timeid
-                updated = True
-
-            if rotate is not None:
-                self.rotate = rotate
-                self.timeid = timeid
-                updated = True
-
-            if flipx is not None:
-                self.flipx = flipx
-                self.timeid = timeid
-                updated = True
-
-            if text is not None:
-                self.text = text[0][:MAX_TOKEN_LABEL_SIZE]
-                self.color = text[1]
-                self.timeid = timeid
-                updated = True
-
-            return updated
+            return update_token(self, timeid=timeid, pos=pos, zorder=zorder, size=size, rotate=rotate, flipx=flipx,
+                                locked=locked, text=text)
 
         @staticmethod
         def get_pos_by_degree(origin: tuple[int, int], k: int, n: int) -> tuple[int, int]:
@@ -103,8 +103,8 @@ def register(engine: any):
                                    f'by {client_ip} but game was not found')
             abort(404)
 
-        # fetch game cache and close sockets
-        game_cache = gm_cache.get(game)
+        # fetch game cache and close sockets (an unloaded game has no players)
+        game_cache = gm_cache.get_loaded(game.url)
         if game_cache is None:
             engine.logging.warning(f'GM name="{gm.name}" url="{gm.url}" tried to kick player #{uuid} at {game_url} '
                                    f'by {client_ip} but the game was not inside the cache')
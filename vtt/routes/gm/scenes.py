@@ -95,7 +95,7 @@ def register(engine: any):
             abort(403)  # Forbidden
 
         # upload image
-        img_url = game.upload(handle)
+        img_url = game.upload(handle, max_file_size * 1024 * 1024)
         return img_url
 
     @post('/vtt/query-scenes/<game_url>')
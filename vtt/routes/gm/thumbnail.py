@@ -8,11 +8,64 @@ License: MIT (see LICENSE for details)
 __author__ = 'Christian Glöckner'
 __licence__ = 'MIT'
 
+import os
+import pathlib
+
 from bottle import *
 
+from PIL import Image
+
+from vtt.utils.common import etag_matches
+from vtt.utils.ingest import make_variant
+from vtt.utils.preview import get_preview_key, render_preview
+
+
+def remove_outdated(current_path: pathlib.Path, scene_id: int) -> None:
+    """ Remove the scene's previously rendered files next to the current one. """
+    if not current_path.parent.exists():
+        return
+    for path in current_path.parent.glob(f'{scene_id}_*.png'):
+        if path != current_path:
+            os.remove(path)
+
 
 def register(engine: any):
 
+    def serve_cached(path: pathlib.Path, etag: str) -> HTTPResponse:
+        """ Serve a rendered file with caching headers. The file's url stays the same
+        while its content changes, so the browser needs to revalidate it.
+        """
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'public, max-age={0}'.format(engine.thumbnails['max_age'])
+        }
+        if etag_matches(request.get_header('If-None-Match'), etag):
+            return HTTPResponse(status=304, **headers)
+
+        res = static_file(path.name, path.parent)
+        for key, value in headers.items():
+            res.set_header(key, value)
+        return res
+
+    def load_token_image(gm_url: str, game_url: str, url: str, edge: int) -> Image.Image | None:
+        """ Open the token's image (or its smallest variant that covers the given edge). """
+        filename = url.split('/')[-1]
+        if url.startswith('/static/'):
+            path = engine.paths.get_static_path() / filename
+            if not path.exists():
+                path = engine.paths.get_static_path(default=True) / filename
+            return Image.open(path) if path.exists() else None
+
+        path = engine.paths.get_game_path(gm_url, game_url) / filename
+        if url != f'/asset/{gm_url}/{game_url}/{filename}' or not filename.endswith('.png') or not path.exists():
+            return None
+        sizes = [size for size in engine.image_variants if size >= edge]
+        if len(sizes) > 0:
+            image_id = int(filename.split('.')[0])
+            variant_path = engine.paths.get_variant_path(gm_url, game_url, image_id, min(sizes))
+            path = make_variant(path, variant_path, min(sizes), engine.image_limit['format'])
+        return Image.open(path)
+
     @get('/vtt/thumbnail/<gm_url>/<game_url>/<scene_id:int>')
     def get_scene_thumbnail(gm_url: str, game_url: str, scene_id: int):
         # load GM from cache
@@ -27,13 +80,61 @@ def register(engine: any):
             # @NOTE: not logged because somebody may play around with this
             abort(404)
 
-        engine.paths.get_game_path(gm_url, game_url)
-        if scene.backing is not None:
-            game_url = scene.backing.url
-        else:
-            game_url = '/static/empty.jpg'
+        if scene.backing is None:
+            redirect('/static/empty.jpg')
+
+        # serve cached thumbnail of the background image
+        src_path = engine.paths.get_game_path(gm_url, game_url) / scene.backing.url.split('/')[-1]
+        if not scene.backing.url.startswith('/asset/') or not src_path.exists():
+            redirect(scene.backing.url)
+        image_id = scene.game.get_id_from_url(scene.backing.url)
+        thumbnail_path = engine.paths.get_thumbnail_path(gm_url, game_url, scene_id, scene.backing.id, image_id)
+        with engine.locks[gm_url]:  # make IO access safe
+            remove_outdated(thumbnail_path, scene_id)
+            path = make_variant(src_path, thumbnail_path, engine.thumbnails['size'], engine.image_limit['format'])
+
+        etag = '"{0}-{1}-{2}-{3}"'.format(scene.backing.id, image_id, engine.thumbnails['size'],
+                                          os.stat(path).st_mtime_ns)
+        return serve_cached(path, etag)
+
+    @get('/vtt/preview/<gm_url>/<game_url>/<scene_id:int>')
+    def get_scene_preview(gm_url: str, game_url: str, scene_id: int):
+        # load GM from cache
+        gm_cache = engine.cache.get_from_url(gm_url)
+        if gm_cache is None:
+            # @NOTE: not logged because somebody may play around with this
+            abort(404)
+
+        # load scene from GM's database
+        scene = gm_cache.db.Scene.select(lambda scn: scn.id == scene_id and scn.game.url == game_url).first()
+        if scene is None:
+            # @NOTE: not logged because somebody may play around with this
+            abort(404)
+
+        # prefer the in-memory tokens of a running game's active scene
+        tokens = None
+        game_cache = gm_cache.get_loaded(game_url)
+        if game_cache is not None:
+            with game_cache.lock:
+                if game_cache.scene is not None and game_cache.scene.id == scene_id:
+                    tokens = game_cache.scene.to_list()
+        if tokens is None:
+            tokens = [t.to_dict() for t in scene.tokens]
+
+        # render preview unless cached
+        key = get_preview_key(tokens)
+        path = engine.paths.get_preview_path(gm_url, game_url, scene_id, key)
+        with engine.locks[gm_url]:  # make IO access safe
+            remove_outdated(path, scene_id)
+            if not path.exists():
+                img = render_preview(tokens, engine.thumbnails['preview'],
+                                     lambda url, edge: load_token_image(gm_url, game_url, url, edge))
+                path.parent.mkdir(exist_ok=True)
+                tmp_path = path.with_suffix('.tmp')
+                img.save(tmp_path, 'PNG')
+                os.replace(tmp_path, path)
 
-        redirect(game_url)
+        return serve_cached(path, '"{0}-{1}"'.format(key, engine.thumbnails['preview']))
 
     @get('/vtt/thumbnail/<gm_url>/<game_url>')
     def get_game_thumbnail(gm_url: str, game_url: str):
@@ -125,6 +125,10 @@ def register(engine: any):
             'time left': str(until)
         }
 
+    @get('/vtt/api/warmup')
+    def api_warmup():
+        return engine.cache.warmup.get_status()
+
     @get('/vtt/api/build')
     def api_build():
         return {
@@ -91,6 +91,7 @@ def register(engine):
             # cannot read uploaded files
             abort(404)
 
+        max_sizes = list()
         for i, handle in enumerate(file_list):
             content = handle.content_type.split('/')[0]
 
@@ -106,6 +107,7 @@ def register(engine):
                     engine.logging.warning(f'Player {client_ip} tried to upload an image to a game by {game_url} '
                                            f'but tried to cheat on the file size')
                     abort(403)  # Forbidden
+                max_sizes.append(max_file_size * 1024 * 1024)
 
             # check audio size
             elif content == 'audio':
@@ -117,6 +119,7 @@ def register(engine):
                     engine.logging.warning(f'Player {client_ip} tried to upload music to a game by {game_url} '
                                            f'but tried to cheat on the file size')
                     abort(403)  # Forbidden
+                max_sizes.append(max_file_size * 1024 * 1024)
 
             # unsupported filetype
             else:
@@ -125,12 +128,12 @@ def register(engine):
                 abort(403)  # Forbidden
 
         # upload files
-        for handle in file_list:
+        for i, (handle, max_size) in enumerate(zip(file_list, max_sizes)):
             content = handle.content_type.split('/')[0]
 
             # check image size
             if content == 'image':
-                img_url = game.upload(handle)
+                img_url = game.upload(handle, max_size, background=i == 0 and not background_set)
                 if img_url is not None:
                     answer['urls'].append(img_url)
                     engine.logging.access(f'Image upload {game_url} by {client_ip}')
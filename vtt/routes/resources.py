@@ -10,6 +10,9 @@ __licence__ = 'MIT'
 
 from bottle import *
 
+from vtt.utils.common import etag_matches
+from vtt.utils.ingest import make_variant
+
 
 def register(engine: any):
 
@@ -61,4 +64,48 @@ def register(engine: any):
 
         # try to load asset file from disk
         root = engine.paths.get_game_path(gm_url, game_url)
-        return static_file(filename, root)
+        if not filename.endswith('.png'):
+            return static_file(filename, root)
+        try:
+            image_id = game.get_id_from_url(filename)
+        except ValueError:
+            abort(404)
+        path = root / filename
+        if not path.exists():
+            abort(404)
+
+        etag = None
+        md5 = game.get_checksums().get_md5(image_id)
+        if md5 is not None:
+            etag = f'"{md5}"'
+
+        size = request.query.get('size')
+        if size is not None:
+            # serve downscaled variant of the image
+            try:
+                size = int(size)
+            except ValueError:
+                abort(404)
+            if size not in engine.image_variants:
+                abort(404)
+            variant_path = engine.paths.get_variant_path(gm_url, game_url, image_id, size)
+            path = make_variant(path, variant_path, size, engine.image_limit['format'])
+            if etag is not None:
+                etag = f'"{md5}-{size}"'
+
+        if etag is None:
+            # @NOTE: checksum not known (yet), so browsers need to revalidate via modification time
+            return static_file(path.name, path.parent)
+
+        # image ids are never reused for other images, so the content never changes
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'public, max-age={0}, immutable'.format(engine.asset_cache['max_age'])
+        }
+        if etag_matches(request.get_header('If-None-Match'), etag):
+            return HTTPResponse(status=304, **headers)
+
+        res = static_file(path.name, path.parent)
+        for key, value in headers.items():
+            res.set_header(key, value)
+        return res
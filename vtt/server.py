@@ -8,15 +8,171 @@ License: MIT (see LICENSE for details)
 __author__ = 'Christian Glöckner'
 __licence__ = 'MIT'
 
+import functools
+import json
 import pathlib
+import zlib
 
 import bottle
+import msgpack
 
 from gevent.pywsgi import WSGIServer
 from gevent import socket
+from geventwebsocket.exceptions import ProtocolError, WebSocketError
 from geventwebsocket.handler import WebSocketHandler
+from geventwebsocket.websocket import WebSocket, Header, MSG_SOCKET_DEAD
 
 
+# --- permessage-deflate (RFC 7692) -----------------------------------
+
+DEFLATE_EXTENSION = 'permessage-deflate'
+DEFLATE_RESPONSE = 'permessage-deflate; server_no_context_takeover; client_no_context_takeover'
+DEFLATE_TAIL = b'\x00\x00\xff\xff'
+
+
+def compress_message(raw: str | bytes) -> bytes:
+    """ Deflate a message without context takeover, so the result can be
+    sent to any socket.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode('utf-8')
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(raw) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data[:-len(DEFLATE_TAIL)]
+
+
+def decompress_message(data: bytes) -> bytes:
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    return decompressor.decompress(bytes(data) + DEFLATE_TAIL)
+
+
+def accepts_deflate(environ: dict) -> bool:
+    """ Returns whether the client offered permessage-deflate. """
+    offers = environ.get('HTTP_SEC_WEBSOCKET_EXTENSIONS', '')
+    return DEFLATE_EXTENSION in [offer.split(';')[0].strip() for offer in offers.split(',')]
+
+
+class TextMessage(str):
+    """ JSON encoded message which is compressed at most once, no matter how
+    many sockets it is sent to.
+    """
+
+    @functools.cached_property
+    def deflated(self) -> bytes:
+        return compress_message(self)
+
+
+class BinaryMessage(bytes):
+    """ MessagePack encoded message which is compressed at most once, no
+    matter how many sockets it is sent to.
+    """
+
+    @functools.cached_property
+    def deflated(self) -> bytes:
+        return compress_message(self)
+
+
+class OutgoingMessage:
+    """ Message to be sent to one or more sockets. Each wire encoding is
+    created at most once and only if it is used.
+    """
+
+    def __init__(self, data: dict) -> None:
+        self.data = data
+
+    @functools.cached_property
+    def text(self) -> TextMessage:
+        return TextMessage(json.dumps(self.data))
+
+    @functools.cached_property
+    def binary(self) -> BinaryMessage:
+        return BinaryMessage(msgpack.packb(self.data))
+
+
+def decode_message(raw: str | bytes) -> dict:
+    """ Decode a message that was either sent as JSON or MessagePack. """
+    if isinstance(raw, (bytes, bytearray)):
+        return msgpack.unpackb(raw)
+    return json.loads(raw)
+
+
+class DeflateWebSocket(WebSocket):
+    """ WebSocket with negotiated permessage-deflate. Text messages beyond
+    the threshold are sent compressed, compressed messages by the client are
+    inflated while reading.
+    """
+
+    def __init__(self, environ, stream, handler, threshold: int) -> None:
+        super().__init__(environ, stream, handler)
+        self.threshold = threshold
+        self.inflater = None  # decompressor of the current message
+
+    def read_frame(self):
+        header = Header.decode_header(self.stream)
+
+        # RSV1 marks the first frame of a compressed message
+        compressed = header.flags == Header.RSV0_MASK
+        if compressed and header.opcode not in (self.OPCODE_TEXT, self.OPCODE_BINARY):
+            raise ProtocolError
+        if header.flags and not compressed:
+            raise ProtocolError
+
+        payload = b''
+        if header.length:
+            payload = self.raw_read(header.length)
+            if len(payload) != header.length:
+                raise WebSocketError('Unexpected EOF reading frame payload')
+            if header.mask:
+                payload = header.unmask_payload(payload)
+
+        if compressed:
+            self.inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        if self.inflater is not None and header.opcode in (self.OPCODE_TEXT, self.OPCODE_BINARY,
+                                                           self.OPCODE_CONTINUATION):
+            payload = self.inflater.decompress(bytes(payload))
+            if header.fin:
+                payload += self.inflater.decompress(DEFLATE_TAIL)
+                self.inflater = None
+
+        return header, payload
+
+    def send(self, message, binary=None):
+        if not isinstance(message, (str, bytes)) or len(message) < self.threshold:
+            super().send(message, binary)
+            return
+
+        if isinstance(message, (TextMessage, BinaryMessage)):
+            data = message.deflated
+        else:
+            data = compress_message(message)
+        opcode = self.OPCODE_TEXT if isinstance(message, str) else self.OPCODE_BINARY
+        header = Header.encode_header(True, opcode, b'', len(data), Header.RSV0_MASK)
+        if self.closed:
+            raise WebSocketError(MSG_SOCKET_DEAD)
+        try:
+            self.raw_write(header + data)
+        except socket.error:
+            self.current_app.on_close(MSG_SOCKET_DEAD)
+            raise WebSocketError(MSG_SOCKET_DEAD)
+
+
+class VttWebSocketHandler(WebSocketHandler):
+    """ WebSocketHandler which negotiates permessage-deflate if enabled. """
+
+    def start_response(self, status, headers, exc_info=None):
+        threshold = getattr(self.server, 'compress_threshold', 0)
+        if status.startswith('101') and threshold > 0 and accepts_deflate(self.environ):
+            headers.append(('Sec-WebSocket-Extensions', DEFLATE_RESPONSE))
+            # @NOTE: the replaced socket is marked as closed, so it does not
+            # send a close frame once it is garbage collected
+            self.websocket.closed = True
+            self.websocket = DeflateWebSocket(self.environ, self.websocket.stream, self, threshold)
+            self.environ['wsgi.websocket'] = self.websocket
+        return super().start_response(status, headers, exc_info)
+
+
+# --- server ----------------------------------------------------------
+
 def get_unix_socket_listener(socket_path: pathlib.Path) -> socket.socket:
     if socket_path.exists():
         socket_path.unlink()
@@ -39,9 +195,13 @@ class VttServer(bottle.ServerAdapter):
             self.listener = get_unix_socket_listener(socket_path)
             print('Listening on unixsocket: {0}'.format(socket_path))
 
+        # minimum message size for compression (0 = disabled)
+        self.compress_threshold = options.pop('compress_threshold', 0)
+
         # create ServerAdapter
         super().__init__(host, port, **options)
     
     def run(self, handler):
-        server = WSGIServer(self.listener, handler, handler_class=WebSocketHandler, **self.options)
+        server = WSGIServer(self.listener, handler, handler_class=VttWebSocketHandler, **self.options)
+        server.compress_threshold = self.compress_threshold
         server.serve_forever()
@@ -1,9 +1,14 @@
 from .build_number import *
+from .checksum_index import *
+from .checksum_map import *
 from .common import *
 from .constant_export import *
 from .error import *
 from .fancy_url import *
+from .geoip import *
+from .ingest import *
 from .logging_api import *
 from .path_api import *
+from .preview import *
 from .notifier import *
 from .auth import *
@@ -0,0 +1,142 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+import json
+import os
+import pathlib
+import typing
+
+
+class ChecksumIndex:
+    """ Persistent index of the MD5 checksums of a game's images. Each line
+    of the index file holds an image id with its checksum, file size and
+    mtime (or a dash if the image was removed). Changes are appended, the
+    file is only rewritten once it holds too many outdated lines.
+
+    Note: needs to be used from a threadsafe context.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.entries = dict()  # image id => (md5, size, mtime)
+        self.num_lines = 0  # number of lines inside the file, -1 to force a rewrite
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def load(self) -> None:
+        self.entries.clear()
+        self.num_lines = 0
+        if not self.path.exists():
+            return
+
+        with open(self.path, 'r') as handle:
+            content = handle.read()
+
+        if content.startswith('{'):
+            # legacy format (md5 => image id) without size and mtime
+            for md5, image_id in json.loads(content).items():
+                self.entries[int(image_id)] = (md5, None, None)
+            self.num_lines = -1
+            return
+
+        for line in content.splitlines():
+            self.num_lines += 1
+            args = line.split()
+            if len(args) == 2 and args[1] == '-':
+                self.entries.pop(int(args[0]), None)
+            elif len(args) == 4:
+                self.entries[int(args[0])] = (args[1], int(args[2]), int(args[3]))
+            # @NOTE: other lines are ignored (e.g. partially written)
+
+    def format_line(self, image_id: int) -> str:
+        entry = self.entries.get(image_id)
+        if entry is None:
+            return '{0} -'.format(image_id)
+        return '{0} {1} {2} {3}'.format(image_id, *entry)
+
+    def write(self, image_ids: list[int]) -> None:
+        """ Persist the current state of the given images. """
+        if len(image_ids) == 0 and self.num_lines >= 0 and self.path.exists():
+            return
+
+        if self.num_lines < 0 or self.num_lines + len(image_ids) > 2 * len(self.entries) + 64:
+            # rewrite file without outdated lines
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as handle:
+                for image_id in sorted(self.entries):
+                    handle.write(self.format_line(image_id) + '\n')
+            os.replace(tmp_path, self.path)
+            self.num_lines = len(self.entries)
+            return
+
+        with open(self.path, 'a') as handle:
+            for image_id in image_ids:
+                handle.write(self.format_line(image_id) + '\n')
+        self.num_lines += len(image_ids)
+
+    def verify(self, root: pathlib.Path, get_md5: typing.Callable[[typing.BinaryIO], str]) -> int:
+        """ Sync the index with the images inside the given directory. Only
+        new or modified images are hashed. Returns the number of hashed images.
+        """
+        found = dict()  # image id => (path, size, mtime)
+        with os.scandir(root) as it:
+            for entry in it:
+                if not entry.name.endswith('.png'):
+                    continue
+                try:
+                    image_id = int(entry.name.split('.')[0])
+                except ValueError:
+                    continue
+                stat = entry.stat()
+                found[image_id] = (entry.path, stat.st_size, stat.st_mtime_ns)
+
+        changed = list()
+        for image_id in list(self.entries):
+            if image_id not in found:
+                del self.entries[image_id]
+                changed.append(image_id)
+
+        num_hashed = 0
+        for image_id, (path, size, mtime) in found.items():
+            md5, known_size, known_mtime = self.entries.get(image_id, (None, None, None))
+            if md5 is not None and known_size == size and known_mtime == mtime:
+                continue
+
+            if md5 is None or known_size is not None:
+                # new or modified image
+                with open(path, 'rb') as handle:
+                    md5 = get_md5(handle)
+                num_hashed += 1
+            # else: checksum of the legacy format is trusted
+
+            self.entries[image_id] = (md5, size, mtime)
+            changed.append(image_id)
+
+        self.write(changed)
+        return num_hashed
+
+    def add(self, image_id: int, md5: str, path: pathlib.Path) -> None:
+        stat = os.stat(path)
+        self.entries[image_id] = (md5, stat.st_size, stat.st_mtime_ns)
+        self.write([image_id])
+
+    def remove(self, image_id: int) -> None:
+        if image_id in self.entries:
+            del self.entries[image_id]
+            self.write([image_id])
+
+    def get_checksums(self) -> dict[str, int]:
+        """ Return all checksums and their image ids (lowest id if duplicate). """
+        data = dict()
+        for image_id in sorted(self.entries, reverse=True):
+            data[self.entries[image_id][0]] = image_id
+        return data
@@ -0,0 +1,81 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+import typing
+
+
+class ChecksumMap:
+    """ Bidirectional map of a game's image checksums (md5 => image id and
+    image id => md5). Each checksum refers to a single image, so both
+    directions are kept as inverse of each other.
+
+    Note: needs to be used from a threadsafe context.
+    """
+
+    def __init__(self, data: dict[str, int] | None = None) -> None:
+        self.ids = dict()  # md5 => image id
+        self.md5s = dict()  # image id => md5
+        if data is not None:
+            self.reset(data)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, md5: str) -> bool:
+        return md5 in self.ids
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.ids)
+
+    def __getitem__(self, md5: str) -> int:
+        return self.ids[md5]
+
+    def __setitem__(self, md5: str, image_id: int) -> None:
+        self.add(md5, image_id)
+
+    def keys(self) -> typing.KeysView[str]:
+        return self.ids.keys()
+
+    def items(self) -> typing.ItemsView[str, int]:
+        return self.ids.items()
+
+    def get(self, md5: str, default: int | None = None) -> int | None:
+        return self.ids.get(md5, default)
+
+    def get_md5(self, image_id: int) -> str | None:
+        return self.md5s.get(image_id)
+
+    def add(self, md5: str, image_id: int) -> None:
+        """ Map the checksum to the image, replacing previous mappings of
+        both the checksum and the image.
+        """
+        self.remove_md5(md5)
+        self.remove_id(image_id)
+        self.ids[md5] = image_id
+        self.md5s[image_id] = md5
+
+    def remove_md5(self, md5: str) -> int | None:
+        """ Remove the checksum and return its image id (if any). """
+        image_id = self.ids.pop(md5, None)
+        if image_id is not None:
+            del self.md5s[image_id]
+        return image_id
+
+    def remove_id(self, image_id: int) -> str | None:
+        """ Remove the image and return its checksum (if any). """
+        md5 = self.md5s.pop(image_id, None)
+        if md5 is not None:
+            del self.ids[md5]
+        return md5
+
+    def reset(self, data: dict[str, int]) -> None:
+        """ Replace all mappings by the given checksums and image ids. """
+        self.ids = dict(data)
+        self.md5s = {image_id: md5 for md5, image_id in self.ids.items()}
@@ -23,3 +23,14 @@ def count_dict_set_len(dictionary: dict) -> None:
     """
     for key in dictionary:
         dictionary[key] = len(dictionary[key])
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """ Return whether the ETag is listed in the request's If-None-Match
+    header, so the client's cached copy is still valid.
+    """
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    # @NOTE: weak comparison, so tags modified by proxies (e.g. W/"..." due to compression) still match
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
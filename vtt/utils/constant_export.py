@@ -28,6 +28,7 @@ class ConstantExport(dict):
         self['MAX_GAME_FILESIZE'] = engine.file_limit['game']
         self['MAX_MUSIC_FILESIZE'] = engine.file_limit['music']
         self['MAX_MUSIC_SLOTS'] = engine.file_limit['num_music']
+        self['IMAGE_VARIANTS'] = engine.image_variants
 
         self['SUGGESTED_PLAYER_COLORS'] = engine.playercolors
 
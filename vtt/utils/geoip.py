@@ -0,0 +1,128 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+import bisect
+import csv
+import ipaddress
+import json
+import pathlib
+import typing
+
+import cachetools
+import requests
+from gevent import lock
+
+
+class CountryResolver(typing.Protocol):
+    def resolve(self, ip: str) -> str: ...
+
+
+def parse_country_code(code: str) -> str:
+    """ Return lowercase ISO country code or '?' if unknown. """
+    code = code.strip().lower()
+    if len(code) != 2 or not code.isalpha():
+        return '?'
+    return code
+
+
+class IpApiResolver:
+    """ Queries the country via ip-api.com. """
+
+    def __init__(self, on_error: typing.Callable[[str], None], timeout: int = 3) -> None:
+        self.on_error = on_error
+        self.timeout = timeout
+
+    def resolve(self, ip: str) -> str:
+        result = '?'  # fallback case
+        try:
+            html = requests.get('http://ip-api.com/json/{0}'.format(ip), timeout=self.timeout)
+            d = json.loads(html.text)
+            if 'countryCode' in d:
+                result = d['countryCode'].lower()
+        except (requests.exceptions.RequestException, ValueError):
+            self.on_error('Cannot query location of IP {0}'.format(ip))
+        return result
+
+
+class RangeResolver:
+    """ Looks up the country in an offline database. The database is a CSV
+    file with one IP range per row: `first,last,country code`. Addresses may
+    be given in dotted notation or as integers.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.starts = {4: list(), 6: list()}  # ip version => sorted first addresses
+        self.ranges = {4: list(), 6: list()}  # ip version => (last address, country)
+
+        rows = {4: list(), 6: list()}
+        with open(path, 'r', newline='') as handle:
+            for row in csv.reader(handle):
+                if len(row) < 3:
+                    continue
+                try:
+                    first = self.parse_ip(row[0])
+                    last = self.parse_ip(row[1])
+                except ValueError:
+                    # e.g. header line
+                    continue
+                rows[first.version].append((int(first), int(last), parse_country_code(row[2])))
+
+        for version in rows:
+            rows[version].sort()
+            self.starts[version] = [first for first, _, _ in rows[version]]
+            self.ranges[version] = [(last, code) for _, last, code in rows[version]]
+
+    def __len__(self) -> int:
+        return len(self.starts[4]) + len(self.starts[6])
+
+    @staticmethod
+    def parse_ip(value: str) -> ipaddress.IPv4Address | ipaddress.IPv6Address:
+        value = value.strip()
+        if value.isdigit():
+            return ipaddress.ip_address(int(value))
+        return ipaddress.ip_address(value)
+
+    def resolve(self, ip: str) -> str:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return '?'
+
+        starts = self.starts[address.version]
+        index = bisect.bisect_right(starts, int(address)) - 1
+        if index < 0:
+            return '?'
+        last, code = self.ranges[address.version][index]
+        if int(address) > last:
+            return '?'
+        return code
+
+
+class CachedResolver:
+    """ Remembers the most recently resolved IPs. Failed lookups are not
+    cached, so they are retried on the next login.
+    """
+
+    def __init__(self, resolver: CountryResolver, maxsize: int) -> None:
+        self.resolver = resolver
+        self.lock = lock.RLock()
+        self.cache = cachetools.LRUCache(maxsize=max(maxsize, 1))  # ip => country
+
+    def resolve(self, ip: str) -> str:
+        with self.lock:
+            country = self.cache.get(ip)
+        if country is not None:
+            return country
+
+        country = self.resolver.resolve(ip)
+        if country != '?':
+            with self.lock:
+                self.cache[ip] = country
+        return country
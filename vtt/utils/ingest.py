@@ -0,0 +1,144 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+import hashlib
+import io
+import os
+import pathlib
+import tempfile
+import typing
+
+from PIL import Image, UnidentifiedImageError
+
+
+CHUNK_SIZE = 64 * 1024
+IMAGE_QUALITY = 85  # used when re-encoding lossy formats
+
+IngestResult = tuple[pathlib.Path, str, int]  # temporary path, md5, size
+
+
+def sniff_image(head: bytes) -> str | None:
+    """ Return the image format based on the file's header (or None if it
+    is not an image). The image is not decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(head)) as img:
+            return img.format
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def ingest_image(src: typing.BinaryIO, root: pathlib.Path, max_size: int) -> IngestResult | None:
+    """ Stream an uploaded image into a temporary file inside the given
+    directory, while calculating its size and md5 checksum in the same pass.
+    Returns None (and removes the partial file) if the data is not an image
+    or exceeds the given size in bytes. The caller needs to rename or remove
+    the temporary file.
+    """
+    offset = src.tell()
+    try:
+        return _ingest(src, root, max_size)
+    finally:
+        # rewind after reading
+        src.seek(offset)
+
+
+def _ingest(src: typing.BinaryIO, root: pathlib.Path, max_size: int) -> IngestResult | None:
+    head = src.read(CHUNK_SIZE)
+    if sniff_image(head) is None:
+        return None
+
+    hash_md5 = hashlib.md5()
+    size = 0
+    handle = tempfile.NamedTemporaryFile('wb', dir=root, suffix='.tmp', delete=False)
+    tmp_path = pathlib.Path(handle.name)
+    try:
+        with handle:
+            chunk = head
+            while len(chunk) > 0:
+                size += len(chunk)
+                if size > max_size:
+                    # abort early
+                    os.remove(tmp_path)
+                    return None
+                hash_md5.update(chunk)
+                handle.write(chunk)
+                chunk = src.read(CHUNK_SIZE)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return tmp_path, hash_md5.hexdigest(), size
+
+
+def save_downscaled(img: Image.Image, max_edge: int, image_format: str, root: pathlib.Path) -> pathlib.Path:
+    """ Downscale the image to the given maximum edge and save it to a
+    temporary file inside the given directory, which is returned.
+    """
+    img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    if image_format.upper() == 'JPEG':
+        # JPEG does not support transparency
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+    elif img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA')
+
+    handle = tempfile.NamedTemporaryFile('wb', dir=root, suffix='.tmp', delete=False)
+    tmp_path = pathlib.Path(handle.name)
+    try:
+        with handle:
+            img.save(handle, image_format, quality=IMAGE_QUALITY)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def can_downscale(img: Image.Image, max_edge: int) -> bool:
+    # @NOTE: animated images are kept as they are
+    return max(img.size) > max_edge and not getattr(img, 'is_animated', False)
+
+
+def normalize_image(path: pathlib.Path, max_edge: int, image_format: str) -> bool:
+    """ Downscale the image to the given maximum edge length and re-encode
+    it in the given format. Images within the limit and animated images are
+    kept as they are. Returns whether the image was replaced.
+    """
+    if max_edge <= 0:
+        return False
+
+    with Image.open(path) as img:
+        if not can_downscale(img, max_edge):
+            return False
+        tmp_path = save_downscaled(img, max_edge, image_format, path.parent)
+
+    os.replace(tmp_path, path)
+    return True
+
+
+def make_variant(src: pathlib.Path, dst: pathlib.Path, size: int, image_format: str) -> pathlib.Path:
+    """ Return the path of the image downscaled to the given maximum edge.
+    The variant is created if it does not exist or is older than the image.
+    Images within the limit and animated images are used as they are.
+    """
+    try:
+        if dst.stat().st_mtime_ns >= src.stat().st_mtime_ns:
+            return dst
+    except FileNotFoundError:
+        pass
+
+    with Image.open(src) as img:
+        if not can_downscale(img, size):
+            return src
+        dst.parent.mkdir(exist_ok=True)
+        tmp_path = save_downscaled(img, size, image_format, dst.parent)
+
+    os.replace(tmp_path, dst)
+    return dst
@@ -67,6 +67,9 @@ class PathApi:
     def get_export_path(self) -> pathlib.Path:
         return self.pref_root / 'export'
 
+    def get_cleanup_path(self) -> pathlib.Path:
+        return self.pref_root / 'cleanup.json'
+
     def get_gms_path(self, gm: str | None = None) -> pathlib.Path:
         p = self.pref_root / 'gms'
         if gm is not None:
@@ -89,3 +92,24 @@ class PathApi:
 
     def get_md5_path(self, gm: str, game: str) -> pathlib.Path:
         return self.get_game_path(gm, game) / 'gm.md5'
+
+    def get_next_id_path(self, gm: str, game: str) -> pathlib.Path:
+        return self.get_game_path(gm, game) / 'gm.next'
+
+    def get_variants_path(self, gm: str, game: str) -> pathlib.Path:
+        return self.get_game_path(gm, game) / 'variants'
+
+    def get_variant_path(self, gm: str, game: str, image_id: int, size: int) -> pathlib.Path:
+        return self.get_variants_path(gm, game) / f'{image_id}_{size}.png'
+
+    def get_thumbnails_path(self, gm: str, game: str) -> pathlib.Path:
+        return self.get_game_path(gm, game) / 'thumbnails'
+
+    def get_thumbnail_path(self, gm: str, game: str, scene_id: int, token_id: int, image_id: int) -> pathlib.Path:
+        return self.get_thumbnails_path(gm, game) / f'{scene_id}_{token_id}_{image_id}.png'
+
+    def get_previews_path(self, gm: str, game: str) -> pathlib.Path:
+        return self.get_game_path(gm, game) / 'previews'
+
+    def get_preview_path(self, gm: str, game: str, scene_id: int, key: str) -> pathlib.Path:
+        return self.get_previews_path(gm, game) / f'{scene_id}_{key}.png'
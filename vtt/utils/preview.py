@@ -0,0 +1,90 @@
+"""
+https://github.com/cgloeckner/pyvtt/
+
+Copyright (c) 2020-2023 Christian Glöckner
+License: MIT (see LICENSE for details)
+"""
+
+__author__ = 'Christian Glöckner'
+__licence__ = 'MIT'
+
+import hashlib
+import typing
+
+from PIL import Image
+
+from vtt.orm.constants import MAX_SCENE_WIDTH, MAX_SCENE_HEIGHT
+
+
+PREVIEW_BACKGROUND = (0, 0, 0, 255)
+
+# opens a token's image with a maximum edge of at least the given size (or None if not available)
+ImageLoader = typing.Callable[[str, int], Image.Image | None]
+
+
+def get_preview_key(tokens: list[dict]) -> str:
+    """ Return a key that changes whenever a token is added, removed or
+    modified (based on the token's timeid).
+    """
+    hash_md5 = hashlib.md5()
+    for token in sorted(tokens, key=lambda t: t['id']):
+        hash_md5.update('{0}:{1};'.format(token['id'], token['timeid']).encode())
+    return hash_md5.hexdigest()[:16]
+
+
+def get_token_size(img: Image.Image, token: dict, width: int, height: int) -> tuple[int, int]:
+    """ Return the token's size on the preview, similar to the client's
+    rendering. Backgrounds are fit into the scene.
+    """
+    ratio = img.height / img.width
+    scale = width / MAX_SCENE_WIDTH
+    if token['size'] > -1:
+        if img.height > img.width:
+            h = token['size'] * scale
+            w = h / ratio
+        else:
+            w = token['size'] * scale
+            h = w * ratio
+    elif ratio > height / width:
+        h = height
+        w = h / ratio
+    else:
+        w = width
+        h = w * ratio
+    return max(int(w), 1), max(int(h), 1)
+
+
+def draw_token(canvas: Image.Image, img: Image.Image, token: dict) -> None:
+    size = get_token_size(img, token, canvas.width, canvas.height)
+    img = img.convert('RGBA').resize(size, Image.LANCZOS)
+    if token['size'] > -1:
+        if token['flipx']:
+            img = img.transpose(Image.FLIP_LEFT_RIGHT)
+        if token['rotate'] != 0.0:
+            # @NOTE: the client rotates clockwise
+            img = img.rotate(-token['rotate'], resample=Image.BICUBIC, expand=True)
+
+    scale = canvas.width / MAX_SCENE_WIDTH
+    x = int(token['posx'] * scale - img.width / 2)
+    y = int(token['posy'] * scale - img.height / 2)
+    canvas.paste(img, (x, y), img)
+
+
+def render_preview(tokens: list[dict], width: int, load_image: ImageLoader) -> Image.Image:
+    """ Composite the scene's background and tokens into a preview of the
+    given width. Backgrounds are drawn first, all other tokens by their
+    z-order. Tokens without available image are skipped.
+    """
+    height = max(int(width * MAX_SCENE_HEIGHT / MAX_SCENE_WIDTH), 1)
+    scale = width / MAX_SCENE_WIDTH
+    canvas = Image.new('RGBA', (width, height), PREVIEW_BACKGROUND)
+
+    for token in sorted(tokens, key=lambda t: (t['size'] > -1, t['zorder'])):
+        edge = max(width, height) if token['size'] == -1 else int(token['size'] * scale) + 1
+        img = load_image(token['url'], edge)
+        if img is None:
+            continue
+        with img:
+            draw_token(canvas, img, token)
+
+    return canvas